@@ -12,6 +12,13 @@ contract PatientRecords {
     // Mapping of patientId -> list of blockchain records
     mapping(uint256 => Record[]) public records;
 
+    // Merkle root of a batch of record hashes -> block timestamp it was anchored at
+    mapping(bytes32 => uint256) public rootTimestamps;
+
+    event RecordAdded(uint256 indexed patientId, string hashValue, uint256 timestamp);
+
+    event MerkleRootAdded(bytes32 indexed root, uint256 leafCount, uint256 timestamp);
+
     // Add a new record for a patient
     function addRecord(uint256 patientId, string memory hashValue) public {
         records[patientId].push(
@@ -21,10 +28,47 @@ contract PatientRecords {
                 timestamp: block.timestamp
             })
         );
+        emit RecordAdded(patientId, hashValue, block.timestamp);
     }
 
-    // Get all records for a specific patient
+    // Anchor many record hashes at once through the root of their Merkle tree
+    function addMerkleRoot(bytes32 root, uint256 leafCount) public {
+        require(rootTimestamps[root] == 0, "Root already anchored");
+        rootTimestamps[root] = block.timestamp;
+        emit MerkleRootAdded(root, leafCount, block.timestamp);
+    }
+
+    // Get all records for a specific patient (unbounded — prefer the paged readers below)
     function getRecords(uint256 patientId) public view returns (Record[] memory) {
         return records[patientId];
     }
+
+    // Number of records stored for a patient
+    function getRecordCount(uint256 patientId) public view returns (uint256) {
+        return records[patientId].length;
+    }
+
+    // Up to `limit` records of a patient starting at index `offset` (oldest first)
+    function getRecordsRange(uint256 patientId, uint256 offset, uint256 limit)
+        public view returns (Record[] memory page)
+    {
+        Record[] storage all = records[patientId];
+        if (offset >= all.length) {
+            return new Record[](0);
+        }
+        uint256 end = offset + limit;
+        if (end > all.length) {
+            end = all.length;
+        }
+        page = new Record[](end - offset);
+        for (uint256 i = offset; i < end; i++) {
+            page[i - offset] = all[i];
+        }
+    }
+
+    // Most recent record of a patient
+    function getLatestRecord(uint256 patientId) public view returns (Record memory) {
+        require(records[patientId].length > 0, "No records");
+        return records[patientId][records[patientId].length - 1];
+    }
 }
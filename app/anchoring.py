@@ -0,0 +1,269 @@
+"""
+Asynchronous blockchain anchoring.
+
+Views only enqueue an AnchorJob (one INSERT) in the transaction that saves
+the record (``ledger.append_entry(..., anchor=True)``). The
+``anchor_worker`` management command drains the queue: it signs and
+sends the transactions, polls receipts without blocking, retries failures
+with exponential backoff and writes the transaction hash back to
+``Patient.tx_hash`` while the job's hash is still the patient's head.
+
+With ``settings.ANCHOR_MODE = "batch"`` the queued hashes are collected
+until ``ANCHOR_BATCH_SIZE`` are waiting or the oldest has waited
+``ANCHOR_BATCH_WINDOW`` seconds; only the Merkle root of the batch goes
+on-chain (``addMerkleRoot``) and every history/visit row keeps its proof.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import chain_reader, dashboard_cache, merkle, nonces
+from .instrumentation import span
+from .models import AnchorJob, Patient, PatientHistory, PatientVisit
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+GAS_LIMIT = 2000000
+GAS_PRICE_GWEI = '50'
+
+
+def enqueue(patient, hash_value):
+    """Queue ``hash_value`` for anchoring; returns the AnchorJob."""
+    return AnchorJob.objects.create(patient=patient, hash_value=hash_value)
+
+
+def enqueue_many(pairs, batch_key=None):
+    """
+    Queue ``(patient, hash_value)`` pairs in one INSERT. Jobs sharing a
+    ``batch_key`` are anchored together through one ``addMerkleRoot``
+    whatever ``ANCHOR_MODE`` is.
+    """
+    return AnchorJob.objects.bulk_create(
+        [AnchorJob(patient=patient, hash_value=h, batch_key=batch_key) for patient, h in pairs]
+    )
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts`` (1-based)."""
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def _claim_due(batch_size, now, batch_key=None):
+    """Lock the next due Pending jobs so parallel workers don't double-send."""
+    with transaction.atomic():
+        ids = list(
+            AnchorJob.objects.select_for_update(skip_locked=True)
+            .filter(status='Pending', next_attempt_at__lte=now, batch_key=batch_key)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        # Push them out of reach of other workers while this one sends
+        AnchorJob.objects.filter(id__in=ids).update(next_attempt_at=now + timedelta(minutes=5))
+    return AnchorJob.objects.filter(id__in=ids).order_by('id')
+
+
+def _submit(web3, function_call, account_address, private_key):
+    """Sign and broadcast a contract call; returns the tx hash."""
+    nonce = nonces.allocate(web3, account_address)
+    try:
+        with span('web3'):
+            txn = function_call.build_transaction({
+                'from': account_address,
+                'nonce': nonce,
+                'gas': GAS_LIMIT,
+                'gasPrice': web3.to_wei(GAS_PRICE_GWEI, 'gwei'),
+            })
+            signed = web3.eth.account.sign_transaction(txn, private_key=private_key)
+            return web3.to_hex(web3.eth.send_raw_transaction(signed.raw_transaction))
+    except Exception as e:
+        if 'nonce' in str(e).lower():
+            nonces.resync(account_address)  # node disagrees with our counter
+        else:
+            nonces.release(account_address, nonce)
+        raise
+
+
+def send_job(job, web3, contract, account_address, private_key):
+    """Send ``addRecord`` for one job; returns the tx hash."""
+    call = contract.functions.addRecord(job.patient_id, job.hash_value)
+    return _submit(web3, call, account_address, private_key)
+
+
+def _point_head(jobs, tx_hash):
+    """
+    Set ``Patient.tx_hash`` for patients whose chain head is one of the
+    jobs' hashes. A retried older job, or one overtaken by a newer entry,
+    leaves the head's transaction alone.
+    """
+    heads = Patient.objects.filter(
+        pk__in={job.patient_id for job in jobs},
+        blockchain_hash__in=[job.hash_value for job in jobs],  # link hashes are unique
+    )
+    dashboard_cache.invalidate_querysets([heads])
+    heads.update(tx_hash=tx_hash)
+
+
+def _fail(job, error, now):
+    job.attempts += 1
+    job.last_error = str(error)
+    if job.attempts >= MAX_ATTEMPTS:
+        job.status = 'Failed'
+    else:
+        job.status = 'Pending'
+        job.next_attempt_at = now + backoff(job.attempts)
+    job.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+
+
+def send_pending(web3, contract, account_address, private_key, batch_size=50, now=None):
+    """Send due Pending jobs; returns ``(sent, failed)`` counts."""
+    now = now or timezone.now()
+    sent, failed = send_keyed_batches(web3, contract, account_address, private_key, now=now)
+    if getattr(settings, 'ANCHOR_MODE', 'single') == 'batch':
+        batch_sent, batch_failed = send_batch(web3, contract, account_address, private_key, now=now)
+        return sent + batch_sent, failed + batch_failed
+
+    for job in _claim_due(batch_size, now):
+        try:
+            tx_hash = send_job(job, web3, contract, account_address, private_key)
+        except Exception as e:
+            _fail(job, e, now)
+            failed += 1
+            continue
+        job.status = 'Sent'
+        job.tx_hash = tx_hash
+        job.last_error = None
+        job.save(update_fields=['status', 'tx_hash', 'last_error', 'updated_at'])
+        _point_head([job], tx_hash)
+        sent += 1
+    return sent, failed
+
+
+def _batch_due(now, size, window):
+    due = AnchorJob.objects.filter(status='Pending', next_attempt_at__lte=now, batch_key__isnull=True)
+    oldest = due.order_by('created_at').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return False
+    return oldest <= now - timedelta(seconds=window) or due[size - 1:size].exists()
+
+
+def _store_proofs(jobs, root, proofs):
+    """Copy each job's proof onto the history/visit row that produced the hash."""
+    by_hash = {job.hash_value: proof for job, proof in zip(jobs, proofs)}
+    for model in (PatientHistory, PatientVisit):
+        rows = list(model.objects.filter(blockchain_hash__in=by_hash).only('id', 'blockchain_hash'))
+        for row in rows:
+            row.merkle_root = root
+            row.merkle_proof = by_hash[row.blockchain_hash]
+        model.objects.bulk_update(rows, ['merkle_root', 'merkle_proof'])
+
+
+def send_batch(web3, contract, account_address, private_key, now=None):
+    """
+    Anchor one window of queued hashes through a single ``addMerkleRoot``.
+
+    Returns ``(sent, failed)`` counted in jobs, like ``send_pending``.
+    """
+    now = now or timezone.now()
+    size = getattr(settings, 'ANCHOR_BATCH_SIZE', 256)
+    window = getattr(settings, 'ANCHOR_BATCH_WINDOW', 30)
+    if not _batch_due(now, size, window):
+        return 0, 0
+
+    jobs = list(_claim_due(size, now))
+    if not jobs:
+        return 0, 0
+    return _anchor_root(jobs, web3, contract, account_address, private_key, now)
+
+
+def send_keyed_batches(web3, contract, account_address, private_key, now=None, max_batches=10):
+    """One ``addMerkleRoot`` per due ``batch_key`` group (e.g. a bulk-import chunk)."""
+    now = now or timezone.now()
+    keys = list(
+        AnchorJob.objects.filter(status='Pending', next_attempt_at__lte=now, batch_key__isnull=False)
+        .order_by().values_list('batch_key', flat=True).distinct()[:max_batches]
+    )
+    sent = failed = 0
+    for key in keys:
+        jobs = list(_claim_due(None, now, batch_key=key))
+        if jobs:
+            batch_sent, batch_failed = _anchor_root(jobs, web3, contract, account_address, private_key, now)
+            sent += batch_sent
+            failed += batch_failed
+    return sent, failed
+
+
+def _anchor_root(jobs, web3, contract, account_address, private_key, now):
+    root, proofs = merkle.build([job.hash_value for job in jobs])
+
+    try:
+        call = contract.functions.addMerkleRoot(bytes.fromhex(root), len(jobs))
+        tx_hash = _submit(web3, call, account_address, private_key)
+    except Exception as e:
+        for job in jobs:
+            _fail(job, e, now)
+        return 0, len(jobs)
+
+    with transaction.atomic():
+        for job, proof in zip(jobs, proofs):
+            job.status = 'Sent'
+            job.tx_hash = tx_hash
+            job.merkle_root = root
+            job.merkle_proof = proof
+            job.last_error = None
+            job.updated_at = now
+        AnchorJob.objects.bulk_update(
+            jobs, ['status', 'tx_hash', 'merkle_root', 'merkle_proof', 'last_error', 'updated_at']
+        )
+        _store_proofs(jobs, root, proofs)
+        _point_head(jobs, tx_hash)
+    return len(jobs), 0
+
+
+def confirm_sent(web3, batch_size=200, now=None):
+    """Poll receipts of Sent jobs without waiting; returns confirmed count."""
+    now = now or timezone.now()
+    confirmed = 0
+    tx_hashes = (
+        AnchorJob.objects.filter(status='Sent')
+        .values_list('tx_hash', flat=True)
+        .distinct()[:batch_size]
+    )
+    for tx_hash in list(tx_hashes):
+        try:
+            with span('web3'):
+                receipt = web3.eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            continue  # not mined yet (or node unreachable) — look again next round
+        jobs = AnchorJob.objects.filter(status='Sent', tx_hash=tx_hash)
+        if receipt['status'] == 1:
+            confirmed += jobs.update(
+                status='Confirmed', block_number=receipt['blockNumber'], updated_at=now
+            )
+        else:
+            for job in jobs:
+                _fail(job, f"Transaction {tx_hash} reverted", now)
+            # Don't show a reverted tx as the record's anchor; the retry sets it again
+            reverted = Patient.objects.filter(tx_hash=tx_hash)
+            dashboard_cache.invalidate_querysets([reverted])
+            reverted.update(tx_hash=None)
+    return confirmed
+
+
+def is_anchored(row, contract):
+    """True if a batched history/visit row is provably on-chain via its root."""
+    if not (row.merkle_root and row.merkle_proof):
+        return False
+    if not merkle.verify(row.blockchain_hash, row.merkle_proof, row.merkle_root):
+        return False
+    return chain_reader.root_timestamp(row.merkle_root, contract) is not None
+
+
+def drain(web3, contract, account_address, private_key, batch_size=50):
+    """One worker pass: send what is due, then confirm what was sent."""
+    sent, failed = send_pending(web3, contract, account_address, private_key, batch_size)
+    confirmed = confirm_sent(web3)
+    return {'sent': sent, 'failed': failed, 'confirmed': confirmed}
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import dashboard_cache, identity, notifications, push, sqlite, stats  # noqa: F401 — registers the signal receivers
@@ -0,0 +1,303 @@
+"""
+Benchmark harness for the request hot paths.
+
+``seed()`` fills the current database with synthetic doctors, patients,
+history snapshots and visits (valid hash chains, bulk inserted) and
+``run()`` drives the views through the Django test client, recording per
+scenario latency percentiles, queries per request and peak Python memory.
+The ``benchmark`` management command does both inside a throwaway test
+database and compares the report with a stored baseline.
+
+The blockchain is replaced by ``FakeChain`` / ``AsyncFakeChain`` (every
+hash reads back as anchored), so no node is needed and results don't depend on RPC latency.
+"""
+
+import datetime
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import ledger, stats
+from .models import Doctor, Patient, PatientHistory, PatientVisit
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+CHUNK = 2_000
+GENDERS = ('Male', 'Female', 'Other')
+DIAGNOSES = ('Flu', 'Migraine', 'Hypertension', 'Asthma', 'Diabetes', None)
+
+
+def parse_scale(value):
+    """``'1k'`` / ``'100k'`` / ``'1m'`` or a plain patient count."""
+    return SCALES.get(str(value).lower()) or int(value)
+
+
+# ---------------------- FAKE CHAIN ----------------------
+
+class _Call:
+    def __init__(self, value):
+        self.value = value
+
+    def call(self):
+        return self.value
+
+
+class _Functions:
+    def getLatestRecord(self, patient_id):
+        head = Patient.objects.filter(pk=patient_id).values_list('blockchain_hash', flat=True).first()
+        return _Call((patient_id, head, int(time.time())))
+
+    def getRecordCount(self, patient_id):
+        return _Call(0)
+
+    def getRecordsRange(self, patient_id, offset, limit):
+        return _Call([])
+
+    def rootTimestamps(self, root):
+        return _Call(int(time.time()))
+
+
+class FakeChain:
+    """Contract stand-in: the latest record of every patient is its current head."""
+
+    def __init__(self):
+        self.functions = _Functions()
+        self.w3 = mock.Mock()
+        self.w3.eth.block_number = 0
+
+
+async def _value(value):
+    return value
+
+
+class _AsyncFunctions:
+    def getLatestRecord(self, patient_id):
+        return _Call(self._latest(patient_id))
+
+    async def _latest(self, patient_id):
+        head = await Patient.objects.filter(pk=patient_id).values_list('blockchain_hash', flat=True).afirst()
+        return patient_id, head, int(time.time())
+
+    def getRecordCount(self, patient_id):
+        return _Call(_value(0))
+
+    def getRecordsRange(self, patient_id, offset, limit):
+        return _Call(_value([]))
+
+    def rootTimestamps(self, root):
+        return _Call(_value(int(time.time())))
+
+
+class _AsyncEth:
+    @property
+    def block_number(self):
+        return _value(0)
+
+
+class AsyncFakeChain:
+    """``FakeChain`` for the async views: every ``call()`` returns an awaitable."""
+
+    def __init__(self):
+        self.functions = _AsyncFunctions()
+        self.w3 = mock.Mock(eth=_AsyncEth())
+
+
+# ---------------------- SEEDING ----------------------
+
+def _chunks(total):
+    for start in range(0, total, CHUNK):
+        yield start, min(start + CHUNK, total)
+
+
+def seed(patients, visits_per_patient=2, history_per_patient=2, rng=None):
+    """Bulk insert a synthetic dataset; returns the row counts."""
+    rng = rng or random.Random(42)
+    doctors = Doctor.objects.bulk_create([
+        Doctor(full_name=f"Dr. Bench {i}", specialization="General", email=f"bench.dr{i}@example.com",
+               phone="555", experience=rng.randint(1, 30))
+        for i in range(max(5, patients // 100))
+    ])
+    counts = {'doctors': len(doctors), 'patients': 0, 'history': 0, 'visits': 0}
+
+    for start, stop in _chunks(patients):
+        with transaction.atomic():
+            batch = Patient.objects.bulk_create([
+                Patient(full_name=f"Patient {i}", age=rng.randint(1, 95), gender=rng.choice(GENDERS),
+                        email=f"bench.p{i}@example.com", phone="555", address=f"{i} Bench Street",
+                        disease=rng.choice(DIAGNOSES), doctor_assigned=rng.choice(doctors).full_name)
+                for i in range(start, stop)
+            ])
+            histories, visits = [], []
+            day = datetime.date(2024, 1, 1)
+            for patient in batch:
+                head = ledger.GENESIS_HASH
+                for n in range(history_per_patient):
+                    entry = PatientHistory(patient=patient, full_name=patient.full_name, age=patient.age + n,
+                                           gender=patient.gender, email=patient.email, phone=patient.phone,
+                                           address=patient.address, disease=patient.disease,
+                                           doctor_assigned=patient.doctor_assigned, prev_hash=head)
+                    head = entry.blockchain_hash = ledger.link_hash(head, entry)
+                    histories.append(entry)
+                for n in range(visits_per_patient):
+                    entry = PatientVisit(patient=patient, doctor=rng.choice(doctors),
+                                         visit_date=day + datetime.timedelta(days=n),
+                                         diagnosis=rng.choice(DIAGNOSES), prev_hash=head)
+                    head = entry.blockchain_hash = ledger.link_hash(head, entry)
+                    visits.append(entry)
+                patient.blockchain_hash = head
+            PatientHistory.objects.bulk_create(histories)
+            PatientVisit.objects.bulk_create(visits)
+            Patient.objects.bulk_update(batch, ['blockchain_hash'])
+        counts['patients'] += len(batch)
+        counts['history'] += len(histories)
+        counts['visits'] += len(visits)
+
+    stats.reconcile()
+    return counts
+
+
+# ---------------------- SCENARIOS ----------------------
+
+@dataclass
+class Result:
+    scenario: str
+    runs: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    queries: float
+    peak_kib: float
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _client(role=None, user_id=None, staff=None):
+    client = Client()
+    if staff is not None:
+        client.force_login(staff)
+    if role:
+        session = client.session
+        session.update({'user_role': role, 'user_id': user_id})
+        session.save()
+    return client
+
+
+def scenarios(rng):
+    """``{name: callable(iteration) -> response}`` for each hot path."""
+    staff, _ = User.objects.get_or_create(username='bench-admin', defaults={'is_staff': True})
+    patient_ids = list(Patient.objects.values_list('pk', flat=True)[:1000])
+    busiest = (PatientVisit.objects.values('doctor').order_by().annotate(n=Count('pk'))
+               .order_by('-n').values_list('doctor', flat=True).first())
+    patient = Patient.objects.get(pk=patient_ids[0])
+
+    admin = _client(staff=staff)
+    doctor = _client('doctor', busiest)
+    patient_client = _client('patient', patient.pk)
+
+    def save_record(i):
+        return doctor.post(reverse('save_patient_record'), {
+            'patient_id': rng.choice(patient_ids), 'doctor_id': busiest,
+            'visit_date': '2025-01-01', 'symptoms': 'cough', 'diagnosis': 'Flu', 'prescription': 'rest',
+        })
+
+    def edit(i):
+        target = Patient.objects.get(pk=rng.choice(patient_ids))
+        return admin.post(reverse('edit_patient', args=[target.pk]), {
+            'full_name': target.full_name, 'age': target.age + 1, 'gender': target.gender,
+            'email': target.email, 'phone': target.phone, 'address': target.address,
+            'disease': target.disease or '', 'doctor_assigned': target.doctor_assigned or '',
+        })
+
+    def verify(i):
+        head = Patient.objects.filter(pk=rng.choice(patient_ids)).values_list('blockchain_hash', flat=True)[0]
+        return doctor.get(reverse('verify_hash_api'), {'hash': head})
+
+    return {
+        'save_patient_record': save_record,
+        'edit_patient': edit,
+        'admin_dashboard': lambda i: admin.get(reverse('admin_dashboard')),
+        'doctor_dashboard': lambda i: doctor.get(reverse('doctor_dashboard')),
+        'patient_dashboard': lambda i: patient_client.get(reverse('patient_dashboard')),
+        'verify_hash_api': verify,
+    }
+
+
+def measure(name, action, iterations, warmup=2, memory_runs=5):
+    """Time ``iterations`` calls, then trace memory over a few more (tracing skews timings)."""
+    for i in range(warmup):
+        action(i)
+    timings, queries = [], []
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = action(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} answered HTTP {response.status_code}")
+        queries.append(len(captured))
+
+    tracemalloc.start()
+    try:
+        for i in range(min(memory_runs, iterations)):
+            action(i)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return Result(
+        scenario=name, runs=iterations,
+        p50_ms=round(_percentile(timings, 50), 2), p95_ms=round(_percentile(timings, 95), 2),
+        p99_ms=round(_percentile(timings, 99), 2), max_ms=round(timings[-1], 2),
+        queries=round(sum(queries) / len(queries), 1), peak_kib=round(peak / 1024, 1),
+    )
+
+
+def run(iterations=50, only=None, seed_value=42):
+    """Measure every scenario (or those in ``only``); returns a list of Result."""
+    rng = random.Random(seed_value)
+    media = tempfile.mkdtemp(prefix='bench-media-')
+    try:
+        with override_settings(QR_EXECUTOR='sync', MEDIA_ROOT=media), \
+                mock.patch('app.blockchain.get_contract', return_value=FakeChain()), \
+                mock.patch('app.blockchain.get_async_contract', side_effect=AsyncFakeChain):
+            actions = scenarios(rng)
+            return [measure(name, action, iterations) for name, action in actions.items()
+                    if not only or name in only]
+    finally:
+        shutil.rmtree(media, ignore_errors=True)
+
+
+# ---------------------- BASELINE ----------------------
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    ``[(scenario, metric, baseline, current, change)]`` for every p95 latency
+    or query count that got worse than ``baseline`` by more than ``tolerance``.
+    """
+    previous = {row['scenario']: row for row in baseline.get('results', [])}
+    regressions = []
+    for result in map(asdict, results):
+        before = previous.get(result['scenario'])
+        if not before:
+            continue
+        for metric in ('p95_ms', 'queries'):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                change = result[metric] / before[metric] - 1
+                regressions.append((result['scenario'], metric, before[metric], result[metric], change))
+    return regressions
@@ -0,0 +1,248 @@
+"""
+Lazily connected Web3 client for the PatientRecords contract.
+
+Nothing talks to the node at import time: the Web3 instance, its pooled
+keep-alive HTTP session and the contract object are built on first use and
+reused afterwards. ``get_async_contract()`` is the same contract on an
+``AsyncWeb3`` client (aiohttp, one pooled session per event loop) for async
+views, which can then keep many chain reads in flight without holding a
+thread each. ``health()`` reports node/account/contract status and
+caches it for ``BLOCKCHAIN_HEALTH_TTL`` seconds, so it is cheap enough for
+dashboards and readiness probes.
+"""
+
+import threading
+import time
+
+import aiohttp
+import requests
+from django.conf import settings
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+
+RPC_URL = getattr(settings, "BLOCKCHAIN_RPC_URL", "http://127.0.0.1:7545")
+ACCOUNT_ADDRESS = getattr(settings, "BLOCKCHAIN_ACCOUNT_ADDRESS", "")
+PRIVATE_KEY = getattr(settings, "BLOCKCHAIN_PRIVATE_KEY", "")
+CONTRACT_ADDRESS = getattr(settings, "BLOCKCHAIN_CONTRACT_ADDRESS", "")
+RPC_TIMEOUT = getattr(settings, "BLOCKCHAIN_RPC_TIMEOUT", 10)
+HEALTH_TTL = getattr(settings, "BLOCKCHAIN_HEALTH_TTL", 30)
+POOL_SIZE = getattr(settings, "BLOCKCHAIN_POOL_SIZE", 10)
+
+# ✅ ABI (copied from Remix output)
+CONTRACT_ABI = [
+  {
+    "inputs": [
+      {"internalType": "uint256", "name": "patientId", "type": "uint256"},
+      {"internalType": "string", "name": "hashValue", "type": "string"}
+    ],
+    "name": "addRecord",
+    "outputs": [],
+    "stateMutability": "nonpayable",
+    "type": "function"
+  },
+  {
+    "inputs": [
+      {"internalType": "uint256", "name": "patientId", "type": "uint256"}
+    ],
+    "name": "getRecords",
+    "outputs": [
+      {
+        "components": [
+          {"internalType": "uint256", "name": "patientId", "type": "uint256"},
+          {"internalType": "string", "name": "hashValue", "type": "string"},
+          {"internalType": "uint256", "name": "timestamp", "type": "uint256"}
+        ],
+        "internalType": "struct PatientRecords.Record[]",
+        "name": "",
+        "type": "tuple[]"
+      }
+    ],
+    "stateMutability": "view",
+    "type": "function"
+  },
+  {
+    "inputs": [
+      {"internalType": "uint256", "name": "patientId", "type": "uint256"}
+    ],
+    "name": "getRecordCount",
+    "outputs": [
+      {"internalType": "uint256", "name": "", "type": "uint256"}
+    ],
+    "stateMutability": "view",
+    "type": "function"
+  },
+  {
+    "inputs": [
+      {"internalType": "uint256", "name": "patientId", "type": "uint256"},
+      {"internalType": "uint256", "name": "offset", "type": "uint256"},
+      {"internalType": "uint256", "name": "limit", "type": "uint256"}
+    ],
+    "name": "getRecordsRange",
+    "outputs": [
+      {
+        "components": [
+          {"internalType": "uint256", "name": "patientId", "type": "uint256"},
+          {"internalType": "string", "name": "hashValue", "type": "string"},
+          {"internalType": "uint256", "name": "timestamp", "type": "uint256"}
+        ],
+        "internalType": "struct PatientRecords.Record[]",
+        "name": "page",
+        "type": "tuple[]"
+      }
+    ],
+    "stateMutability": "view",
+    "type": "function"
+  },
+  {
+    "inputs": [
+      {"internalType": "uint256", "name": "patientId", "type": "uint256"}
+    ],
+    "name": "getLatestRecord",
+    "outputs": [
+      {
+        "components": [
+          {"internalType": "uint256", "name": "patientId", "type": "uint256"},
+          {"internalType": "string", "name": "hashValue", "type": "string"},
+          {"internalType": "uint256", "name": "timestamp", "type": "uint256"}
+        ],
+        "internalType": "struct PatientRecords.Record",
+        "name": "",
+        "type": "tuple"
+      }
+    ],
+    "stateMutability": "view",
+    "type": "function"
+  },
+  {
+    "inputs": [
+      {"internalType": "bytes32", "name": "root", "type": "bytes32"},
+      {"internalType": "uint256", "name": "leafCount", "type": "uint256"}
+    ],
+    "name": "addMerkleRoot",
+    "outputs": [],
+    "stateMutability": "nonpayable",
+    "type": "function"
+  },
+  {
+    "inputs": [
+      {"internalType": "bytes32", "name": "", "type": "bytes32"}
+    ],
+    "name": "rootTimestamps",
+    "outputs": [
+      {"internalType": "uint256", "name": "", "type": "uint256"}
+    ],
+    "stateMutability": "view",
+    "type": "function"
+  },
+  {
+    "anonymous": False,
+    "inputs": [
+      {"indexed": True, "internalType": "bytes32", "name": "root", "type": "bytes32"},
+      {"indexed": False, "internalType": "uint256", "name": "leafCount", "type": "uint256"},
+      {"indexed": False, "internalType": "uint256", "name": "timestamp", "type": "uint256"}
+    ],
+    "name": "MerkleRootAdded",
+    "type": "event"
+  },
+  {
+    "anonymous": False,
+    "inputs": [
+      {"indexed": True, "internalType": "uint256", "name": "patientId", "type": "uint256"},
+      {"indexed": False, "internalType": "string", "name": "hashValue", "type": "string"},
+      {"indexed": False, "internalType": "uint256", "name": "timestamp", "type": "uint256"}
+    ],
+    "name": "RecordAdded",
+    "type": "event"
+  }
+]
+
+_lock = threading.Lock()
+_web3 = None
+_contract = None
+_async_web3 = None
+_async_contract = None
+_health = None
+_health_checked_at = 0.0
+
+
+def _session():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_web3():
+    """Shared Web3 instance, connected on first use."""
+    global _web3
+    if _web3 is None:
+        with _lock:
+            if _web3 is None:
+                provider = Web3.HTTPProvider(
+                    RPC_URL, request_kwargs={"timeout": RPC_TIMEOUT}, session=_session()
+                )
+                _web3 = Web3(provider)
+    return _web3
+
+
+def get_contract():
+    """Cached PatientRecords contract object."""
+    global _contract
+    if _contract is None:
+        w3 = get_web3()
+        _contract = w3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
+    return _contract
+
+
+def get_async_web3():
+    """Shared AsyncWeb3 instance for async views, connected on first use."""
+    global _async_web3
+    if _async_web3 is None:
+        with _lock:
+            if _async_web3 is None:
+                provider = AsyncHTTPProvider(
+                    RPC_URL, request_kwargs={"timeout": aiohttp.ClientTimeout(total=RPC_TIMEOUT)}
+                )
+                _async_web3 = AsyncWeb3(provider)
+    return _async_web3
+
+
+def get_async_contract():
+    """Cached PatientRecords contract object bound to the AsyncWeb3 client."""
+    global _async_contract
+    if _async_contract is None:
+        w3 = get_async_web3()
+        _async_contract = w3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
+    return _async_contract
+
+
+def configure(web3=None, async_web3=None):
+    """Swap the clients (e.g. an EthereumTesterProvider-backed Web3 in tests)."""
+    global _web3, _contract, _async_web3, _async_contract, _health, _health_checked_at
+    with _lock:
+        _web3, _contract, _health, _health_checked_at = web3, None, None, 0.0
+        _async_web3, _async_contract = async_web3, None
+
+
+def _check():
+    w3 = get_web3()
+    status = {"connected": False, "account": False, "contract": False, "error": None}
+    try:
+        status["connected"] = w3.is_connected()
+        if status["connected"]:
+            status["account"] = w3.eth.get_balance(ACCOUNT_ADDRESS) > 0
+            status["contract"] = len(w3.eth.get_code(Web3.to_checksum_address(CONTRACT_ADDRESS))) > 0
+    except Exception as e:
+        status["error"] = str(e)
+    status["ok"] = status["connected"] and status["account"] and status["contract"]
+    return status
+
+
+def health(refresh=False):
+    """Node/account/contract status, cached for ``HEALTH_TTL`` seconds."""
+    global _health, _health_checked_at
+    now = time.monotonic()
+    if refresh or _health is None or now - _health_checked_at > HEALTH_TTL:
+        _health = _check()
+        _health_checked_at = now
+    return _health
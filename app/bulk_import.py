@@ -0,0 +1,190 @@
+"""
+Bulk patient import from CSV or JSON.
+
+Rows are streamed from the input and handled in chunks of ``CHUNK_SIZE``.
+Each chunk is one transaction: one ``bulk_create`` for the patients, their
+genesis PatientHistory entries hashed in a single pass, one ``bulk_update``
+for the chain heads and one AnchorJob INSERT. Every chunk shares a batch key,
+so anchor_worker anchors it with a single ``addMerkleRoot``. QR codes are
+rendered afterwards by the qr_images background pool.
+"""
+
+import codecs
+import csv
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from itertools import count, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from . import anchoring, identity, ledger, qr_envelope, qr_images, stats
+from .models import Patient, PatientHistory
+
+CHUNK_SIZE = getattr(settings, 'BULK_IMPORT_CHUNK_SIZE', 500)
+FIELDS = ('full_name', 'age', 'gender', 'email', 'phone', 'address', 'disease', 'doctor_assigned')
+REQUIRED = ('full_name', 'age', 'gender', 'email', 'phone', 'address')
+GENDERS = {choice for choice, _ in Patient.GENDER_CHOICES}
+MAX_ERRORS = 100  # kept in the report; the rest are only counted
+# What a malformed upload raises while it is read (bad JSON, bad UTF-8, NUL bytes in CSV...)
+READ_ERRORS = (ValueError, UnicodeDecodeError, csv.Error)
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)  # [(row number, message), ...]
+    seconds: float = 0.0
+    stopped_at: int = None  # row where a malformed input stopped the read
+
+    @property
+    def rate(self):
+        """Imported rows per second."""
+        return self.imported / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'errors': [{'row': row, 'error': message} for row, message in self.errors],
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rate, 1),
+            'stopped_at': self.stopped_at,
+        }
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(row number, dict)`` from a binary stream. ``fmt`` is ``csv``,
+    ``jsonl`` (one object per line, streamed) or ``json`` (an array).
+    """
+    text = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        yield from enumerate(csv.DictReader(text), start=1)
+    elif fmt == 'jsonl':
+        number = 0
+        for line in text:
+            if line.strip():
+                number += 1
+                yield number, json.loads(line)
+    elif fmt == 'json':
+        yield from enumerate(json.load(text), start=1)
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def format_for(filename, default='csv'):
+    name = (filename or '').lower()
+    for ext in ('jsonl', 'ndjson', 'json', 'csv'):
+        if name.endswith('.' + ext):
+            return 'jsonl' if ext == 'ndjson' else ext
+    return default
+
+
+def _clean(raw):
+    """Patient field values from one input row; raises ValueError when unusable."""
+    values = {name: (str(raw.get(name) or '').strip() or None) for name in FIELDS}
+    missing = [name for name in REQUIRED if not values[name]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    try:
+        values['age'] = int(values['age'])
+    except ValueError:
+        raise ValueError(f"age is not a number: {values['age']!r}")
+    if values['gender'] not in GENDERS:
+        raise ValueError(f"gender must be one of {', '.join(sorted(GENDERS))}")
+    values['email'] = values['email'].lower()
+    return values
+
+
+def _error(report, row, message):
+    report.skipped += 1
+    if len(report.errors) < MAX_ERRORS:
+        report.errors.append((row, message))
+
+
+def _read(rows, report):
+    """
+    Pass rows through until the input turns out malformed; the read error is
+    recorded in the report instead of raised, since earlier chunks are already
+    committed by then.
+    """
+    number = 0
+    try:
+        for number, raw in rows:
+            yield number, raw
+    except READ_ERRORS as e:
+        report.stopped_at = number + 1
+        report.skipped += 1
+        report.errors.append((report.stopped_at, f"stopped reading: {e}"))
+
+
+def _import_chunk(chunk, report, batch_key):
+    patients = []
+    seen = set(
+        Patient.objects.filter(email__in=[str(raw.get('email') or '').strip().lower() for _, raw in chunk
+                                          if isinstance(raw, dict)]).values_list('email', flat=True)
+    )
+    for number, raw in chunk:
+        try:
+            values = _clean(raw if isinstance(raw, dict) else {})
+        except ValueError as e:
+            _error(report, number, str(e))
+            continue
+        if values['email'] in seen:
+            _error(report, number, f"email already registered: {values['email']}")
+            continue
+        seen.add(values['email'])
+        patients.append(Patient(**values))
+    if not patients:
+        return
+
+    with transaction.atomic():
+        Patient.objects.bulk_create(patients)
+
+        # Genesis entries: every chain is new, so each hash only needs its own row
+        histories = []
+        for patient in patients:
+            history = PatientHistory(patient=patient, prev_hash=ledger.GENESIS_HASH,
+                                     **{name: getattr(patient, name) for name in FIELDS})
+            history.blockchain_hash = ledger.link_hash(ledger.GENESIS_HASH, history)
+            patient.blockchain_hash = history.blockchain_hash
+            histories.append(history)
+        PatientHistory.objects.bulk_create(histories)
+        Patient.objects.bulk_update(patients, ['blockchain_hash'])
+
+        anchoring.enqueue_many([(p, p.blockchain_hash) for p in patients], batch_key=batch_key)
+        identity.sync_many('patient', patients)
+        stats.patients_added(patients)
+
+        for patient, history in zip(patients, histories):
+            qr_images.schedule(qr_envelope.encode(patient.pk, history.blockchain_hash), [
+                Patient.objects.filter(pk=patient.pk, blockchain_hash=history.blockchain_hash),
+                PatientHistory.objects.filter(pk=history.pk),
+            ])
+    report.imported += len(patients)
+
+
+def import_patients(rows, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import ``(row number, dict)`` rows; returns an ImportReport. ``progress``
+    is called with the running report after every chunk. Input that breaks
+    mid-file keeps the rows read before it and sets ``stopped_at``.
+    """
+    report = ImportReport()
+    started = time.monotonic()
+    run = uuid.uuid4().hex[:12]
+    rows = _read(rows, report)
+    for index in count():
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, report, batch_key=f"import:{run}:{index}")
+        report.seconds = time.monotonic() - started
+        if progress:
+            progress(report)
+    report.seconds = time.monotonic() - started
+    return report
@@ -0,0 +1,299 @@
+"""
+Cached, paged reads of what PatientRecords holds on-chain.
+
+A patient's record array only ever grows, so it is read in bounded pages
+(``getRecordCount`` + ``getRecordsRange``) and kept in the Django cache.
+When a ``RecordAdded`` event for the patient shows up the cached copy is
+only marked stale: the next read asks for the count and fetches just the
+new tail. ``watch()`` scans the blocks mined since its last run for those
+events (one ``eth_getLogs`` call for all patients, at most every
+``WATCH_INTERVAL`` seconds). Merkle root timestamps never change once set,
+so anchored roots are cached for good.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from web3.exceptions import ContractLogicError
+
+from . import blockchain
+from .instrumentation import span
+from .models import ChainRecord
+
+RECORDS_TTL = getattr(settings, 'BLOCKCHAIN_RECORDS_TTL', 3600)  # safety net behind watch()
+PAGE_SIZE = getattr(settings, 'BLOCKCHAIN_RECORDS_PAGE', 100)    # records per getRecordsRange call
+WATCH_INTERVAL = getattr(settings, 'BLOCKCHAIN_WATCH_INTERVAL', 2)  # seconds
+WATCH_KEY = 'chain_reader:last_block'
+
+_watch_lock = threading.Lock()
+_watched_at = 0.0
+
+
+def _records_key(patient_id):
+    return f'chain_reader:records:{patient_id}'
+
+
+def _fresh_key(patient_id):
+    return f'chain_reader:fresh:{patient_id}'
+
+
+def _latest_key(patient_id):
+    return f'chain_reader:latest:{patient_id}'
+
+
+def count(patient_id, contract=None):
+    contract = contract or blockchain.get_contract()
+    with span('web3'):
+        return contract.functions.getRecordCount(int(patient_id)).call()
+
+
+def iter_records(patient_id, start=0, stop=None, page_size=PAGE_SIZE, contract=None):
+    """Stream ``(hash_value, timestamp)`` from index ``start``, one page per call."""
+    contract = contract or blockchain.get_contract()
+    if stop is None:
+        stop = count(patient_id, contract)
+    for offset in range(start, stop, page_size):
+        with span('web3'):
+            page = contract.functions.getRecordsRange(
+                int(patient_id), offset, min(page_size, stop - offset)
+            ).call()
+        for record in page:
+            yield record[1], record[2]
+
+
+def latest_record(patient_id, contract=None):
+    """The patient's newest ``(hash_value, timestamp)``, or ``None``."""
+    contract = contract or blockchain.get_contract()
+    try:
+        with span('web3'):
+            record = contract.functions.getLatestRecord(int(patient_id)).call()
+    except ContractLogicError:
+        return None  # "No records"
+    return record[1], record[2]
+
+
+def records(patient_id, contract=None):
+    """``[(hash_value, timestamp), ...]`` anchored for the patient via addRecord."""
+    _maybe_watch(contract)
+    rows = cache.get(_records_key(patient_id))
+    if rows is not None and cache.get(_fresh_key(patient_id)):
+        return rows
+
+    # Stale or missing: the array is append-only, so only fetch the tail
+    rows = list(rows or [])
+    total = count(patient_id, contract)
+    if total < len(rows):
+        rows = []  # contract redeployed
+    rows.extend(iter_records(patient_id, len(rows), total, contract=contract))
+    cache.set_many({_records_key(patient_id): rows, _fresh_key(patient_id): True}, RECORDS_TTL)
+    return rows
+
+
+def record_timestamp(patient_id, hash_value, contract=None):
+    """Block timestamp of ``hash_value`` in the patient's records, or ``None``."""
+    indexed = _indexed_timestamp('record', hash_value, patient_id=patient_id)
+    if indexed is not None:
+        return indexed
+    _maybe_watch(contract)
+    if not cache.get(_fresh_key(patient_id)):
+        # Usually the hash being checked is the newest one: one bounded call
+        latest = cache.get(_latest_key(patient_id))
+        if latest is None:
+            latest = latest_record(patient_id, contract) or ()
+            cache.set(_latest_key(patient_id), latest, RECORDS_TTL)
+        if not latest:
+            return None
+        if latest[0] == hash_value:
+            return latest[1]
+    return next((ts for h, ts in records(patient_id, contract) if h == hash_value), None)
+
+
+def root_timestamp(root, contract=None):
+    """Block timestamp a Merkle root was anchored at, or ``None``."""
+    indexed = _indexed_timestamp('merkle_root', root)
+    if indexed is not None:
+        return indexed
+    key = f'chain_reader:root:{root}'
+    timestamp = cache.get(key)
+    if timestamp is None:
+        contract = contract or blockchain.get_contract()
+        with span('web3'):
+            timestamp = contract.functions.rootTimestamps(bytes.fromhex(root)).call()
+        if timestamp:
+            cache.set(key, timestamp, None)
+    return timestamp or None
+
+
+def _indexed_timestamp(kind, hash_value, **filters):
+    return (
+        ChainRecord.objects.filter(kind=kind, hash_value=hash_value, **filters)
+        .values_list('timestamp', flat=True).first()
+    )
+
+
+def invalidate(patient_id):
+    """Mark the patient's cached records stale (the prefix is kept and extended)."""
+    cache.delete_many([_fresh_key(patient_id), _latest_key(patient_id)])
+
+
+def watch(web3=None, contract=None):
+    """
+    Invalidate cached records of every patient with a ``RecordAdded`` event
+    since the last call. Returns the number of events seen.
+    """
+    contract = contract or blockchain.get_contract()
+    web3 = web3 or contract.w3
+    with span('web3'):
+        latest = web3.eth.block_number
+    last = cache.get(WATCH_KEY)
+    if last is None:
+        # First run: nothing older can be stale relative to a fresh cache
+        cache.set(WATCH_KEY, latest, None)
+        return 0
+    if latest <= last:
+        return 0
+    with span('web3'):
+        events = contract.events.RecordAdded().get_logs(from_block=last + 1, to_block=latest)
+    for patient_id in {event['args']['patientId'] for event in events}:
+        invalidate(patient_id)
+    cache.set(WATCH_KEY, latest, None)
+    return len(events)
+
+
+def _maybe_watch(contract=None):
+    global _watched_at
+    if time.monotonic() - _watched_at < WATCH_INTERVAL or not _watch_lock.acquire(blocking=False):
+        return
+    try:
+        watch(contract=contract)
+    except Exception:
+        pass  # node unreachable: serve what is cached, the next call retries
+    finally:
+        _watched_at = time.monotonic()
+        _watch_lock.release()
+
+
+# ---------------------- ASYNC ----------------------
+# Same reads for async views, over blockchain.get_async_contract(). They
+# share the cache keys above, so sync and async callers warm each other.
+
+async def acount(patient_id, contract=None):
+    contract = contract or blockchain.get_async_contract()
+    with span('web3'):
+        return await contract.functions.getRecordCount(int(patient_id)).call()
+
+
+async def aiter_records(patient_id, start=0, stop=None, page_size=PAGE_SIZE, contract=None):
+    """Async ``iter_records``."""
+    contract = contract or blockchain.get_async_contract()
+    if stop is None:
+        stop = await acount(patient_id, contract)
+    for offset in range(start, stop, page_size):
+        with span('web3'):
+            page = await contract.functions.getRecordsRange(
+                int(patient_id), offset, min(page_size, stop - offset)
+            ).call()
+        for record in page:
+            yield record[1], record[2]
+
+
+async def alatest_record(patient_id, contract=None):
+    contract = contract or blockchain.get_async_contract()
+    try:
+        with span('web3'):
+            record = await contract.functions.getLatestRecord(int(patient_id)).call()
+    except ContractLogicError:
+        return None  # "No records"
+    return record[1], record[2]
+
+
+async def arecords(patient_id, contract=None):
+    """Async ``records``."""
+    await _amaybe_watch(contract)
+    rows = await cache.aget(_records_key(patient_id))
+    if rows is not None and await cache.aget(_fresh_key(patient_id)):
+        return rows
+
+    rows = list(rows or [])
+    total = await acount(patient_id, contract)
+    if total < len(rows):
+        rows = []  # contract redeployed
+    rows.extend([record async for record in aiter_records(patient_id, len(rows), total, contract=contract)])
+    await cache.aset_many({_records_key(patient_id): rows, _fresh_key(patient_id): True}, RECORDS_TTL)
+    return rows
+
+
+async def arecord_timestamp(patient_id, hash_value, contract=None):
+    """Async ``record_timestamp``."""
+    indexed = await _aindexed_timestamp('record', hash_value, patient_id=patient_id)
+    if indexed is not None:
+        return indexed
+    await _amaybe_watch(contract)
+    if not await cache.aget(_fresh_key(patient_id)):
+        latest = await cache.aget(_latest_key(patient_id))
+        if latest is None:
+            latest = await alatest_record(patient_id, contract) or ()
+            await cache.aset(_latest_key(patient_id), latest, RECORDS_TTL)
+        if not latest:
+            return None
+        if latest[0] == hash_value:
+            return latest[1]
+    return next((ts for h, ts in await arecords(patient_id, contract) if h == hash_value), None)
+
+
+async def aroot_timestamp(root, contract=None):
+    """Async ``root_timestamp``."""
+    indexed = await _aindexed_timestamp('merkle_root', root)
+    if indexed is not None:
+        return indexed
+    key = f'chain_reader:root:{root}'
+    timestamp = await cache.aget(key)
+    if timestamp is None:
+        contract = contract or blockchain.get_async_contract()
+        with span('web3'):
+            timestamp = await contract.functions.rootTimestamps(bytes.fromhex(root)).call()
+        if timestamp:
+            await cache.aset(key, timestamp, None)
+    return timestamp or None
+
+
+async def _aindexed_timestamp(kind, hash_value, **filters):
+    return await (
+        ChainRecord.objects.filter(kind=kind, hash_value=hash_value, **filters)
+        .values_list('timestamp', flat=True).afirst()
+    )
+
+
+async def awatch(contract=None):
+    """Async ``watch``."""
+    contract = contract or blockchain.get_async_contract()
+    with span('web3'):
+        latest = await contract.w3.eth.block_number
+    last = await cache.aget(WATCH_KEY)
+    if last is None:
+        await cache.aset(WATCH_KEY, latest, None)
+        return 0
+    if latest <= last:
+        return 0
+    with span('web3'):
+        events = await contract.events.RecordAdded().get_logs(from_block=last + 1, to_block=latest)
+    for patient_id in {event['args']['patientId'] for event in events}:
+        await cache.adelete_many([_fresh_key(patient_id), _latest_key(patient_id)])
+    await cache.aset(WATCH_KEY, latest, None)
+    return len(events)
+
+
+async def _amaybe_watch(contract=None):
+    global _watched_at
+    # Non-blocking acquire: never stalls the event loop
+    if time.monotonic() - _watched_at < WATCH_INTERVAL or not _watch_lock.acquire(blocking=False):
+        return
+    try:
+        await awatch(contract=contract)
+    except Exception:
+        pass  # node unreachable: serve what is cached, the next call retries
+    finally:
+        _watched_at = time.monotonic()
+        _watch_lock.release()
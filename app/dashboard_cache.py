@@ -0,0 +1,142 @@
+"""
+Per-patient snapshot of what the patient dashboard shows.
+
+``snapshot(patient_id)`` returns the patient, the doctor list, the newest
+visits and history entries, the unread notifications and their count,
+read once and then served from the cache named by
+``PATIENT_DASHBOARD_CACHE`` (local memory by default; point it at a
+file-based or shared cache when several processes serve requests). The
+page itself is still rendered per request, because it carries the CSRF
+token and flash messages.
+
+Every snapshot key carries a per-patient version, and every write that
+touches a patient's rows bumps it once the transaction commits: model
+signals cover ``save``/``delete``, and the few ``QuerySet.update`` paths
+(chain head, anchor tx hash, QR images) call ``invalidate`` themselves.
+A request that read the rows before such a write can only store its
+snapshot under the old version, which nobody reads any more. Doctor
+changes show on every dashboard, so they bump a shared version that is
+part of every key as well.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.shortcuts import get_object_or_404
+
+from .models import Doctor, Patient, PatientHistory, PatientNotification, PatientVisit
+
+CACHE_ALIAS = getattr(settings, 'PATIENT_DASHBOARD_CACHE', 'default')
+CACHE_TIMEOUT = getattr(settings, 'PATIENT_DASHBOARD_TTL', 600)
+DOCTORS_VERSION_KEY = 'patient_dashboard:doctors'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(patient_id, version, doctors_version):
+    return f'patient_dashboard:{patient_id}:{version}:{doctors_version}'
+
+
+def _version_key(patient_id):
+    return f'patient_dashboard:{patient_id}:version'
+
+
+def _versions(cache, patient_id):
+    """``(patient version, doctors version)``, starting missing ones afresh."""
+    keys = [_version_key(patient_id), DOCTORS_VERSION_KEY]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Fresh namespace, so snapshots from before an eviction are never reused
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return found[keys[0]], found[keys[1]]
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass  # no version yet: the next snapshot starts a fresh one
+
+
+def build(patient_id):
+    """Read the dashboard data from the database (Http404 if no such patient)."""
+    from .notifications import unread_count  # notifications imports this module
+
+    patient = get_object_or_404(Patient, id=patient_id)
+    visits = list(patient.visits.select_related('doctor').order_by('-created_at')[:3])
+    return {
+        'patient': patient,
+        'doctors': list(Doctor.objects.all()),
+        'latest_visit': visits[0] if visits else None,
+        'visits': visits,
+        'history_records': list(patient.history_records.order_by('-updated_at')[:3]),
+        'notifications': list(patient.notifications.filter(read=False).order_by('-created_at')[:10]),
+        'unread_count': unread_count(patient.id),
+    }
+
+
+def snapshot(patient_id):
+    """The dashboard context for ``patient_id``, cached until something changes."""
+    cache = _cache()
+    # Versions are read before the rows, so a write committed during build()
+    # leaves this snapshot behind under a key that is already stale
+    key = _key(patient_id, *_versions(cache, patient_id))
+    data = cache.get(key)
+    if data is None:
+        data = build(patient_id)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def invalidate(patient_ids):
+    """Retire the snapshots of ``patient_ids`` once the current transaction commits."""
+    patient_ids = set(patient_ids)
+    if not patient_ids:
+        return
+
+    def bump():
+        cache = _cache()
+        for pk in patient_ids:
+            _bump(cache, _version_key(pk))
+
+    transaction.on_commit(bump)
+
+
+def invalidate_querysets(querysets):
+    """``invalidate`` the patients owning the rows of ``querysets`` (after an ``update``)."""
+    patient_ids = set()
+    for queryset in querysets:
+        field = 'pk' if queryset.model is Patient else 'patient_id'
+        patient_ids.update(queryset.values_list(field, flat=True))
+    invalidate(patient_ids)
+
+
+def _doctors_changed():
+    transaction.on_commit(lambda: _bump(_cache(), DOCTORS_VERSION_KEY))
+
+
+# ---------------------- SIGNAL RECEIVERS ----------------------
+
+@receiver([post_save, post_delete], sender=Patient)
+def _patient_changed(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=PatientVisit)
+@receiver([post_save, post_delete], sender=PatientHistory)
+@receiver([post_save, post_delete], sender=PatientNotification)
+def _patient_row_changed(sender, instance, **kwargs):
+    invalidate([instance.patient_id])
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def _doctor_changed(sender, instance, **kwargs):
+    _doctors_changed()
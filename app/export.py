@@ -0,0 +1,146 @@
+"""
+Streaming export of patients' record chains.
+
+``ndjson()`` yields one JSON line per patient followed by every history
+snapshot and visit of that patient (oldest first, with link hashes, Merkle
+proofs and the anchoring transaction). ``zip_stream()`` packs the same
+lines plus the referenced QR / prescription images into a ZIP written on
+the fly. Rows come from ``iterator(chunk_size=...)`` and output is yielded
+as it is produced, so memory use doesn't depend on how much is exported.
+"""
+
+import heapq
+import json
+import zipfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+
+from . import ledger
+from .models import AnchorJob, Patient, PatientHistory, PatientVisit
+from .storage import content_store
+
+CHUNK_SIZE = 500
+COPY_CHUNK = 64 * 1024
+
+PATIENT_FIELDS = ('id', 'full_name', 'age', 'gender', 'email', 'phone', 'address', 'disease',
+                  'doctor_assigned', 'blockchain_hash', 'tx_hash', 'created_at')
+IMAGE_KEYS = ('qr_code', 'prescription_image')
+ENTRY_FIELDS = ('prev_hash', 'blockchain_hash', 'merkle_root', 'merkle_proof')
+FILE_FIELDS = {PatientHistory: ('qr_code',), PatientVisit: ('qr_code', 'prescription_image')}
+TIME_FIELD = {PatientHistory: 'updated_at', PatientVisit: 'created_at'}
+
+
+def _with_anchor(queryset):
+    """Annotate each row with the transaction that anchored its hash."""
+    jobs = AnchorJob.objects.filter(hash_value=OuterRef('blockchain_hash')).order_by('-id')
+    return queryset.annotate(
+        anchor_tx=Subquery(jobs.values('tx_hash')[:1]),
+        anchor_block=Subquery(jobs.values('block_number')[:1]),
+        anchor_status=Subquery(jobs.values('status')[:1]),
+    )
+
+
+def _entry(row):
+    model = type(row)
+    data = {'type': model._meta.model_name, 'id': row.pk, 'at': getattr(row, TIME_FIELD[model])}
+    data.update({name: getattr(row, name) for name in ledger.CHAIN_FIELDS[model]})
+    data.update({name: getattr(row, name) for name in ENTRY_FIELDS})
+    data.update({name: getattr(row, name).name or None for name in FILE_FIELDS[model]})
+    data['anchor'] = {'tx_hash': row.anchor_tx, 'block_number': row.anchor_block, 'status': row.anchor_status}
+    return data
+
+
+def _timeline(model, order, patient_id):
+    time_field = TIME_FIELD[model]
+    queryset = _with_anchor(model.objects.filter(patient_id=patient_id)).order_by(time_field, 'pk')
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield (getattr(row, time_field), order, row.pk), row
+
+
+def entries(patient_id):
+    """History snapshots and visits of one patient merged oldest first (two streamed queries)."""
+    streams = [_timeline(model, order, patient_id) for order, model in enumerate(TIME_FIELD)]
+    for _, row in heapq.merge(*streams, key=lambda item: item[0]):
+        yield _entry(row)
+
+
+def _patients(patient_ids=None):
+    queryset = Patient.objects.only(*PATIENT_FIELDS, 'qr_code').order_by('pk')
+    if patient_ids is not None:
+        queryset = queryset.filter(pk__in=patient_ids)
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _patient(patient):
+    data = {'type': 'patient'}
+    data.update({name: getattr(patient, name) for name in PATIENT_FIELDS})
+    data['qr_code'] = patient.qr_code.name or None
+    return data
+
+
+def _chain(patient):
+    yield _patient(patient)
+    yield from entries(patient.pk)
+
+
+def _line(data):
+    return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+def ndjson(patient_ids=None):
+    """Yield NDJSON lines for the given patients (all patients by default)."""
+    for patient in _patients(patient_ids):
+        for item in _chain(patient):
+            yield _line(item)
+
+
+class _Sink:
+    """Write-only, non-seekable file that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def zip_stream(patient_ids=None):
+    """
+    Yield a ZIP with ``patients/<id>/records.ndjson`` per patient and every
+    referenced image once under its storage name.
+    """
+    sink = _Sink()
+    written = set()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for patient in _patients(patient_ids):
+            images = []
+            with archive.open(f'patients/{patient.pk}/records.ndjson', 'w') as records:
+                for item in _chain(patient):
+                    records.write(_line(item).encode())
+                    images += [item[key] for key in IMAGE_KEYS if item.get(key)]
+                    yield sink.drain()
+
+            # Blobs are content-addressed and shared, so each goes in once
+            for name in dict.fromkeys(images):
+                if name in written or not content_store.exists(name):
+                    continue
+                written.add(name)
+                # Images are already compressed
+                with content_store.open(name) as src, archive.open(
+                    zipfile.ZipInfo(name), 'w'
+                ) as dst:
+                    for chunk in src.chunks(COPY_CHUNK):
+                        dst.write(chunk)
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
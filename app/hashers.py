@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ProfiledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with its cost taken from ``PASSWORD_HASH_PROFILE``.
+
+    Hashes stay in Django's ``pbkdf2_sha256`` format with the iteration count
+    embedded, so changing the profile never invalidates stored passwords;
+    identity.verify() re-hashes them at the new cost on the next login.
+    """
+
+    @property
+    def iterations(self):
+        profiles = getattr(settings, 'PASSWORD_HASH_PROFILES', {})
+        profile = getattr(settings, 'PASSWORD_HASH_PROFILE', 'default')
+        return profiles.get(profile, PBKDF2PasswordHasher.iterations)
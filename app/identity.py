@@ -0,0 +1,112 @@
+"""
+Unified login lookup across patients and doctors.
+
+LoginIdentity mirrors the email, name and password hash of every Patient
+and Doctor (kept current by the signal receivers below), so ``lookup()``
+answers "who owns this email?" with one indexed query instead of trying the
+Patient table and then the Doctor table. Emails are compared lowercased
+(``normalize_email``), however the account or the login form spelled them. Saves that leave the mirrored
+fields alone (chain head, QR code, visits...) don't touch it.
+"""
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Doctor, LoginIdentity, Patient
+
+ROLE_MODELS = {'patient': Patient, 'doctor': Doctor}
+ROLE_PRIORITY = ['patient', 'doctor']  # same email on both: patient wins, as before
+IDENTITY_FIELDS = ('email', 'full_name', 'password', 'is_password_set')
+
+
+def normalize_email(email):
+    """The form emails are stored and matched in: trimmed and lowercased ('' if missing)."""
+    return (email or '').strip().lower()
+
+
+def lookup(email):
+    """The LoginIdentity for ``email`` (any case), or ``None``."""
+    email = normalize_email(email)
+    if not email:
+        return None
+    rows = {row.role: row for row in LoginIdentity.objects.filter(email=email)}
+    return next((rows[role] for role in ROLE_PRIORITY if role in rows), None)
+
+
+def account(role, email):
+    """The Patient or Doctor (per ``role``) registered under ``email`` (any case), or ``None``."""
+    email = normalize_email(email)
+    user_id = (
+        LoginIdentity.objects.filter(role=role, email=email).values_list('user_id', flat=True).first()
+        if email else None
+    )
+    return ROLE_MODELS[role].objects.filter(pk=user_id).first() if user_id is not None else None
+
+
+def verify(identity, raw_password):
+    """
+    Check ``raw_password`` against the stored hash. A hash made with an older
+    cost profile is upgraded in place after a successful check.
+    """
+    def upgrade(raw):
+        encoded = make_password(raw)
+        ROLE_MODELS[identity.role].objects.filter(pk=identity.user_id).update(password=encoded)
+        LoginIdentity.objects.filter(pk=identity.pk).update(password=encoded)
+
+    return check_password(raw_password, identity.password, setter=upgrade)
+
+
+def sync(role, account):
+    LoginIdentity.objects.update_or_create(
+        role=role, user_id=account.pk,
+        defaults={
+            'email': normalize_email(account.email),
+            'full_name': account.full_name,
+            'password': account.password,
+            'is_password_set': account.is_password_set,
+        },
+    )
+
+
+def sync_many(role, accounts):
+    """Index freshly bulk-created accounts (bulk_create sends no signals)."""
+    LoginIdentity.objects.bulk_create([
+        LoginIdentity(role=role, user_id=a.pk, email=normalize_email(a.email), full_name=a.full_name,
+                      password=a.password, is_password_set=a.is_password_set)
+        for a in accounts
+    ])
+
+
+def _loaded(account):
+    # Deferred fields are absent from __dict__ and read as None
+    return tuple(account.__dict__.get(name) for name in IDENTITY_FIELDS)
+
+
+def _identity_changed(account, created, update_fields):
+    if created:
+        return True
+    if update_fields is not None and not update_fields.intersection(IDENTITY_FIELDS):
+        return False
+    return _loaded(account) != account._identity_loaded
+
+
+@receiver(post_init, sender=Patient)
+@receiver(post_init, sender=Doctor)
+def _remember_identity(sender, instance, **kwargs):
+    instance._identity_loaded = _loaded(instance)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Doctor)
+def _account_saved(sender, instance, created, update_fields, **kwargs):
+    if _identity_changed(instance, created, update_fields):
+        sync('patient' if sender is Patient else 'doctor', instance)
+    instance._identity_loaded = _loaded(instance)
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Doctor)
+def _account_deleted(sender, instance, **kwargs):
+    role = 'patient' if sender is Patient else 'doctor'
+    LoginIdentity.objects.filter(role=role, user_id=instance.pk).delete()
@@ -0,0 +1,84 @@
+"""
+Mirror PatientRecords events into the local ChainRecord table.
+
+``run_once()`` reads ``RecordAdded`` and ``MerkleRootAdded`` logs for the
+blocks after the stored checkpoint, in ranges of ``batch_blocks``, and saves
+one row per event together with the new checkpoint in one transaction, so
+an interrupted run resumes exactly where it stopped and re-reading a range
+never duplicates rows. Blocks younger than ``confirmations`` are left for a
+later pass in case the node reorganises them.
+"""
+
+from django.conf import settings
+from django.db import transaction
+
+from . import chain_reader
+from .models import ChainCheckpoint, ChainRecord
+
+CHECKPOINT = 'patient_records'
+BATCH_BLOCKS = getattr(settings, 'CHAIN_INDEXER_BATCH_BLOCKS', 1000)
+CONFIRMATIONS = getattr(settings, 'CHAIN_INDEXER_CONFIRMATIONS', 0)
+
+
+def checkpoint():
+    """Last indexed block number, or -1 before the first run."""
+    row = ChainCheckpoint.objects.filter(name=CHECKPOINT).first()
+    return row.block_number if row else -1
+
+
+def _record_row(event):
+    args = event['args']
+    return ChainRecord(
+        kind='record', patient_id=args['patientId'], hash_value=args['hashValue'],
+        timestamp=args['timestamp'], **_position(event),
+    )
+
+
+def _root_row(event):
+    args = event['args']
+    return ChainRecord(
+        kind='merkle_root', hash_value=bytes(args['root']).hex(), leaf_count=args['leafCount'],
+        timestamp=args['timestamp'], **_position(event),
+    )
+
+
+def _position(event):
+    tx_hash = event['transactionHash']
+    return {
+        'block_number': event['blockNumber'],
+        'tx_hash': tx_hash if isinstance(tx_hash, str) else '0x' + bytes(tx_hash).hex(),
+        'log_index': event['logIndex'],
+    }
+
+
+def index_range(contract, from_block, to_block):
+    """Store the events of ``from_block..to_block`` and move the checkpoint; returns rows added."""
+    rows = [_record_row(e) for e in contract.events.RecordAdded().get_logs(from_block=from_block, to_block=to_block)]
+    rows += [_root_row(e) for e in contract.events.MerkleRootAdded().get_logs(from_block=from_block, to_block=to_block)]
+
+    with transaction.atomic():
+        # Events already stored by an earlier pass, found through the
+        # (tx_hash, log_index) unique index rather than counting the table
+        stored = set(
+            ChainRecord.objects.filter(tx_hash__in={row.tx_hash for row in rows})
+            .values_list('tx_hash', 'log_index')
+        ) if rows else set()
+        new_rows = [row for row in rows if (row.tx_hash, row.log_index) not in stored]
+        # ignore_conflicts still guards against another indexer racing this one
+        ChainRecord.objects.bulk_create(new_rows, ignore_conflicts=True)
+        ChainCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'block_number': to_block})
+    added = len(new_rows)
+
+    for patient_id in {row.patient_id for row in rows if row.patient_id is not None}:
+        chain_reader.invalidate(patient_id)
+    return added
+
+
+def run_once(contract, batch_blocks=BATCH_BLOCKS, confirmations=CONFIRMATIONS, from_block=None):
+    """Index every confirmed block after the checkpoint; returns ``(rows added, last block)``."""
+    head = contract.w3.eth.block_number - confirmations
+    start = checkpoint() + 1 if from_block is None else from_block
+    added = 0
+    for low in range(start, head + 1, batch_blocks):
+        added += index_range(contract, low, min(low + batch_blocks - 1, head))
+    return added, max(head, start - 1)
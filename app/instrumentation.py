@@ -0,0 +1,192 @@
+"""
+Per-request timing spans and process-wide metrics.
+
+``span(name)`` times a block of work. Inside a request handled by
+``InstrumentationMiddleware`` the time is added to that request's spans
+(reported back in a ``Server-Timing`` header); every span is also added to
+the process-wide totals that ``metrics_view`` serves in Prometheus text
+format. Database time and query counts are captured for every connection
+through ``execute_wrapper``. Work done in background pools (QR rendering)
+has no request and is labelled ``view="background"``.
+
+Metrics are per worker process; Prometheus sums them across workers.
+"""
+
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+BACKGROUND = 'background'
+# Upper bounds (seconds) of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('instrumentation_request', default=None)
+_lock = threading.Lock()
+_requests = defaultdict(lambda: {'count': 0, 'sum': 0.0, 'buckets': [0] * len(BUCKETS), 'queries': 0})
+_spans = defaultdict(lambda: [0.0, 0])  # (view, span) -> [seconds, calls]
+
+
+class RequestTimings:
+    def __init__(self):
+        self.view = 'unresolved'  # resolved once the response is back
+        self.spans = defaultdict(lambda: [0.0, 0])
+
+    def add(self, name, seconds):
+        entry = self.spans[name]
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def _record_span(name, seconds):
+    request = _current.get()
+    if request is not None:
+        request.add(name, seconds)  # folded into the totals when it ends
+        return
+    with _lock:
+        entry = _spans[(BACKGROUND, name)]
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as span ``name`` (db, web3, qrcode, storage, hash...)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(name, time.perf_counter() - started)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    with span('db'):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def _collect():
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(_db_wrapper))
+            yield timings
+    finally:
+        _current.reset(token)
+
+
+class InstrumentationMiddleware:
+    """Collect spans for each request and report them in ``Server-Timing``."""
+
+    sync_capable = True
+    async_capable = True  # keeps async views on the event loop under ASGI
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with _collect() as timings:
+            response = self.get_response(request)
+        return self._report(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with _collect() as timings:
+            response = await self.get_response(request)
+        return self._report(request, response, timings, time.perf_counter() - started)
+
+    def _report(self, request, response, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        timings.view = match.view_name if match and match.view_name else 'unresolved'
+        _record_request(timings, elapsed)
+        response['Server-Timing'] = server_timing(timings, elapsed)
+        return response
+
+
+def server_timing(timings, elapsed):
+    parts = []
+    for name, (seconds, calls) in sorted(timings.spans.items()):
+        unit = 'queries' if name == 'db' else 'calls'
+        parts.append(f'{name};dur={seconds * 1000:.1f};desc="{calls} {unit}"')
+    parts.append(f'total;dur={elapsed * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def _record_request(timings, elapsed):
+    with _lock:
+        stats = _requests[timings.view]
+        stats['count'] += 1
+        stats['sum'] += elapsed
+        stats['queries'] += timings.spans['db'][1] if 'db' in timings.spans else 0
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                stats['buckets'][i] += 1
+        for name, (seconds, calls) in timings.spans.items():
+            entry = _spans[(timings.view, name)]
+            entry[0] += seconds
+            entry[1] += calls
+
+
+def prometheus_text():
+    """Current process metrics in the Prometheus text exposition format."""
+    lines = [
+        '# HELP app_request_duration_seconds Time spent handling requests.',
+        '# TYPE app_request_duration_seconds histogram',
+    ]
+    with _lock:
+        requests = {view: dict(stats, buckets=list(stats['buckets'])) for view, stats in _requests.items()}
+        spans = {key: list(value) for key, value in _spans.items()}
+
+    for view, stats in sorted(requests.items()):
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append(f'app_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+        lines.append(f'app_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'app_request_duration_seconds_sum{{view="{view}"}} {stats["sum"]:.6f}')
+        lines.append(f'app_request_duration_seconds_count{{view="{view}"}} {stats["count"]}')
+
+    lines += ['# HELP app_db_queries_total Database queries issued by requests.',
+              '# TYPE app_db_queries_total counter']
+    for view, stats in sorted(requests.items()):
+        lines.append(f'app_db_queries_total{{view="{view}"}} {stats["queries"]}')
+
+    lines += ['# HELP app_span_seconds_total Time spent in instrumented spans.',
+              '# TYPE app_span_seconds_total counter']
+    for (view, name), (seconds, _) in sorted(spans.items()):
+        lines.append(f'app_span_seconds_total{{view="{view}",span="{name}"}} {seconds:.6f}')
+    lines += ['# HELP app_span_calls_total Number of instrumented span executions.',
+              '# TYPE app_span_calls_total counter']
+    for (view, name), (_, calls) in sorted(spans.items()):
+        lines.append(f'app_span_calls_total{{view="{view}",span="{name}"}} {calls}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; guarded by METRICS_TOKEN when it is set."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not constant_time_compare(supplied, token):
+            return HttpResponseForbidden('Forbidden')
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def reset():
+    """Forget all collected metrics (tests)."""
+    with _lock:
+        _requests.clear()
+        _spans.clear()
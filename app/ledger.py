@@ -0,0 +1,204 @@
+"""
+Chained-hash ledger for patient records.
+
+Every PatientHistory snapshot and PatientVisit is an entry of a per-patient
+chain. An entry stores the head it was appended to (``prev_hash``) and its
+own link hash ``sha256(prev_hash || canonical(entry))`` in
+``blockchain_hash``. The current head lives on ``Patient.blockchain_hash``,
+so appending an entry costs O(1) no matter how long the history is.
+"""
+
+import datetime
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import transaction
+
+from . import anchoring, dashboard_cache
+from .instrumentation import span
+from .models import Patient, PatientHistory, PatientVisit
+
+# Head of a patient that has no entries yet
+GENESIS_HASH = "0" * 64
+
+# Fields committed to the chain for each entry type (order is irrelevant,
+# the canonical form sorts keys)
+CHAIN_FIELDS = {
+    PatientHistory: (
+        "patient_id", "full_name", "age", "gender", "email",
+        "phone", "address", "disease", "doctor_assigned",
+    ),
+    PatientVisit: (
+        "patient_id", "doctor_id", "visit_date", "follow_up_date",
+        "symptoms", "diagnosis", "tests", "prescription", "notes",
+    ),
+}
+
+
+def _normalize(field, value):
+    """Coerce raw form input and DB values to the same canonical value."""
+    if value == "":
+        value = None
+    if value is not None:
+        value = field.to_python(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def canonical(entry):
+    """Canonical byte form of a history/visit entry (saved or not)."""
+    model = type(entry)
+    payload = {"type": model._meta.model_name}
+    for name in CHAIN_FIELDS[model]:
+        field = model._meta.get_field(name.removesuffix("_id"))
+        if name.endswith("_id"):
+            field = field.target_field
+        payload[name] = _normalize(field, getattr(entry, name))
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+
+def link_hash(prev_hash, entry):
+    """sha256(prev_hash || canonical(entry)) as hex."""
+    with span('hash'):
+        digest = hashlib.sha256(prev_hash.encode())
+        digest.update(canonical(entry))
+        return digest.hexdigest()
+
+
+def append_entry(patient, entry, anchor=False):
+    """
+    Link ``entry`` onto the patient's chain and save it.
+
+    The head is re-read under a row lock and moved in the same
+    transaction, so concurrent writers extend the chain instead of forking
+    it. The same UPDATE clears ``tx_hash`` and ``qr_code``, which described
+    the old head, so the anchor worker and the QR renderer can only fill them
+    in after this commit. With ``anchor`` the AnchorJob for the new hash is
+    queued in that transaction too, so no entry is committed without one.
+    The new head is refreshed on ``patient`` in memory as well.
+    """
+    with transaction.atomic():
+        head = (
+            Patient.objects.select_for_update()
+            .filter(pk=patient.pk)
+            .values_list("blockchain_hash", flat=True)
+            .first()
+        )
+        entry.prev_hash = head or GENESIS_HASH
+        entry.blockchain_hash = link_hash(entry.prev_hash, entry)
+        entry.save()
+        Patient.objects.filter(pk=patient.pk).update(
+            blockchain_hash=entry.blockchain_hash, tx_hash=None, qr_code=None,
+        )
+        dashboard_cache.invalidate([patient.pk])
+        if anchor:
+            anchoring.enqueue(patient, entry.blockchain_hash)
+    patient.blockchain_hash = entry.blockchain_hash
+    patient.tx_hash = None
+    patient.qr_code = None
+    return entry.blockchain_hash
+
+
+@dataclass
+class ChainVerification:
+    ok: bool
+    checked: int
+    head: Optional[str]
+    broken_at: Optional[str] = None
+    reason: str = ""
+
+
+def find_entry(hash_value):
+    """The history snapshot or visit whose link hash is ``hash_value``, or ``None``."""
+    for model in CHAIN_FIELDS:
+        entry = model.objects.filter(blockchain_hash=hash_value).first()
+        if entry is not None:
+            return entry
+    return None
+
+
+async def afind_entry(hash_value):
+    """Async ``find_entry``."""
+    for model in CHAIN_FIELDS:
+        entry = await model.objects.filter(blockchain_hash=hash_value).afirst()
+        if entry is not None:
+            return entry
+    return None
+
+
+async def asuccessors(patient_id, hash_value):
+    """
+    The entries linked after ``hash_value`` on the patient's chain, oldest
+    first, up to the head or the first entry that no longer matches its
+    link hash (included, so callers can tell the walk was cut short).
+    """
+    by_prev = {}
+    for model in CHAIN_FIELDS:
+        async for entry in model.objects.filter(patient_id=patient_id, prev_hash__isnull=False):
+            by_prev[entry.prev_hash] = entry
+
+    chain, current = [], hash_value
+    while current in by_prev:
+        entry = by_prev.pop(current)
+        chain.append(entry)
+        if link_hash(current, entry) != entry.blockchain_hash:
+            break
+        current = entry.blockchain_hash
+    return chain
+
+
+def entry_intact(entry):
+    """
+    True if the entry's stored content still hashes to its link hash, False
+    if it was altered, None for legacy rows written before chaining.
+    """
+    if entry.prev_hash is None:
+        return None
+    return link_hash(entry.prev_hash, entry) == entry.blockchain_hash
+
+
+def _chain_entries(patient):
+    for model, fields in CHAIN_FIELDS.items():
+        qs = model.objects.filter(patient=patient, prev_hash__isnull=False)
+        yield from qs.only("prev_hash", "blockchain_hash", *fields).iterator()
+
+
+def verify_chain(patient, checkpoint=None):
+    """
+    Re-walk a patient's chain from ``checkpoint`` up to the stored head.
+
+    ``checkpoint`` is any hash previously known to be good (an anchored
+    hash, a QR hash, ...). Without it the walk starts at the genesis of the
+    chain, or at the legacy head for patients created before chaining.
+    """
+    by_prev = {}
+    for entry in _chain_entries(patient):
+        by_prev[entry.prev_hash] = entry
+
+    if checkpoint is None:
+        link_hashes = {e.blockchain_hash for e in by_prev.values()}
+        roots = [h for h in by_prev if h not in link_hashes]
+        checkpoint = roots[0] if len(roots) == 1 else GENESIS_HASH
+
+    current, checked = checkpoint, 0
+    while current in by_prev:
+        entry = by_prev.pop(current)
+        if link_hash(current, entry) != entry.blockchain_hash:
+            return ChainVerification(
+                False, checked, patient.blockchain_hash,
+                broken_at=entry.blockchain_hash,
+                reason=f"{type(entry).__name__} #{entry.pk} does not match its hash",
+            )
+        current = entry.blockchain_hash
+        checked += 1
+
+    if current != (patient.blockchain_hash or GENESIS_HASH):
+        return ChainVerification(
+            False, checked, patient.blockchain_hash,
+            broken_at=current,
+            reason="chain does not reach the patient head",
+        )
+    return ChainVerification(True, checked, patient.blockchain_hash)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import anchoring, blockchain, nonces
+
+
+class Command(BaseCommand):
+    help = "Drain the blockchain anchoring queue (AnchorJob) into PatientRecords.addRecord"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single pass and exit")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between passes")
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        web3 = blockchain.get_web3()
+        contract = blockchain.get_contract()
+        account_address = blockchain.ACCOUNT_ADDRESS
+
+        # Other tools may have used the account since the last run
+        nonces.resync(account_address)
+
+        while True:
+            if not blockchain.health()['connected']:
+                # Node is down: don't burn retry attempts until it is back
+                if options['once']:
+                    self.stderr.write(f"Blockchain node unreachable at {blockchain.RPC_URL}")
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            stats = anchoring.drain(
+                web3, contract, account_address, blockchain.PRIVATE_KEY, options['batch_size']
+            )
+            if any(stats.values()):
+                self.stdout.write(
+                    f"sent={stats['sent']} failed={stats['failed']} confirmed={stats['confirmed']}"
+                )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,75 @@
+import json
+import platform
+import time
+from dataclasses import asdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from app import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database and measure latency / queries / memory of the "
+            "record-save, dashboard and verification paths")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='1k', help="Patients to seed: 1k, 100k, 1m or a number")
+        parser.add_argument('--iterations', type=int, default=50, help="Requests per scenario")
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help="Only run this scenario (repeatable)")
+        parser.add_argument('--output', help="Write the report as JSON (e.g. to store a baseline)")
+        parser.add_argument('--baseline', help="Compare with a report written by --output")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 / query-count growth over the baseline (0.2 = 20%%)")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        patients = benchmarks.parse_scale(options['scale'])
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            started = time.perf_counter()
+            counts = benchmarks.seed(patients)
+            self.stdout.write(
+                f"Seeded {counts['patients']} patients, {counts['doctors']} doctors, "
+                f"{counts['history']} history rows, {counts['visits']} visits "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+            results = benchmarks.run(options['iterations'], options['scenarios'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'scenario':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+                          f"{'queries':>9}{'peak KiB':>10}")
+        for r in results:
+            self.stdout.write(f"{r.scenario:<22}{r.p50_ms:>9}{r.p95_ms:>9}{r.p99_ms:>9}{r.max_ms:>9}"
+                              f"{r.queries:>9}{r.peak_kib:>10}")
+
+        report = {
+            'scale': patients,
+            'iterations': options['iterations'],
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'results': [asdict(r) for r in results],
+        }
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                json.dump(report, out, indent=2)
+
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read baseline: {e}")
+            regressions = benchmarks.compare(results, baseline, options['tolerance'])
+            for scenario, metric, before, now, change in regressions:
+                self.stderr.write(f"REGRESSION {scenario} {metric}: {before} -> {now} (+{change:.0%})")
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+            elif options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} regression(s) against the baseline")
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from app import export
+
+
+class Command(BaseCommand):
+    help = "Stream patients' full record chains as NDJSON or a ZIP with images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', dest='patients',
+                            help="Patient id to export (repeatable; default: every patient)")
+        parser.add_argument('--format', choices=['ndjson', 'zip'], default='ndjson')
+        parser.add_argument('--output', default='-', help="Output file ('-' for stdout)")
+
+    def handle(self, *args, **options):
+        if options['format'] == 'zip':
+            chunks = export.zip_stream(options['patients'])
+        else:
+            chunks = (line.encode() for line in export.ndjson(options['patients']))
+
+        out = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
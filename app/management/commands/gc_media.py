@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.storage import content_store, refcounts
+
+# Folders holding blobs that rows reference by name
+MEDIA_FOLDERS = ['qrcodes', 'qrcodes/history', 'prescriptions']
+
+
+class Command(BaseCommand):
+    help = "Delete QR / prescription files that no Patient, PatientVisit or PatientHistory references"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+        parser.add_argument(
+            '--grace', type=int, default=3600,
+            help="Keep unreferenced files younger than this many seconds (QR renders in flight)",
+        )
+
+    def handle(self, *args, **options):
+        refs = refcounts()
+        cutoff = time.time() - options['grace']
+        kept = deleted = freed = 0
+
+        for folder in MEDIA_FOLDERS:
+            if not content_store.exists(folder):
+                continue
+            _, files = content_store.listdir(folder)
+            for filename in files:
+                name = f"{folder}/{filename}"
+                if refs[name]:
+                    kept += 1
+                    continue
+                path = content_store.path(name)
+                if os.path.getmtime(path) > cutoff:
+                    kept += 1
+                    continue
+                freed += os.path.getsize(path)
+                deleted += 1
+                if not options['dry_run']:
+                    content_store.delete(name)
+                self.stdout.write(f"{'would delete' if options['dry_run'] else 'deleted'} {name}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(refs)} referenced blobs, {kept} files kept, {deleted} unreferenced "
+            f"({freed / 1024:.1f} KiB){' [dry run]' if options['dry_run'] else ''}"
+        ))
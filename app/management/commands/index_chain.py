@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from web3.exceptions import Web3Exception
+
+from app import blockchain, indexer
+
+# Node gone or misbehaving (requests' connection errors are OSErrors)
+RPC_ERRORS = (OSError, Web3Exception)
+
+
+class Command(BaseCommand):
+    help = "Mirror PatientRecords RecordAdded / MerkleRootAdded events into ChainRecord"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Index up to the current block and exit")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between polls")
+        parser.add_argument('--batch-blocks', type=int, default=indexer.BATCH_BLOCKS,
+                            help="Blocks per eth_getLogs request")
+        parser.add_argument('--confirmations', type=int, default=indexer.CONFIRMATIONS,
+                            help="Leave this many newest blocks for a later pass")
+        parser.add_argument('--from-block', type=int, default=None,
+                            help="Re-index from this block instead of the stored checkpoint")
+
+    def handle(self, *args, **options):
+        contract = blockchain.get_contract()
+        from_block = options['from_block']
+
+        refresh = False
+        while True:
+            if not blockchain.health(refresh)['connected']:
+                if options['once']:
+                    self.stderr.write(f"Blockchain node unreachable at {blockchain.RPC_URL}")
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            try:
+                added, block = indexer.run_once(
+                    contract, options['batch_blocks'], options['confirmations'], from_block
+                )
+            except RPC_ERRORS as e:
+                # The node dropped inside the health cache window. Every range
+                # commits with its checkpoint, so the next pass resumes here.
+                self.stderr.write(f"Indexing interrupted: {e}")
+                if options['once']:
+                    break
+                refresh = True  # wait on a fresh health check, not the cached one
+                time.sleep(options['interval'])
+                continue
+            refresh = False
+            from_block = None  # only the first pass honours --from-block
+            if added or options['once']:
+                self.stdout.write(f"indexed={added} block={block}")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from app import notifications
+
+
+class Command(BaseCommand):
+    help = "Delete read patient notifications past the retention period, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=notifications.RETENTION_DAYS,
+            help="Keep read notifications younger than this many days",
+        )
+        parser.add_argument('--batch-size', type=int, default=notifications.PURGE_BATCH,
+                            help="Rows deleted per transaction")
+        parser.add_argument('--archive', metavar='PATH',
+                            help="Append the deleted rows to this file as JSON lines first")
+
+    def handle(self, *args, **options):
+        archive = open(options['archive'], 'a', encoding='utf-8') if options['archive'] else None
+        try:
+            deleted = notifications.purge_read(options['days'], options['batch_size'], archive=archive)
+        finally:
+            if archive is not None:
+                archive.close()
+        where = f", archived to {options['archive']}" if archive is not None else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} read notifications older than {options['days']} days{where}"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app import stats
+
+
+class Command(BaseCommand):
+    help = "Recount dashboard counters (StatCounter) from the source tables"
+
+    def handle(self, *args, **options):
+        values = stats.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {len(values) - 1} counters: {values['patients']} patients, "
+            f"{values['doctors']} doctors, {values['appointments']} appointments"
+        ))
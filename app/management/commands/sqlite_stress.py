@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from app import sqlite
+
+
+class Command(BaseCommand):
+    help = ("Replay concurrent record saves against a scratch SQLite file, with the "
+            "default settings and with the app/sqlite.py tuning, and compare throughput")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent writer threads")
+        parser.add_argument('--operations', type=int, default=200, help="Record saves per worker")
+
+    def handle(self, *args, **options):
+        results = [sqlite.stress(tuned, options['workers'], options['operations']) for tuned in (False, True)]
+        self.stdout.write(f"{'mode':<8}{'committed':>11}{'locked':>9}{'seconds':>10}{'saves/s':>10}")
+        for r in results:
+            self.stdout.write(f"{r.mode:<8}{r.committed:>11}{r.locked:>9}{r.seconds:>10.2f}{r.per_second:>10.1f}")
+        before, after = results
+        if after.locked:
+            self.stdout.write(self.style.WARNING(f"{after.locked} saves still hit a locked database"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"All {after.committed} saves committed; {before.locked} failed with 'database is locked' before"
+            ))
@@ -0,0 +1,63 @@
+"""
+Binary Merkle tree over record hashes for batched anchoring.
+
+Leaves and inner nodes are domain-separated (``0x00`` / ``0x01`` prefix) so
+an inner node can never be passed off as a leaf. An odd node at the end of
+a level is promoted unchanged. A proof is a list of ``[side, sibling_hex]``
+pairs from the leaf upwards, ``side`` being where the sibling sits ("L"/"R").
+"""
+
+import hashlib
+
+
+def _leaf(value):
+    return hashlib.sha256(b"\x00" + bytes.fromhex(value)).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build(values):
+    """
+    Build the tree for a list of hex hashes.
+
+    Returns ``(root_hex, proofs)`` where ``proofs[i]`` proves ``values[i]``.
+    """
+    if not values:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+
+    level = [_leaf(v) for v in values]
+    proofs = [[] for _ in values]
+    # Leaf indexes covered by each node of the current level
+    members = [[i] for i in range(len(values))]
+
+    while len(level) > 1:
+        next_level, next_members = [], []
+        for i in range(0, len(level) - 1, 2):
+            left, right = level[i], level[i + 1]
+            for leaf in members[i]:
+                proofs[leaf].append(["R", right.hex()])
+            for leaf in members[i + 1]:
+                proofs[leaf].append(["L", left.hex()])
+            next_level.append(_node(left, right))
+            next_members.append(members[i] + members[i + 1])
+        if len(level) % 2:
+            next_level.append(level[-1])
+            next_members.append(members[-1])
+        level, members = next_level, next_members
+
+    return level[0].hex(), proofs
+
+
+def root_from_proof(value, proof):
+    """Recompute the root implied by ``value`` and its proof."""
+    node = _leaf(value)
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        node = _node(sibling, node) if side == "L" else _node(node, sibling)
+    return node.hex()
+
+
+def verify(value, proof, root):
+    return root_from_proof(value, proof) == root
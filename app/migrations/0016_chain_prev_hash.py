@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_patientvisit_sent_to_patient_patientnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patienthistory',
+            name='prev_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='patientvisit',
+            name='prev_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
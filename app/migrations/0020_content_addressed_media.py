@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:39
+
+import app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_accountnonce'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patient',
+            name='qr_code',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_content_store, upload_to='qrcodes/'),
+        ),
+        migrations.AlterField(
+            model_name='patienthistory',
+            name='qr_code',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_content_store, upload_to='qrcodes/history/'),
+        ),
+        migrations.AlterField(
+            model_name='patientvisit',
+            name='prescription_image',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_content_store, upload_to='prescriptions/'),
+        ),
+        migrations.AlterField(
+            model_name='patientvisit',
+            name='qr_code',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_content_store, upload_to='qrcodes/'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_statcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='anchorjob',
+            index=models.Index(fields=['status', 'tx_hash'], name='anchor_status_tx_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date'], name='appt_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date'], name='appt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['created_at'], name='appt_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['created_at'], name='doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['full_name'], name='doctor_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['experience'], name='doctor_experience_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorrequest',
+            index=models.Index(fields=['doctor', 'status', 'patient'], name='request_doctor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorrequest',
+            index=models.Index(fields=['patient', 'doctor', 'status'], name='request_patient_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at'], name='patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['full_name'], name='patient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['age'], name='patient_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthistory',
+            index=models.Index(fields=['patient', 'updated_at'], name='history_patient_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthistory',
+            index=models.Index(fields=['blockchain_hash'], name='history_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientnotification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['patient', 'created_at'], name='notif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['patient', 'created_at'], name='visit_patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['doctor', 'created_at'], name='visit_doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['blockchain_hash'], name='visit_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    LoginIdentity = apps.get_model('app', 'LoginIdentity')
+    for role, model_name in (('patient', 'Patient'), ('doctor', 'Doctor')):
+        model = apps.get_model('app', model_name)
+        LoginIdentity.objects.bulk_create([
+            LoginIdentity(role=role, user_id=pk, email=email, full_name=full_name,
+                          password=password, is_password_set=is_password_set)
+            for pk, email, full_name, password, is_password_set in model.objects.values_list(
+                'pk', 'email', 'full_name', 'password', 'is_password_set').iterator()
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+                ('role', models.CharField(choices=[('patient', 'Patient'), ('doctor', 'Doctor')], max_length=10)),
+                ('user_id', models.BigIntegerField()),
+                ('full_name', models.CharField(max_length=100)),
+                ('password', models.CharField(blank=True, max_length=128, null=True)),
+                ('is_password_set', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('role', 'user_id'), name='identity_role_user_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_login_identity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChainRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('record', 'Record'), ('merkle_root', 'Merkle root')], default='record', max_length=20)),
+                ('patient_id', models.BigIntegerField(blank=True, null=True)),
+                ('hash_value', models.CharField(max_length=255)),
+                ('leaf_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('timestamp', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hash_value'], name='chainrecord_hash_idx'), models.Index(fields=['patient_id', 'block_number'], name='chainrecord_patient_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='chainrecord_event_uniq')],
+            },
+        ),
+    ]
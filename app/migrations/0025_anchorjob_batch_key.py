@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_chain_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anchorjob',
+            name='batch_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
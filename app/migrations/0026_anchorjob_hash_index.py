@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_anchorjob_batch_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='anchorjob',
+            index=models.Index(fields=['hash_value'], name='anchor_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+from django.db import migrations
+from django.db.models.functions import Lower, Trim
+
+
+def normalize(apps, schema_editor):
+    # app.identity matches logins on the trimmed, lowercased email
+    LoginIdentity = apps.get_model('app', 'LoginIdentity')
+    LoginIdentity.objects.update(email=Lower(Trim('email')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_notification_read_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+    ]
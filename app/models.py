@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 
+from .storage import get_content_store
+
 # ---------------------- PATIENT MODEL ----------------------
 class Patient(models.Model):
     GENDER_CHOICES = [
@@ -20,7 +23,7 @@ class Patient(models.Model):
 
     # 🧩 Blockchain + QR Fields
     blockchain_hash = models.CharField(max_length=255, blank=True, null=True)
-    qr_code = models.ImageField(upload_to='qrcodes/', blank=True, null=True)
+    qr_code = models.ImageField(upload_to='qrcodes/', blank=True, null=True, storage=get_content_store)
     tx_hash = models.CharField(max_length=255, blank=True, null=True)
 
     # 🧩 NEW FIELD — Password (added for patient login)
@@ -29,6 +32,13 @@ class Patient(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='patient_created_idx'),
+            models.Index(fields=['full_name'], name='patient_name_idx'),
+            models.Index(fields=['age'], name='patient_age_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -58,6 +68,13 @@ class Doctor(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='doctor_created_idx'),
+            models.Index(fields=['full_name'], name='doctor_name_idx'),
+            models.Index(fields=['experience'], name='doctor_experience_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -88,6 +105,13 @@ class Appointment(models.Model):
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'date'], name='appt_status_date_idx'),
+            models.Index(fields=['date'], name='appt_date_idx'),
+            models.Index(fields=['created_at'], name='appt_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.patient.full_name} with {self.doctor.full_name} on {self.date}"
 
@@ -112,9 +136,18 @@ class PatientHistory(models.Model):
     disease = models.TextField(blank=True, null=True)
     doctor_assigned = models.CharField(max_length=100, blank=True, null=True)
     blockchain_hash = models.CharField(max_length=255, blank=True, null=True)
-    qr_code = models.ImageField(upload_to='qrcodes/history/', blank=True, null=True)
+    prev_hash = models.CharField(max_length=64, blank=True, null=True)  # 🔗 previous chain head
+    merkle_root = models.CharField(max_length=64, blank=True, null=True)  # 🌳 batch root anchored on-chain
+    merkle_proof = models.JSONField(blank=True, null=True)
+    qr_code = models.ImageField(upload_to='qrcodes/history/', blank=True, null=True, storage=get_content_store)
     updated_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'updated_at'], name='history_patient_updated_idx'),
+            models.Index(fields=['blockchain_hash'], name='history_hash_idx'),
+        ]
+
     def __str__(self):
         return f"History of {self.patient.full_name} at {self.updated_at.strftime('%Y-%m-%d %H:%M')}"
 
@@ -129,6 +162,13 @@ class DoctorRequest(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Pending list + latest-accepted-per-patient read only this index
+            models.Index(fields=['doctor', 'status', 'patient'], name='request_doctor_status_idx'),
+            models.Index(fields=['patient', 'doctor', 'status'], name='request_patient_doctor_idx'),
+        ]
+
     def __str__(self):
         return f"{self.patient.full_name} -> {self.doctor.full_name} ({self.status})"
 
@@ -145,16 +185,26 @@ class PatientVisit(models.Model):
     prescription = models.TextField(blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
 
-    prescription_image = models.ImageField(upload_to='prescriptions/', blank=True, null=True)
+    prescription_image = models.ImageField(upload_to='prescriptions/', blank=True, null=True, storage=get_content_store)
 
     # ADD THIS 👇👇👇
-    qr_code = models.ImageField(upload_to='qrcodes/', blank=True, null=True)
+    qr_code = models.ImageField(upload_to='qrcodes/', blank=True, null=True, storage=get_content_store)
 
     blockchain_hash = models.CharField(max_length=255, blank=True, null=True)
+    prev_hash = models.CharField(max_length=64, blank=True, null=True)  # 🔗 previous chain head
+    merkle_root = models.CharField(max_length=64, blank=True, null=True)  # 🌳 batch root anchored on-chain
+    merkle_proof = models.JSONField(blank=True, null=True)
         # ➕ REQUIRED NEW FIELD
     sent_to_patient = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_at'], name='visit_patient_created_idx'),
+            models.Index(fields=['doctor', 'created_at'], name='visit_doctor_created_idx'),
+            models.Index(fields=['blockchain_hash'], name='visit_hash_idx'),
+        ]
+
     def __str__(self):
         return f"Visit of {self.patient.full_name} on {self.visit_date}"
 
@@ -165,6 +215,153 @@ class PatientNotification(models.Model):
     visit = models.ForeignKey(PatientVisit, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Partial index: the dashboard only ever lists a patient's unread inbox
+            models.Index(fields=['patient', 'created_at'], name='notif_unread_idx', condition=models.Q(read=False)),
+            # Retention job: oldest read notifications first
+            models.Index(fields=['read_at'], name='notif_read_idx', condition=models.Q(read=True)),
+        ]
 
     def __str__(self):
         return f"Notification for {self.patient.full_name}"
+
+
+# ---------------------- BLOCKCHAIN ANCHOR QUEUE ----------------------
+class AnchorJob(models.Model):
+    """Outbox entry: a record hash waiting to be written on-chain."""
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Sent', 'Sent'),
+        ('Confirmed', 'Confirmed'),
+        ('Failed', 'Failed'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='anchor_jobs')
+    hash_value = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    tx_hash = models.CharField(max_length=255, blank=True, null=True)
+    block_number = models.PositiveBigIntegerField(blank=True, null=True)
+    merkle_root = models.CharField(max_length=64, blank=True, null=True)  # set in batch mode
+    merkle_proof = models.JSONField(blank=True, null=True)
+    batch_key = models.CharField(max_length=64, blank=True, null=True)  # jobs sharing it go in one Merkle root
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['status', 'tx_hash'], name='anchor_status_tx_idx'),
+            models.Index(fields=['hash_value'], name='anchor_hash_idx'),  # export: tx of a record hash
+        ]
+
+    def __str__(self):
+        return f"Anchor {self.hash_value[:12]} for {self.patient.full_name} ({self.status})"
+
+
+# ---------------------- TRANSACTION NONCES ----------------------
+class AccountNonce(models.Model):
+    """Next nonce to use for a sending account, shared by every worker."""
+    address = models.CharField(max_length=42, unique=True)
+    next_nonce = models.PositiveBigIntegerField(blank=True, null=True)  # None → resync from node
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.address} → {self.next_nonce}"
+
+
+# ---------------------- DASHBOARD COUNTERS ----------------------
+class StatCounter(models.Model):
+    """Maintained row count / breakdown, e.g. 'appointments.status:Scheduled'."""
+    key = models.CharField(max_length=255, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+# ---------------------- UNREAD NOTIFICATION COUNTERS ----------------------
+class UnreadCounter(models.Model):
+    """A patient's unread notification count, maintained by app.notifications."""
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='unread_counter')
+    unread = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.patient_id}: {self.unread} unread"
+
+
+# ---------------------- LOGIN IDENTITY INDEX ----------------------
+class LoginIdentity(models.Model):
+    """
+    One row per patient/doctor account, kept in sync by app.identity, so a
+    login resolves email → (role, id, password hash) in one indexed query.
+    """
+    ROLE_CHOICES = [
+        ('patient', 'Patient'),
+        ('doctor', 'Doctor'),
+    ]
+    email = models.EmailField(db_index=True)
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    user_id = models.BigIntegerField()
+    full_name = models.CharField(max_length=100)
+    password = models.CharField(max_length=128, blank=True, null=True)
+    is_password_set = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['role', 'user_id'], name='identity_role_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.role} #{self.user_id})"
+
+
+# ---------------------- CHAIN INDEX ----------------------
+class ChainRecord(models.Model):
+    """
+    What PatientRecords actually holds, mirrored from its events by the
+    index_chain command: a RecordAdded (patient hash) or MerkleRootAdded
+    (batch root, no patient) per row.
+    """
+    KIND_CHOICES = [
+        ('record', 'Record'),
+        ('merkle_root', 'Merkle root'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='record')
+    patient_id = models.BigIntegerField(blank=True, null=True)  # chain data: no FK, may predate the row
+    hash_value = models.CharField(max_length=255)
+    leaf_count = models.PositiveIntegerField(blank=True, null=True)
+    block_number = models.PositiveBigIntegerField()
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    timestamp = models.PositiveBigIntegerField()  # block timestamp (unix seconds)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tx_hash', 'log_index'], name='chainrecord_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['hash_value'], name='chainrecord_hash_idx'),
+            models.Index(fields=['patient_id', 'block_number'], name='chainrecord_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.hash_value[:12]} @ block {self.block_number}"
+
+
+class ChainCheckpoint(models.Model):
+    """Last block an indexer has fully processed."""
+    name = models.CharField(max_length=50, unique=True)
+    block_number = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ block {self.block_number}"
@@ -0,0 +1,53 @@
+"""
+Local nonce allocation for the anchoring account.
+
+Nonces are handed out from the AccountNonce row with a single
+``UPDATE ... SET next_nonce = next_nonce + 1``, which takes the write lock
+first on every backend, so parallel threads and worker processes never get
+the same nonce and never ask the node. The node is only asked when the
+row is new or was marked stale (``next_nonce = NULL``) after a failure.
+"""
+
+import threading
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import AccountNonce
+
+_lock = threading.Lock()
+
+
+def allocate(web3, address):
+    """Reserve and return the next nonce for ``address``."""
+    with _lock, transaction.atomic():
+        bumped = AccountNonce.objects.filter(address=address, next_nonce__isnull=False).update(
+            next_nonce=F('next_nonce') + 1
+        )
+        if bumped:
+            return AccountNonce.objects.values_list('next_nonce', flat=True).get(address=address) - 1
+
+        nonce = web3.eth.get_transaction_count(address, 'pending')
+        AccountNonce.objects.update_or_create(address=address, defaults={'next_nonce': nonce + 1})
+        return nonce
+
+
+def release(address, nonce):
+    """
+    Give back a nonce whose transaction never reached the node.
+
+    If it was the last one handed out it is simply reused; otherwise later
+    nonces are already in flight and would sit behind the gap, so the next
+    allocation resyncs from the node, which re-issues the missing nonce.
+    """
+    with _lock, transaction.atomic():
+        reused = AccountNonce.objects.filter(address=address, next_nonce=nonce + 1).update(
+            next_nonce=nonce
+        )
+        if not reused:
+            resync(address)
+
+
+def resync(address):
+    """Forget the local counter; the next allocation asks the node."""
+    AccountNonce.objects.filter(address=address).update(next_nonce=None)
@@ -0,0 +1,127 @@
+"""
+Patient notification read state, unread counters and retention.
+
+``mark_read`` marks a patient's notifications read (some ids, everything
+up to a timestamp, or all of them) with a single ``UPDATE``. The
+per-patient count of unread notifications lives in ``UnreadCounter``. It
+is bumped with ``F()`` in the same transaction as each write, so
+``unread_count`` is one primary-key read instead of a COUNT over the
+inbox. A missing counter row is rebuilt from the table on first read, so
+counters never need a bulk backfill. ``purge_read`` deletes (optionally
+archiving first) read notifications past the retention period in
+batches; run ``manage.py purge_notifications`` periodically.
+"""
+
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import dashboard_cache, push
+from .models import PatientNotification, UnreadCounter
+
+RETENTION_DAYS = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+PURGE_BATCH = getattr(settings, 'NOTIFICATION_PURGE_BATCH', 1000)
+
+
+def _bump(patient_id, delta):
+    # No row yet: nothing to adjust, unread_count() builds it from the table
+    UnreadCounter.objects.filter(patient_id=patient_id).update(unread=Greatest(F('unread') + delta, 0))
+
+
+def unread_count(patient_id):
+    """The patient's unread notification count."""
+    count = UnreadCounter.objects.filter(patient_id=patient_id).values_list('unread', flat=True).first()
+    if count is None:
+        count = PatientNotification.objects.filter(patient_id=patient_id, read=False).count()
+        try:
+            with transaction.atomic():
+                UnreadCounter.objects.create(patient_id=patient_id, unread=count)
+        except IntegrityError:
+            pass  # a concurrent reader created it first
+    return count
+
+
+def mark_read(patient_id, ids=None, before=None, now=None):
+    """
+    Mark the patient's unread notifications read in one ``UPDATE`` — only
+    ``ids`` if given, only those created at or before ``before`` if given,
+    otherwise all of them. Returns ``(updated, unread)``.
+    """
+    now = now or timezone.now()
+    rows = PatientNotification.objects.filter(patient_id=patient_id, read=False)
+    if ids is not None:
+        rows = rows.filter(id__in=ids)
+    if before is not None:
+        rows = rows.filter(created_at__lte=before)
+
+    with transaction.atomic():
+        updated = rows.update(read=True, read_at=now)
+        if updated:
+            _bump(patient_id, -updated)
+            dashboard_cache.invalidate([patient_id])
+    unread = unread_count(patient_id)
+    if updated:
+        push.publish(patient_id, 'unread', {'unread': unread})
+    return updated, unread
+
+
+def _expired(cutoff):
+    # Rows read before read_at was recorded fall back to their creation time
+    return PatientNotification.objects.filter(read=True).filter(
+        Q(read_at__lt=cutoff) | Q(read_at__isnull=True, created_at__lt=cutoff)
+    )
+
+
+def purge_read(days=RETENTION_DAYS, batch_size=PURGE_BATCH, archive=None, now=None):
+    """
+    Delete read notifications older than ``days`` in batches of
+    ``batch_size`` rows, each in its own short transaction. With ``archive``
+    (a text file object) every row is written to it as a JSON line first.
+    Returns the number of rows deleted.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(_expired(cutoff).order_by('id').values(
+                'id', 'patient_id', 'title', 'body', 'visit_id', 'created_at', 'read_at',
+            )[:batch_size])
+            if not batch:
+                return deleted
+            if archive is not None:
+                for row in batch:
+                    archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+            # Only read rows: the unread counters are untouched
+            PatientNotification.objects.filter(id__in=[row['id'] for row in batch]).delete()
+        deleted += len(batch)
+
+
+# ---------------------- SIGNAL RECEIVERS ----------------------
+
+@receiver(post_init, sender=PatientNotification)
+def _remember_read(sender, instance, **kwargs):
+    instance._counted_read = instance.__dict__.get('read')
+
+
+@receiver(post_save, sender=PatientNotification)
+def _notification_saved(sender, instance, created, **kwargs):
+    if created:
+        if not instance.read:
+            _bump(instance.patient_id, 1)
+    elif 'read' in instance.__dict__ and instance.read != instance._counted_read:
+        _bump(instance.patient_id, -1 if instance.read else 1)
+    instance._counted_read = instance.__dict__.get('read')
+
+
+@receiver(post_delete, sender=PatientNotification)
+def _notification_deleted(sender, instance, **kwargs):
+    if not instance.read:
+        _bump(instance.patient_id, -1)
@@ -0,0 +1,121 @@
+"""
+Keyset ("seek") pagination for dashboard tables.
+
+Instead of OFFSET, each page continues after the (sort value, pk) of the
+last row of the previous page, carried in an opaque ``after`` cursor. The
+database seeks straight to it through the sort index, so page N costs the
+same as page 1 however large the table is.
+"""
+
+import base64
+import datetime
+import json
+from dataclasses import dataclass
+from functools import reduce
+from operator import or_
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = getattr(settings, 'DASHBOARD_PAGE_SIZE', 25)
+
+
+def encode_cursor(value, pk):
+    if isinstance(value, (datetime.date, datetime.time, datetime.datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns ``(value, pk)``, or ``None`` for a missing/garbled cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        return value, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+@dataclass
+class Page:
+    items: list
+    sort: str
+    query: str = ''
+    next_cursor: Optional[str] = None
+    next_url: Optional[str] = None
+    first_url: Optional[str] = None
+    is_first: bool = True
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _position(model, name, position):
+    """The decoded cursor with its value converted for the sort field, or ``None`` if it doesn't fit."""
+    if position is None:
+        return None
+    value, pk = position
+    try:
+        return model._meta.get_field(name).to_python(value), pk
+    except (ValidationError, ValueError, TypeError):
+        return None  # tampered or stale cursor: start over at the first page
+
+
+def keyset_page(queryset, sort, after=None, size=PAGE_SIZE):
+    """
+    One page of ``queryset`` ordered by ``sort`` (``-`` prefix = descending)
+    with pk as tie-breaker, starting after the ``after`` cursor.
+    """
+    desc = sort.startswith('-')
+    name = sort.lstrip('-')
+    op = 'lt' if desc else 'gt'
+    queryset = queryset.order_by(sort, '-pk' if desc else 'pk')
+
+    position = _position(queryset.model, name, decode_cursor(after))
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{name}__{op}': value}) | Q(**{name: value, f'pk__{op}': pk})
+        )
+
+    rows = list(queryset[:size + 1])
+    page = Page(items=rows[:size], sort=sort, is_first=position is None)
+    if len(rows) > size:
+        last = page.items[-1]
+        page.next_cursor = encode_cursor(getattr(last, name), last.pk)
+    return page
+
+
+def table_page(request, prefix, queryset, sorts, search_fields, section, size=PAGE_SIZE):
+    """
+    Keyset page for one dashboard table driven by ``<prefix>sort``,
+    ``<prefix>q`` and ``<prefix>after`` GET parameters. ``sorts`` whitelists
+    the sortable (non-null) fields; the first one is the default.
+    """
+    sort = request.GET.get(f'{prefix}sort')
+    if sort not in sorts:
+        sort = sorts[0]
+
+    query = request.GET.get(f'{prefix}q', '').strip()
+    if query:
+        queryset = queryset.filter(
+            reduce(or_, (Q(**{f'{f}__icontains': query}) for f in search_fields))
+        )
+
+    page = keyset_page(queryset, sort, request.GET.get(f'{prefix}after'), size)
+    page.query = query
+
+    params = request.GET.copy()
+    params['section'] = section
+    params.pop(f'{prefix}after', None)
+    page.first_url = '?' + params.urlencode()
+    if page.has_next:
+        params[f'{prefix}after'] = page.next_cursor
+        page.next_url = '?' + params.urlencode()
+    return page
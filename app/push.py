@@ -0,0 +1,272 @@
+"""
+Server push of notifications and record updates to patient dashboards.
+
+Writes publish small JSON events on the patient's channel once their
+transaction commits. ``patient_events`` (an async view) streams them to
+the browser as Server-Sent Events. Under ASGI an idle patient is a queue
+awaiting its next message, with no polling and no thread held. Under WSGI
+(``runserver``, gunicorn sync workers) the response body is iterated by a
+request thread, so ``stream_sync`` is served instead. It blocks on a thread
+queue, sends keepalives, and ends after ``PUSH_WSGI_STREAM_SECONDS``. The
+browser then reconnects, so no thread is pinned for longer than that.
+
+Delivery goes through a broker chosen by ``PUSH_BROKER`` (dotted path).
+The default ``LocalBroker`` is an in-process hub and only reaches clients
+connected to the same process. A multi-process deployment plugs in a
+broker backed by a shared pub/sub service that implements ``Broker``.
+Events are best effort: a client that reconnects with ``Last-Event-ID``
+gets the unread notifications it missed replayed from the database.
+"""
+
+import abc
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import PatientHistory, PatientNotification, PatientVisit
+
+QUEUE_SIZE = getattr(settings, 'PUSH_QUEUE_SIZE', 100)        # events buffered per connection
+KEEPALIVE = getattr(settings, 'PUSH_KEEPALIVE_SECONDS', 15)   # comment line to keep proxies open
+WSGI_STREAM_SECONDS = getattr(settings, 'PUSH_WSGI_STREAM_SECONDS', 60)  # then the browser reconnects
+
+
+def channel_for(patient_id):
+    return f'patient:{patient_id}'
+
+
+class Broker(abc.ABC):
+    """Pub/sub interface: ``publish`` from any thread, ``subscribe`` from the listener's."""
+
+    @abc.abstractmethod
+    def publish(self, channel, message):
+        """Hand ``message`` to every current subscription of ``channel``."""
+
+    @abc.abstractmethod
+    def subscribe(self, channel, threaded=False):
+        """
+        A subscription receiving every message published on ``channel`` from
+        now on: a ``Subscription`` for async code, a ``ThreadSubscription``
+        with ``threaded``.
+        """
+
+    @abc.abstractmethod
+    def unsubscribe(self, subscription):
+        """Stop delivering to ``subscription``."""
+
+
+class Subscription:
+    """Messages for one async listener, buffered in a bounded asyncio queue."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def push(self, message):
+        """Called by the broker from any thread; raises RuntimeError once the loop is closed."""
+        self.loop.call_soon_threadsafe(self.deliver, message)
+
+    def deliver(self, message):
+        """Called on the subscriber's event loop."""
+        if self.queue.full():
+            self.queue.get_nowait()  # slow reader: drop the oldest, keep the newest
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Next message, or ``None`` after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class ThreadSubscription:
+    """Messages for one listener in a plain thread (WSGI), in a bounded thread-safe queue."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(QUEUE_SIZE)
+
+    def push(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()  # slow reader: drop the oldest, keep the newest
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Next message, or ``None`` after ``timeout`` seconds without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(Broker):
+    """In-process hub: channel -> subscriptions, fanned out onto their loops."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for sub in subscribers:
+            try:
+                sub.push(message)
+            except RuntimeError:
+                sub.close()  # its event loop is gone
+
+    def subscribe(self, channel, threaded=False):
+        sub = (ThreadSubscription if threaded else Subscription)(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subscribers = self._channels.get(sub.channel)
+            if subscribers is not None:
+                subscribers.discard(sub)
+                if not subscribers:
+                    del self._channels[sub.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(s) for s in self._channels.values())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'PUSH_BROKER', 'app.push.LocalBroker'))()
+    return _broker
+
+
+def publish(patient_id, event, data, event_id=None):
+    """Send ``event`` to the patient's open dashboards once the transaction commits."""
+    message = {'event': event, 'data': data, 'id': event_id}
+    transaction.on_commit(lambda: get_broker().publish(channel_for(patient_id), message))
+
+
+def format_event(message):
+    """One SSE frame for a published message."""
+    lines = []
+    if message.get('id') is not None:
+        lines.append(f"id: {message['id']}")
+    lines.append(f"event: {message['event']}")
+    lines.append('data: ' + json.dumps(message['data'], cls=DjangoJSONEncoder))
+    return '\n'.join(lines) + '\n\n'
+
+
+def notification_message(notification):
+    return {
+        'event': 'notification',
+        'id': notification.id,
+        'data': {
+            'id': notification.id,
+            'title': notification.title,
+            'body': notification.body,
+            'visit_id': notification.visit_id,
+            'created_at': notification.created_at,
+        },
+    }
+
+
+def _missed(patient_id, last_event_id):
+    try:
+        last_id = int(last_event_id)
+    except (TypeError, ValueError):
+        return PatientNotification.objects.none()
+    rows = PatientNotification.objects.filter(patient_id=patient_id, read=False, id__gt=last_id).order_by('id')
+    return rows[:QUEUE_SIZE]
+
+
+async def missed_notifications(patient_id, last_event_id):
+    """Unread notifications newer than the ``Last-Event-ID`` a client reconnects with."""
+    return [notification_message(n) async for n in _missed(patient_id, last_event_id)]
+
+
+async def stream(patient_id, last_event_id=None):
+    """SSE frames for one connection until the client goes away."""
+    sub = get_broker().subscribe(channel_for(patient_id))
+    try:
+        yield 'retry: 3000\n\n'
+        for message in await missed_notifications(patient_id, last_event_id):
+            yield format_event(message)
+        while True:
+            message = await sub.get(timeout=KEEPALIVE)
+            yield ': keepalive\n\n' if message is None else format_event(message)
+    finally:
+        sub.close()
+
+
+def stream_sync(patient_id, last_event_id=None, lifetime=None):
+    """
+    ``stream`` for a WSGI worker thread: the same frames, but it ends after
+    ``lifetime`` (default ``WSGI_STREAM_SECONDS``) seconds. The browser reconnects with ``Last-Event-ID`` and
+    gets any missed notifications replayed.
+    """
+    sub = get_broker().subscribe(channel_for(patient_id), threaded=True)
+    try:
+        yield 'retry: 3000\n\n'
+        for notification in _missed(patient_id, last_event_id):
+            yield format_event(notification_message(notification))
+        deadline = time.monotonic() + (WSGI_STREAM_SECONDS if lifetime is None else lifetime)
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = sub.get(timeout=min(KEEPALIVE, remaining))
+            yield ': keepalive\n\n' if message is None else format_event(message)
+    finally:
+        sub.close()
+
+
+# ---------------------- SIGNAL RECEIVERS ----------------------
+
+@receiver(post_save, sender=PatientNotification)
+def _notification_created(sender, instance, created, **kwargs):
+    if created:
+        message = notification_message(instance)
+        publish(instance.patient_id, message['event'], message['data'], event_id=message['id'])
+
+
+@receiver(post_save, sender=PatientVisit)
+@receiver(post_save, sender=PatientHistory)
+def _record_saved(sender, instance, created, **kwargs):
+    if not instance.blockchain_hash:
+        return  # not linked into the chain yet
+    publish(instance.patient_id, 'record', {
+        'kind': sender._meta.model_name,
+        'id': instance.pk,
+        'created': created,
+        'blockchain_hash': instance.blockchain_hash,
+    })
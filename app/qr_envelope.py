@@ -0,0 +1,123 @@
+"""
+Compact, signed QR payloads.
+
+Instead of the record itself a QR now carries a fixed-size pointer to it::
+
+    PHR:<base45( version | flags | patient id | head hash | [tx hash] | mac )>
+
+``head hash`` is the patient's chain head when the QR was issued and
+``mac`` is a truncated HMAC (keyed by SECRET_KEY) over everything before
+it, so only this server can mint valid codes. Scanners send the text back
+to the verify API, which fetches and verifies the full record. The payload
+is at most 90 bytes (139 alphanumeric characters) whatever the history
+length, so the QR version, render time and decode time stay constant.
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PREFIX = "PHR:"
+VERSION = 1
+FLAG_TX = 0x01
+MAC_SIZE = 16
+_HEADER = struct.Struct(">BBQ")  # version, flags, patient id
+_SALT = "app.qr_envelope"
+
+# RFC 9285: the characters of QR alphanumeric mode
+BASE45 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+_BASE45_INDEX = {c: i for i, c in enumerate(BASE45)}
+
+
+class InvalidEnvelope(ValueError):
+    pass
+
+
+@dataclass
+class Envelope:
+    patient_id: int
+    head_hash: str
+    tx_hash: Optional[str] = None
+
+
+def b45encode(data):
+    out = []
+    for i in range(0, len(data) - 1, 2):
+        n = data[i] * 256 + data[i + 1]
+        n, c = divmod(n, 45)
+        e, d = divmod(n, 45)
+        out += [BASE45[c], BASE45[d], BASE45[e]]
+    if len(data) % 2:
+        d, c = divmod(data[-1], 45)
+        out += [BASE45[c], BASE45[d]]
+    return "".join(out)
+
+
+def b45decode(text):
+    try:
+        values = [_BASE45_INDEX[c] for c in text]
+    except KeyError:
+        raise InvalidEnvelope("not base45")
+    if len(values) % 3 == 1:
+        raise InvalidEnvelope("bad base45 length")
+    out = bytearray()
+    for i in range(0, len(values), 3):
+        chunk = values[i:i + 3]
+        n = sum(v * 45 ** k for k, v in enumerate(chunk))
+        if len(chunk) == 3:
+            if n > 0xFFFF:
+                raise InvalidEnvelope("bad base45 group")
+            out += n.to_bytes(2, "big")
+        else:
+            if n > 0xFF:
+                raise InvalidEnvelope("bad base45 group")
+            out.append(n)
+    return bytes(out)
+
+
+def _mac(body):
+    return salted_hmac(_SALT, body, algorithm="sha256").digest()[:MAC_SIZE]
+
+
+def _hash_bytes(value):
+    return bytes.fromhex(value.lower().removeprefix("0x"))
+
+
+def encode(patient_id, head_hash, tx_hash=None):
+    """QR text for ``patient_id`` at chain head ``head_hash`` (hex)."""
+    flags = FLAG_TX if tx_hash else 0
+    body = _HEADER.pack(VERSION, flags, patient_id) + _hash_bytes(head_hash)
+    if tx_hash:
+        body += _hash_bytes(tx_hash)
+    return PREFIX + b45encode(body + _mac(body))
+
+
+def is_envelope(text):
+    return (text or "").strip().startswith(PREFIX)
+
+
+def decode(text):
+    """Parse and authenticate QR text; raises InvalidEnvelope."""
+    text = (text or "").strip()
+    if not text.startswith(PREFIX):
+        raise InvalidEnvelope("not a record QR")
+    raw = b45decode(text[len(PREFIX):])
+    if len(raw) < _HEADER.size + 32 + MAC_SIZE:
+        raise InvalidEnvelope("truncated")
+    body, mac = raw[:-MAC_SIZE], raw[-MAC_SIZE:]
+    version, flags, patient_id = _HEADER.unpack_from(body)
+    if version != VERSION:
+        raise InvalidEnvelope(f"unsupported version {version}")
+    if not constant_time_compare(mac, _mac(body)):
+        raise InvalidEnvelope("signature mismatch")
+    hashes = body[_HEADER.size:]
+    expected = 64 if flags & FLAG_TX else 32
+    if len(hashes) != expected:
+        raise InvalidEnvelope("bad length")
+    return Envelope(
+        patient_id=patient_id,
+        head_hash=hashes[:32].hex(),
+        tx_hash="0x" + hashes[32:].hex() if flags & FLAG_TX else None,
+    )
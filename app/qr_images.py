@@ -0,0 +1,126 @@
+"""
+Background, content-addressed QR code rendering.
+
+Views call ``schedule(payload, targets)`` and return at once. The PNG is
+rendered in a worker pool and stored under a name derived from the SHA-256
+of the payload (``qrcodes/<digest>.png``), so an identical payload is never
+rendered or stored twice. When the file exists, each target queryset gets
+``qr_code`` pointed at it with a single UPDATE; until then the field is
+empty and the templates show their "no QR yet" placeholder.
+
+``settings.QR_EXECUTOR`` picks the pool: "thread" (default), "process"
+(parallel PNG encoding across cores) or "sync" (render inline, for tests
+and management commands).
+"""
+
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+
+from . import dashboard_cache
+from .instrumentation import span
+from .storage import content_store
+
+logger = logging.getLogger(__name__)
+
+QR_FOLDER = 'qrcodes'
+
+ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+_lock = threading.Lock()
+_threads = None    # render + store jobs
+_processes = None  # PNG encoding only, when QR_EXECUTOR = "process"
+
+
+def render_png(payload, box_size=10, border=4, error_correction='M'):
+    """Encode ``payload`` as a QR PNG; pure function, safe in any pool."""
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=ERROR_CORRECTION[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def name_for(payload, **options):
+    """Storage name of the QR for ``payload`` rendered with ``options``."""
+    digest = hashlib.sha256(payload.encode())
+    digest.update(repr(sorted(options.items())).encode())
+    return f"{QR_FOLDER}/{digest.hexdigest()}.png"
+
+
+def _get_pools():
+    global _threads, _processes
+    if _threads is None:
+        with _lock:
+            if _threads is None:
+                workers = getattr(settings, 'QR_WORKERS', 2)
+                if getattr(settings, 'QR_EXECUTOR', 'thread') == 'process':
+                    _processes = ProcessPoolExecutor(max_workers=workers)
+                _threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qr')
+    return _threads, _processes
+
+
+def _point(name, targets):
+    for queryset in targets:
+        queryset.update(qr_code=name)
+    dashboard_cache.invalidate_querysets(targets)
+
+
+def _render_and_store(name, targets, payload, options):
+    """Pool job: render, save the PNG once and point the targets at it."""
+    try:
+        _, processes = _get_pools()
+        with span('qrcode'):
+            if processes is not None:
+                png = processes.submit(render_png, payload, **options).result()
+            else:
+                png = render_png(payload, **options)
+        content_store.save_named(name, ContentFile(png))
+        _point(name, targets)
+    except Exception:
+        logger.exception("QR rendering failed for %s", name)
+    finally:
+        connections.close_all()  # this pool thread's own connections
+
+
+def schedule(payload, targets, **options):
+    """
+    Render ``payload`` in the background and set ``qr_code`` on ``targets``.
+
+    ``targets`` are querysets; filter them on the hash the payload was built
+    for so a slow render can't overwrite a newer QR. Returns the storage
+    name, which is known before the image exists.
+    """
+    name = name_for(payload, **options)
+    if content_store.exists(name):
+        _point(name, targets)
+    elif getattr(settings, 'QR_EXECUTOR', 'thread') == 'sync':
+        with span('qrcode'):
+            png = render_png(payload, **options)
+        content_store.save_named(name, ContentFile(png))
+        _point(name, targets)
+    else:
+        threads, _ = _get_pools()
+        # Only after commit, so the pool thread sees the rows it updates
+        transaction.on_commit(
+            lambda: threads.submit(_render_and_store, name, targets, payload, options)
+        )
+    return name
@@ -0,0 +1,39 @@
+"""
+Fixed-window failure counters in the cache.
+
+Used by ``log_in`` so a flood of bad passwords is refused before reaching
+the (deliberately slow) password hasher.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOGIN_LIMIT = getattr(settings, 'LOGIN_RATE_LIMIT', 10)     # failures allowed...
+LOGIN_WINDOW = getattr(settings, 'LOGIN_RATE_WINDOW', 300)  # ...per this many seconds
+
+
+def _key(scope, value):
+    digest = hashlib.sha256(str(value).lower().encode()).hexdigest()[:32]
+    return f'ratelimit:{scope}:{digest}'
+
+
+def blocked(keys, limit=LOGIN_LIMIT):
+    """True if any ``(scope, value)`` in ``keys`` has used up its failures."""
+    counts = cache.get_many([_key(*k) for k in keys])
+    return any(count >= limit for count in counts.values())
+
+
+def hit(keys, window=LOGIN_WINDOW):
+    """Record one failure against every ``(scope, value)`` in ``keys``."""
+    for key in (_key(*k) for k in keys):
+        cache.add(key, 0, window)
+        try:
+            cache.incr(key)
+        except ValueError:  # expired between add and incr
+            cache.set(key, 1, window)
+
+
+def reset(keys):
+    cache.delete_many([_key(*k) for k in keys])
@@ -0,0 +1,165 @@
+"""
+SQLite tuning for concurrent writers.
+
+Every new SQLite connection gets the ``SQLITE_PRAGMAS`` from settings
+through ``connection_created``:
+- WAL, so readers never block the writer or each other;
+- ``synchronous=NORMAL``, which is durable at checkpoints and safe with WAL;
+- a ``busy_timeout``, so a writer waits for the lock instead of failing
+  with "database is locked";
+- a larger page cache and memory-mapped reads.
+
+WAL is the one persistent setting: it is recorded in the database file
+header, and the database gets ``-wal``/``-shm`` files next to it (ignored
+by git). The first connection to a rollback-journal database, such as the
+checked-in ``db.sqlite3``, converts it once. Later connections see that
+the mode is already set and leave the file alone. Set ``journal_mode`` to
+``DELETE`` in ``SQLITE_PRAGMAS`` to keep a database file unconverted.
+
+The database OPTIONS also set ``transaction_mode`` to IMMEDIATE. Each
+``atomic()`` block then takes the write lock up front. A deferred
+transaction that reads first and then tries to write fails at once when
+another writer holds the lock, because SQLite cannot wait on a lock
+upgrade.
+
+``stress()`` replays the record-save write pattern from several threads
+against a scratch database file, with the defaults ("before") or these
+settings ("after"). ``manage.py sqlite_stress`` prints the comparison.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,      # ms
+    'cache_size': -20000,      # negative = KiB, i.e. 20 MiB per connection
+    'mmap_size': 134217728,    # 128 MiB
+    'temp_store': 'MEMORY',
+}
+
+
+def pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def apply_pragmas(cursor, values=None):
+    for name, value in (values or pragmas()).items():
+        if name == 'journal_mode':
+            # Persistent: only switch when it differs, so reconnecting
+            # never touches the file header again
+            cursor.execute('PRAGMA journal_mode')
+            if cursor.fetchone()[0].lower() == str(value).lower():
+                continue
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def _tune_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor)
+
+
+# ---------------------- STRESS TEST ----------------------
+
+SCHEMA = """
+CREATE TABLE patient (id INTEGER PRIMARY KEY, blockchain_hash TEXT, qr_code TEXT, tx_hash TEXT);
+CREATE TABLE history (id INTEGER PRIMARY KEY, patient_id INTEGER, data TEXT, prev_hash TEXT, hash TEXT);
+CREATE TABLE visit (id INTEGER PRIMARY KEY, patient_id INTEGER, data TEXT, hash TEXT, sent INTEGER);
+"""
+
+
+@dataclass
+class StressResult:
+    mode: str
+    workers: int
+    committed: int
+    locked: int
+    seconds: float
+
+    @property
+    def per_second(self):
+        return self.committed / self.seconds if self.seconds else 0.0
+
+
+def _connect(path, tuned):
+    # isolation_level=None: transactions are opened explicitly, as Django does
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    if tuned:
+        apply_pragmas(conn.cursor())
+    return conn
+
+
+def _save_record(conn, patient_id, begin):
+    """save_patient_record's writes: visit, history, two patient saves, visit save."""
+    conn.execute(begin)
+    try:
+        head = conn.execute('SELECT blockchain_hash FROM patient WHERE id = ?', (patient_id,)).fetchone()[0]
+        visit = conn.execute('INSERT INTO visit (patient_id, data, sent) VALUES (?, ?, 0)',
+                             (patient_id, 'x' * 500)).lastrowid
+        new_hash = f'{visit:064x}'
+        conn.execute('INSERT INTO history (patient_id, data, prev_hash, hash) VALUES (?, ?, ?, ?)',
+                     (patient_id, 'y' * 500, head, new_hash))
+        conn.execute('UPDATE patient SET blockchain_hash = ? WHERE id = ?', (new_hash, patient_id))
+        conn.execute('UPDATE patient SET qr_code = ? WHERE id = ?', (f'qrcodes/{new_hash}.png', patient_id))
+        conn.execute('UPDATE visit SET hash = ?, sent = 1 WHERE id = ?', (new_hash, visit))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def stress(tuned, workers=8, operations=100, patients=50):
+    """Run ``workers`` threads doing ``operations`` record saves each; returns a StressResult."""
+    folder = tempfile.mkdtemp(prefix='sqlite-stress-')
+    path = os.path.join(folder, 'stress.sqlite3')
+    try:
+        setup = _connect(path, tuned)
+        setup.executescript(SCHEMA)
+        setup.executemany('INSERT INTO patient (id, blockchain_hash) VALUES (?, ?)',
+                          [(i, '0' * 64) for i in range(patients)])
+        setup.close()
+
+        begin = 'BEGIN IMMEDIATE' if tuned else 'BEGIN'
+        counts = {'committed': 0, 'locked': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(workers)
+
+        def worker(n):
+            conn = _connect(path, tuned)
+            committed = locked = 0
+            start.wait()
+            for i in range(operations):
+                try:
+                    _save_record(conn, (n * operations + i) % patients, begin)
+                    committed += 1
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    locked += 1
+            conn.close()
+            with lock:
+                counts['committed'] += committed
+                counts['locked'] += locked
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return StressResult('after' if tuned else 'before', workers, counts['committed'], counts['locked'], elapsed)
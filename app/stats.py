@@ -0,0 +1,173 @@
+"""
+Maintained dashboard counters.
+
+Totals and breakdowns live in StatCounter rows, bumped by model signals in
+the same transaction as the write that changed them, and served to the
+dashboards from the cache as one snapshot dict. Writes that bypass signals
+(``bulk_create``, ``QuerySet.update``/``delete``) are caught up by
+``reconcile()`` — run ``manage.py reconcile_stats`` periodically.
+
+The snapshot is cached in ``STATS_CACHE``, the dashboard cache. Its
+default backend is process-local memory, which is only right for a single
+server process: with several workers, set ``DASHBOARD_CACHE_BACKEND=file``
+(or point the alias at a shared cache) so a write's invalidation reaches
+every worker.
+"""
+
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Appointment, Doctor, Patient, StatCounter
+
+CACHE_ALIAS = getattr(settings, 'STATS_CACHE', 'default')
+CACHE_KEY = 'dashboard_stats'
+CACHE_TIMEOUT = 300
+RECONCILED = '__reconciled__'  # marker row: counters hold absolute values
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _status_key(status):
+    return f'appointments.status:{status}'
+
+
+def _doctor_key(name):
+    return f'patients.doctor:{name or ""}'
+
+
+def bump(key, delta):
+    """Add ``delta`` to a counter inside the caller's transaction."""
+    updated = StatCounter.objects.filter(key=key).update(value=F('value') + delta)
+    if not updated and StatCounter.objects.filter(key=RECONCILED).exists():
+        try:
+            with transaction.atomic():
+                StatCounter.objects.create(key=key, value=delta)
+        except IntegrityError:
+            StatCounter.objects.filter(key=key).update(value=F('value') + delta)
+    transaction.on_commit(lambda: _cache().delete(CACHE_KEY))
+
+
+def patients_added(patients):
+    """Count bulk-created patients (bulk_create sends no signals)."""
+    bump('patients', len(patients))
+    for name, n in Counter(p.doctor_assigned for p in patients).items():
+        bump(_doctor_key(name), n)
+
+
+def reconcile():
+    """Recount everything from the source tables and refresh the cache."""
+    # Count inside the transaction: it holds the write lock (IMMEDIATE), so
+    # no bump can commit between a count and the row it is written to
+    with transaction.atomic():
+        values = {
+            'patients': Patient.objects.count(),
+            'doctors': Doctor.objects.count(),
+            'appointments': Appointment.objects.count(),
+            RECONCILED: 1,
+        }
+        for status, n in Appointment.objects.values_list('status').annotate(n=Count('pk')).order_by():
+            values[_status_key(status)] = n
+        for name, n in Patient.objects.values_list('doctor_assigned').annotate(n=Count('pk')).order_by():
+            values[_doctor_key(name)] = n
+
+        StatCounter.objects.exclude(key__in=values).update(value=0)
+        for key, value in values.items():
+            StatCounter.objects.update_or_create(key=key, defaults={'value': value})
+    _cache().delete(CACHE_KEY)
+    return values
+
+
+def snapshot():
+    """
+    ``{'total_patients', 'total_doctors', 'total_appointments',
+    'appointments_by_status', 'patients_by_doctor'}`` — one cache read, or
+    one indexed table read on a miss.
+    """
+    cache = _cache()
+    data = cache.get(CACHE_KEY)
+    if data is not None:
+        return data
+
+    counters = dict(StatCounter.objects.values_list('key', 'value'))
+    if RECONCILED not in counters:
+        counters = reconcile()
+
+    breakdown = defaultdict(dict)
+    for key, value in counters.items():
+        if ':' in key and value:
+            group, label = key.split(':', 1)
+            breakdown[group][label] = value
+    data = {
+        'total_patients': counters.get('patients', 0),
+        'total_doctors': counters.get('doctors', 0),
+        'total_appointments': counters.get('appointments', 0),
+        'appointments_by_status': breakdown['appointments.status'],
+        'patients_by_doctor': breakdown['patients.doctor'],
+    }
+    cache.set(CACHE_KEY, data, CACHE_TIMEOUT)
+    return data
+
+
+# ---------------------- SIGNAL RECEIVERS ----------------------
+
+@receiver(post_init, sender=Appointment)
+def _remember_status(sender, instance, **kwargs):
+    instance._stats_status = instance.status
+
+
+@receiver(post_init, sender=Patient)
+def _remember_doctor(sender, instance, **kwargs):
+    instance._stats_doctor = instance.__dict__.get('doctor_assigned')
+
+
+@receiver(post_save, sender=Appointment)
+def _appointment_saved(sender, instance, created, **kwargs):
+    if created:
+        bump('appointments', 1)
+        bump(_status_key(instance.status), 1)
+    elif instance.status != instance._stats_status:
+        bump(_status_key(instance._stats_status), -1)
+        bump(_status_key(instance.status), 1)
+    instance._stats_status = instance.status
+
+
+@receiver(post_delete, sender=Appointment)
+def _appointment_deleted(sender, instance, **kwargs):
+    bump('appointments', -1)
+    bump(_status_key(instance._stats_status), -1)
+
+
+@receiver(post_save, sender=Patient)
+def _patient_saved(sender, instance, created, **kwargs):
+    if created:
+        bump('patients', 1)
+        bump(_doctor_key(instance.doctor_assigned), 1)
+    elif 'doctor_assigned' in instance.__dict__ and instance.doctor_assigned != instance._stats_doctor:
+        bump(_doctor_key(instance._stats_doctor), -1)
+        bump(_doctor_key(instance.doctor_assigned), 1)
+    instance._stats_doctor = instance.__dict__.get('doctor_assigned')
+
+
+@receiver(post_delete, sender=Patient)
+def _patient_deleted(sender, instance, **kwargs):
+    bump('patients', -1)
+    bump(_doctor_key(instance._stats_doctor), -1)
+
+
+@receiver(post_save, sender=Doctor)
+def _doctor_saved(sender, instance, created, **kwargs):
+    if created:
+        bump('doctors', 1)
+
+
+@receiver(post_delete, sender=Doctor)
+def _doctor_deleted(sender, instance, **kwargs):
+    bump('doctors', -1)
@@ -0,0 +1,98 @@
+"""
+Content-addressed media storage for QR codes and prescription images.
+
+``ContentAddressedStorage.save`` names a file after the SHA-256 of its
+bytes (keeping the upload folder and extension), and writes it only if that
+name doesn't exist yet. Saving the same image twice therefore returns the
+same name instead of a ``_<random>`` copy. Rows share blobs by name;
+``refcounts()`` counts the references across Patient, PatientVisit and
+PatientHistory, and the ``gc_media`` command deletes blobs nobody
+references any more.
+"""
+
+import hashlib
+import os
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from .instrumentation import span
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _AlreadyStored(Exception):
+    pass
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        folder = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(folder, f"{digest.hexdigest()}{ext}").replace("\\", "/")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            from django.core.files import File
+            content = File(content, name)
+        return self.save_named(self.content_name(name, content), content)
+
+    def save_named(self, name, content):
+        """Store under a name the caller already derived from the content."""
+        with span("storage"):
+            if self.exists(name):
+                return name  # same bytes already stored — share the blob
+            try:
+                return self._save(name, content)
+            except _AlreadyStored:
+                return name  # a concurrent writer stored the same bytes first
+
+    def get_available_name(self, name, max_length=None):
+        # Called by _save when the name got taken meanwhile; never suffix
+        raise _AlreadyStored(name)
+
+
+content_store = ContentAddressedStorage()
+
+
+def get_content_store():
+    return content_store
+
+
+def media_fields():
+    """(model, field name) of every file field served from the shared store."""
+    from .models import Patient, PatientHistory, PatientVisit
+
+    return [
+        (Patient, "qr_code"),
+        (PatientHistory, "qr_code"),
+        (PatientVisit, "qr_code"),
+        (PatientVisit, "prescription_image"),
+    ]
+
+
+def refcounts():
+    """Counter of stored name → number of rows referencing it."""
+    from django.db.models import Count
+
+    counts = Counter()
+    for model, field in media_fields():
+        rows = (
+            model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+            .values(field).annotate(refs=Count("pk")).values_list(field, "refs")
+        )
+        for name, refs in rows.iterator():
+            counts[name] += refs
+    return counts
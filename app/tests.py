@@ -1,3 +1,1193 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+
+from . import anchoring, benchmarks, blockchain, bulk_import, chain_reader, dashboard_cache, export, identity, indexer, instrumentation, ledger, merkle, nonces, notifications, pagination, push, qr_envelope, qr_images, ratelimit, sqlite, stats, storage
+from .models import (Appointment, AnchorJob, ChainRecord, Doctor, DoctorRequest, LoginIdentity, Patient, PatientHistory,
+                     PatientNotification, PatientVisit, UnreadCounter)
+
+try:
+    from web3 import EthereumTesterProvider, Web3
+    import eth_tester  # noqa: F401
+    HAS_ETH_TESTER = True
+except ImportError:
+    HAS_ETH_TESTER = False
+
+ADD_RECORD_ABI = [{
+    "inputs": [
+        {"internalType": "uint256", "name": "patientId", "type": "uint256"},
+        {"internalType": "string", "name": "hashValue", "type": "string"}
+    ],
+    "name": "addRecord",
+    "outputs": [],
+    "stateMutability": "nonpayable",
+    "type": "function"
+}, {
+    "inputs": [
+        {"internalType": "bytes32", "name": "root", "type": "bytes32"},
+        {"internalType": "uint256", "name": "leafCount", "type": "uint256"}
+    ],
+    "name": "addMerkleRoot",
+    "outputs": [],
+    "stateMutability": "nonpayable",
+    "type": "function"
+}]
+
+
+def make_patient(**kwargs):
+    fields = dict(full_name="Test Patient", age=40, gender="Male", email="p@example.com",
+                  phone="123", address="Somewhere")
+    fields.update(kwargs)
+    return Patient.objects.create(**fields)
+
+
+@skipUnless(HAS_ETH_TESTER, "eth-tester is not installed")
+class AnchorWorkerTests(TestCase):
+    """anchor_worker against an in-process chain standing in for Ganache."""
+
+    def setUp(self):
+        provider = EthereumTesterProvider()
+        self.web3 = Web3(provider)
+        key = provider.ethereum_tester.backend.account_keys[0]
+        self.private_key = key.to_bytes()
+        self.account = key.public_key.to_checksum_address()
+        # No code at this address: the call still mines like addRecord would
+        self.contract = self.web3.eth.contract(address=self.web3.eth.accounts[1], abi=ADD_RECORD_ABI)
+        self.patient = make_patient()
+
+    def drain(self):
+        return anchoring.drain(self.web3, self.contract, self.account, self.private_key)
+
+    def test_job_is_sent_confirmed_and_copied_to_patient(self):
+        Patient.objects.filter(pk=self.patient.pk).update(blockchain_hash="ab" * 32)
+        job = anchoring.enqueue(self.patient, "ab" * 32)
+
+        self.assertEqual(self.drain(), {"sent": 1, "failed": 0, "confirmed": 1})
+
+        job.refresh_from_db()
+        self.patient.refresh_from_db()
+        self.assertEqual(job.status, "Confirmed")
+        self.assertIsNotNone(job.block_number)
+        self.assertEqual(self.patient.tx_hash, job.tx_hash)
+
+    def test_only_the_chain_head_sets_the_patient_tx_hash(self):
+        older = anchoring.enqueue(self.patient, "01" * 32)
+        Patient.objects.filter(pk=self.patient.pk).update(blockchain_hash="02" * 32, tx_hash="0xhead")
+
+        self.assertEqual(self.drain()["sent"], 1)  # a retried job for an older entry
+        older.refresh_from_db()
+        self.assertEqual(older.status, "Confirmed")
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).tx_hash, "0xhead")
+
+    def test_reverted_transaction_is_cleared_from_the_patient(self):
+        Patient.objects.filter(pk=self.patient.pk).update(blockchain_hash="ab" * 32)
+        job = anchoring.enqueue(self.patient, "ab" * 32)
+        anchoring.send_pending(self.web3, self.contract, self.account, self.private_key)
+        job.refresh_from_db()
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).tx_hash, job.tx_hash)
+
+        with mock.patch.object(self.web3.eth, "get_transaction_receipt",
+                               return_value={"status": 0, "blockNumber": 1}):
+            self.assertEqual(anchoring.confirm_sent(self.web3), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("Pending", 1))
+        self.assertIsNone(Patient.objects.get(pk=self.patient.pk).tx_hash)
+
+    def test_failure_backs_off_and_retries(self):
+        job = anchoring.enqueue(self.patient, "cd" * 32)
+
+        anchoring.drain(self.web3, self.contract, self.account, b"\x01" * 32)  # unfunded key
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("Pending", 1))
+        self.assertGreater(job.next_attempt_at, job.updated_at)
+
+        # Not due yet: nothing is sent
+        self.assertEqual(self.drain()["sent"], 0)
+
+        AnchorJob.objects.filter(pk=job.pk).update(next_attempt_at=job.created_at)
+        self.assertEqual(self.drain()["sent"], 1)
+
+    def test_nonces_are_allocated_locally_and_reused_after_failure(self):
+        first = nonces.allocate(self.web3, self.account)
+        second = nonces.allocate(self.web3, self.account)
+        self.assertEqual(second, first + 1)
+
+        nonces.release(self.account, second)
+        self.assertEqual(nonces.allocate(self.web3, self.account), second)
+
+        # Releasing a nonce behind one already in flight forces a resync
+        nonces.release(self.account, first)
+        self.assertEqual(nonces.allocate(self.web3, self.account), first)
+
+    @override_settings(ANCHOR_MODE="batch", ANCHOR_BATCH_SIZE=5, ANCHOR_BATCH_WINDOW=3600)
+    def test_batch_mode_anchors_one_root_and_stores_proofs(self):
+        hashes = [f"{i:064x}" for i in range(5)]
+        rows = [PatientHistory.objects.create(
+            patient=self.patient, full_name="x", age=1, gender="Male", email="p@example.com",
+            phone="1", address="a", blockchain_hash=h) for h in hashes]
+        for h in hashes[:4]:
+            anchoring.enqueue(self.patient, h)
+
+        # Window not over and batch not full yet
+        self.assertEqual(self.drain()["sent"], 0)
+
+        anchoring.enqueue(self.patient, hashes[4])
+        self.assertEqual(self.drain(), {"sent": 5, "failed": 0, "confirmed": 5})
+        self.assertEqual(AnchorJob.objects.values("tx_hash").distinct().count(), 1)
+
+        for row in rows:
+            row.refresh_from_db()
+            self.assertTrue(merkle.verify(row.blockchain_hash, row.merkle_proof, row.merkle_root))
+
+    def test_jobs_sharing_a_batch_key_go_out_in_one_transaction(self):
+        anchoring.enqueue_many([(self.patient, f"{i:064x}") for i in range(3)], batch_key="import:x:0")
+        anchoring.enqueue(self.patient, "ef" * 32)
+
+        self.assertEqual(self.drain(), {"sent": 4, "failed": 0, "confirmed": 4})
+        self.assertEqual(AnchorJob.objects.filter(batch_key="import:x:0").values("tx_hash").distinct().count(), 1)
+        self.assertIsNone(AnchorJob.objects.get(hash_value="ef" * 32).merkle_root)
+
+
+class StatCounterTests(TestCase):
+    """Dashboard counters follow writes without recounting the tables."""
+
+    def setUp(self):
+        stats._cache().clear()
+        self.doctor = Doctor.objects.create(full_name="Dr. A", specialization="GP", email="a@example.com",
+                                            phone="1", experience=3)
+
+    def test_counters_follow_creates_updates_and_deletes(self):
+        stats.reconcile()
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = make_patient(doctor_assigned="Dr. A")
+            appointment = Appointment.objects.create(patient=patient, doctor=self.doctor,
+                                                     date=datetime.date(2025, 1, 1), time=datetime.time(9))
+            appointment.status = "Completed"
+            appointment.save()
+
+        snap = stats.snapshot()
+        self.assertEqual((snap["total_patients"], snap["total_doctors"], snap["total_appointments"]), (1, 1, 1))
+        self.assertEqual(snap["appointments_by_status"], {"Completed": 1})
+        self.assertEqual(snap["patients_by_doctor"], {"Dr. A": 1})
+        with self.assertNumQueries(0):
+            stats.snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.delete()  # cascades to the appointment
+        snap = stats.snapshot()
+        self.assertEqual((snap["total_patients"], snap["total_appointments"]), (0, 0))
+        self.assertEqual(snap["appointments_by_status"], {})
+
+    def test_reconcile_catches_up_bulk_writes(self):
+        stats.snapshot()
+        stats._cache().clear()
+        Patient.objects.bulk_create([Patient(full_name="B", age=1, gender="Male", email="b@example.com",
+                                             phone="2", address="x")])
+        self.assertEqual(stats.snapshot()["total_patients"], 0)  # signals bypassed
+        stats.reconcile()
+        self.assertEqual(stats.snapshot()["total_patients"], 1)
+
+
+class DoctorDashboardTests(TestCase):
+    """Doctor dashboard cost doesn't grow with requests or visits."""
+
+    def setUp(self):
+        self.doctor = Doctor.objects.create(full_name="Dr. B", specialization="GP", email="b@example.com",
+                                            phone="1", experience=3)
+        session = self.client.session
+        session.update({"user_id": self.doctor.id, "user_role": "doctor"})
+        session.save()
+
+    def add_patients(self, n):
+        start = Patient.objects.count()
+        for i in range(start, start + n):
+            patient = make_patient(full_name=f"P{i}", email=f"p{i}@example.com")
+            DoctorRequest.objects.create(patient=patient, doctor=self.doctor, status="Pending")
+            DoctorRequest.objects.create(patient=patient, doctor=self.doctor, status="Accepted")
+            PatientVisit.objects.create(patient=patient, doctor=self.doctor, visit_date=datetime.date(2025, 1, 1))
+
+    def test_query_count_is_fixed(self):
+        self.add_patients(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("doctor_dashboard"))
+        self.add_patients(5)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("doctor_dashboard"))
+        self.assertEqual(len(few), len(many))
+
+    def test_visits_are_paged_through_json(self):
+        self.add_patients(3)
+        url = reverse("doctor_visits_json")
+        first = pagination.keyset_page(PatientVisit.objects.all(), "-created_at", size=2)
+        data = self.client.get(url, {"after": first.next_cursor}).json()
+        self.assertEqual([r["patient"] for r in data["results"]], ["P0"])
+        self.assertIsNone(data["next"])
+
+        data = self.client.get(url, {"after": pagination.encode_cursor("garbage", 1)}).json()
+        self.assertEqual(len(data["results"]), 3)  # back to the first page
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class QueryPlanTests(TestCase):
+    """Every hot dashboard query is answered from an index, not a table scan."""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.doctor = Doctor.objects.create(full_name="Dr. C", specialization="GP", email="c@example.com",
+                                            phone="1", experience=3)
+
+    def hot_queries(self):
+        from django.db.models import Max
+        from .views import doctor_visits
+
+        patient, doctor = self.patient, self.doctor
+        latest_ids = DoctorRequest.objects.filter(doctor=doctor, status="Accepted").values(
+            "patient").annotate(max_id=Max("id")).values_list("max_id", flat=True)
+        return {
+            "pending requests": DoctorRequest.objects.filter(doctor=doctor, status="Pending"),
+            "latest accepted": latest_ids,
+            "request exists": DoctorRequest.objects.filter(patient=patient, doctor=doctor, status="Pending")[:1],
+            "doctor visits": doctor_visits(doctor).order_by("-created_at")[:25],
+            "patient visits": patient.visits.order_by("-created_at")[:3],
+            "history": patient.history_records.order_by("-updated_at")[:3],
+            "unread notifications": patient.notifications.filter(read=False).order_by("-created_at")[:10],
+            "recent patients": Patient.objects.order_by("-created_at")[:5],
+            "patients by name": Patient.objects.order_by("full_name", "pk")[:25],
+            "recent doctors": Doctor.objects.order_by("-created_at")[:5],
+            "appointments by status": Appointment.objects.filter(status="Scheduled").order_by("-date", "-pk")[:25],
+            "appointments by date": Appointment.objects.order_by("-date", "-pk")[:25],
+            "history by hash": PatientHistory.objects.filter(blockchain_hash__in=["ab" * 32]),
+            "visits by hash": PatientVisit.objects.filter(blockchain_hash__in=["ab" * 32]),
+            "due anchor jobs": AnchorJob.objects.filter(status="Pending", next_attempt_at__lte=timezone.now()),
+            "sent anchor jobs": AnchorJob.objects.filter(status="Sent", tx_hash="0x1"),
+        }
+
+    @skipUnless(connection.vendor == "sqlite", "plan format is SQLite's")
+    def test_hot_queries_use_indexes(self):
+        for label, queryset in self.hot_queries().items():
+            plan = queryset.explain()
+            with self.subTest(label, plan=plan):
+                for line in plan.splitlines():
+                    step = line.split(" ", 3)[-1]
+                    self.assertFalse(step.startswith("SCAN ") and " USING " not in step,
+                                     f"table scan: {step}")
+                    self.assertNotIn("TEMP B-TREE FOR ORDER BY", step)
+
+
+@override_settings(PASSWORD_HASH_PROFILE="fast")
+class LoginTests(TestCase):
+    """log_in resolves either role in one lookup and throttles failures."""
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor(full_name="Dr. D", specialization="GP", email="d@example.com", phone="1", experience=3)
+        self.doctor.set_password("s3cret-pass")
+        self.doctor.save()
+
+    def post(self, email, password, ip="10.0.0.1"):
+        return self.client.post(reverse("log_in"), {"email": email, "password": password}, REMOTE_ADDR=ip)
+
+    def test_doctor_login_is_one_identity_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post("d@example.com", "s3cret-pass")
+        self.assertRedirects(response, reverse("doctor_dashboard"), fetch_redirect_response=False)
+        self.assertEqual(self.client.session["user_id"], self.doctor.id)
+        tables = [q["sql"] for q in queries if q["sql"].startswith("SELECT") and "django_session" not in q["sql"]]
+        self.assertEqual(len(tables), 1)
+        self.assertIn("app_loginidentity", tables[0])
+
+    def test_identity_follows_renames_and_deletes(self):
+        self.doctor.email = "new@example.com"
+        self.doctor.save()
+        self.assertIsNone(identity.lookup("d@example.com"))
+        self.assertEqual(identity.lookup("new@example.com").user_id, self.doctor.id)
+        self.doctor.delete()
+        self.assertFalse(LoginIdentity.objects.exists())
+
+    def test_identity_is_only_synced_when_its_fields_change(self):
+        with mock.patch("app.identity.sync") as sync:
+            self.doctor.phone = "2"
+            self.doctor.save()
+            Doctor.objects.get(pk=self.doctor.pk).save(update_fields=["experience"])
+            sync.assert_not_called()
+
+            self.doctor.full_name = "Dr. Renamed"
+            self.doctor.save(update_fields=["full_name"])
+            sync.assert_called_once_with("doctor", self.doctor)
+
+        self.doctor.set_password("an-0ther-pass")
+        self.doctor.save()
+        self.assertEqual(identity.lookup("d@example.com").password, self.doctor.password)
+
+    @override_settings(PASSWORD_HASH_PROFILE="default")
+    def test_hash_is_upgraded_to_the_current_profile(self):
+        self.assertTrue(self.post("d@example.com", "s3cret-pass").url.endswith(reverse("doctor_dashboard")))
+        self.doctor.refresh_from_db()
+        self.assertTrue(self.doctor.password.startswith("pbkdf2_sha256$1000000$"))
+
+    def test_failed_attempts_are_throttled_before_hashing(self):
+        for _ in range(ratelimit.LOGIN_LIMIT):
+            self.post("d@example.com", "wrong", ip="10.0.0.2")
+        with mock.patch("app.identity.check_password") as check:
+            self.post("d@example.com", "s3cret-pass", ip="10.0.0.3")
+        check.assert_not_called()
+        self.assertNotIn("user_id", self.client.session)
+
+
+class FakeRecordsContract:
+    """
+    Stands in for PatientRecords: serves paged reads and fixed events, counts
+    calls. ``asynchronous`` makes it behave like an AsyncWeb3 contract.
+    """
+
+    def __init__(self, records, asynchronous=False):
+        self.records = records
+        self.asynchronous = asynchronous
+        self.calls = Counter()
+        self.events_since = []
+        self.block_number = 1
+        self.w3 = mock.Mock()
+        type(self.w3.eth).block_number = mock.PropertyMock(side_effect=lambda: self._result(self.block_number))
+        self.functions = mock.Mock()
+        self.functions.getRecordCount.side_effect = self._call("getRecordCount", lambda pid: len(self.records))
+        self.functions.getRecordsRange.side_effect = self._call(
+            "getRecordsRange", lambda pid, offset, limit: [(pid, h, 100) for h in self.records[offset:offset + limit]])
+        self.functions.getLatestRecord.side_effect = self._call(
+            "getLatestRecord", lambda pid: (pid, self.records[-1], 100))
+        self.events = mock.Mock()
+        self.events.RecordAdded.return_value.get_logs.side_effect = lambda **kw: self._result(self.events_since)
+
+    def _result(self, value):
+        if not self.asynchronous:
+            return value
+
+        async def result():
+            return value
+        return result()
+
+    def _call(self, name, result):
+        def function(*args):
+            self.calls[name] += 1
+            return mock.Mock(call=lambda: self._result(result(*args)))
+        return function
+
+
+class VerifyHashApiTests(TestCase):
+    """verify-hash/api checks the local chain and reads getRecords through the cache."""
+
+    def setUp(self):
+        cache.clear()
+        chain_reader._watched_at = 0.0
+        self.patient = make_patient()
+        self.entry = PatientHistory(patient=self.patient, full_name="Test Patient", age=40, gender="Male",
+                                    email="p@example.com", phone="123", address="Somewhere")
+        self.hash = ledger.append_entry(self.patient, self.entry)
+        self.contract = FakeRecordsContract([self.hash], asynchronous=True)
+        patcher = mock.patch("app.blockchain.get_async_contract", return_value=self.contract)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        session = self.client.session
+        session.update({"user_id": 1, "user_role": "doctor"})
+        session.save()
+
+    def verify(self, **params):
+        return self.client.get(reverse("verify_hash_api"), params)
+
+    def test_anchored_hash_is_valid_and_reads_are_cached(self):
+        qr = json.dumps({"final_blockchain_hash": self.hash, "full_history": []})
+        data = self.verify(payload=qr).json()
+        self.assertTrue(data["valid"])
+        self.assertEqual(data["local"], {"found": True, "patient_id": self.patient.id, "entry": "patienthistory",
+                                         "intact": True, "is_head": True})
+        self.verify(hash=self.hash)
+        self.assertEqual(self.contract.calls, {"getLatestRecord": 1})
+
+    def test_older_hashes_are_read_in_pages_and_extended_after_events(self):
+        self.contract.records = [self.hash] + [f"{i:064x}" for i in range(250)]
+        self.verify(hash=self.hash)
+        self.assertEqual(self.contract.calls["getRecordsRange"], 3)  # 251 records, 100 per page
+
+        self.contract.records.append("ee" * 32)
+        self.contract.block_number = 2
+        self.contract.events_since = [{"args": {"patientId": self.patient.id}}]
+        chain_reader._watched_at = 0.0  # next watch is due
+        self.verify(hash=self.hash)
+        self.assertEqual(self.contract.calls["getRecordsRange"], 4)  # only the new tail
+        self.assertEqual(chain_reader.records(self.patient.id)[-1][0], "ee" * 32)
+
+    def test_signed_qr_envelope_resolves_to_the_record(self):
+        payload = qr_envelope.encode(self.patient.id, self.hash)
+        self.assertLess(len(payload), 140)
+        data = self.verify(payload=payload).json()
+        self.assertTrue(data["valid"])
+        self.assertEqual(data["patient"]["full_name"], "Test Patient")
+
+        body = qr_envelope.b45decode(payload[len(qr_envelope.PREFIX):])
+        forged = qr_envelope.PREFIX + qr_envelope.b45encode(body[:9] + b"\x02" + body[10:])  # other patient id
+        self.assertEqual(self.verify(payload=forged).status_code, 400)
+
+    def test_unanchored_link_is_vouched_for_by_a_later_anchored_one(self):
+        def snapshot(disease):
+            return PatientHistory(patient=self.patient, full_name="Test Patient", age=40, gender="Male",
+                                  email="p@example.com", phone="123", address="Somewhere", disease=disease)
+
+        middle = ledger.append_entry(self.patient, snapshot("Flu"))   # like save_patient_record's history link
+        anchored = ledger.append_entry(self.patient, snapshot("Cold"))
+        self.contract.records = [self.hash, anchored]
+
+        data = self.verify(hash=middle).json()
+        self.assertTrue(data["valid"])
+        self.assertEqual((data["onchain"]["via"], data["onchain"]["anchored_by"]), ("record", anchored))
+
+        PatientHistory.objects.filter(blockchain_hash=anchored).update(disease="changed")
+        data = self.verify(hash=middle).json()
+        self.assertEqual((data["valid"], data["onchain"]["anchored_by"]), (False, None))
+
+    def test_bad_envelope_next_to_a_hash_is_rejected(self):
+        payload = qr_envelope.encode(self.patient.id, self.hash)
+        tampered = payload[:-3] + ("A" if payload[-3] != "A" else "B") + payload[-2:]
+        for bad in (tampered, qr_envelope.PREFIX + "not base45!", qr_envelope.PREFIX):
+            response = self.verify(hash=self.hash, payload=bad)
+            self.assertEqual(response.status_code, 400, bad)
+            self.assertIn("Invalid QR code", response.json()["error"])
+
+    async def test_served_on_the_async_stack(self):
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse("verify_hash_api"), {"hash": self.hash})
+        self.assertTrue(response.json()["valid"])
+        self.assertIn("web3;dur=", response["Server-Timing"])
+
+    def test_tampered_and_unknown_hashes(self):
+        PatientHistory.objects.filter(pk=self.entry.pk).update(disease="changed")
+        data = self.verify(hash=self.hash).json()
+        self.assertEqual((data["valid"], data["local"]["intact"]), (False, False))
+        self.assertEqual(self.verify(hash="ff" * 32).status_code, 404)
+
+
+class ChainIndexerTests(TestCase):
+    """index_chain mirrors contract events and resumes from its checkpoint."""
+
+    def setUp(self):
+        self.contract = FakeRecordsContract([])
+        self.contract.block_number = 5
+        self.logs = {"RecordAdded": [], "MerkleRootAdded": []}
+        for name, logs in self.logs.items():
+            getattr(self.contract.events, name).return_value.get_logs.side_effect = (
+                lambda from_block, to_block, logs=logs:
+                    [e for e in logs if from_block <= e["blockNumber"] <= to_block])
+
+    def add_event(self, name, block, **args):
+        self.logs[name].append({"args": args, "blockNumber": block, "logIndex": 0,
+                                "transactionHash": bytes([block]) * 32})
+
+    def test_events_are_indexed_once_and_resume_from_checkpoint(self):
+        self.add_event("RecordAdded", 2, patientId=7, hashValue="aa" * 32, timestamp=1000)
+        self.add_event("MerkleRootAdded", 4, root=b"\xbb" * 32, leafCount=3, timestamp=1001)
+
+        self.assertEqual(indexer.run_once(self.contract, batch_blocks=2), (2, 5))
+        self.assertEqual(indexer.checkpoint(), 5)
+        self.assertEqual(chain_reader.record_timestamp(7, "aa" * 32, self.contract), 1000)
+        self.assertEqual(chain_reader.root_timestamp("bb" * 32, self.contract), 1001)
+        self.assertEqual(sum(self.contract.calls.values()), 0)  # answered from ChainRecord
+
+        self.add_event("RecordAdded", 6, patientId=7, hashValue="cc" * 32, timestamp=1002)
+        self.contract.block_number = 6
+        self.assertEqual(indexer.run_once(self.contract), (1, 6))
+        self.assertEqual(indexer.run_once(self.contract, from_block=0), (0, 6))  # re-read: no duplicates
+        self.assertEqual(ChainRecord.objects.filter(patient_id=7).count(), 2)
+
+    def test_index_chain_survives_a_node_outage(self):
+        class Stop(Exception):
+            pass
+
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch("app.blockchain.get_contract", return_value=self.contract), \
+                mock.patch("app.blockchain.health", return_value={"connected": True}) as health, \
+                mock.patch("app.indexer.run_once", side_effect=[ConnectionError("node gone"), (1, 5)]), \
+                mock.patch("time.sleep", side_effect=[None, Stop]):
+            with self.assertRaises(Stop):
+                call_command("index_chain", stdout=out, stderr=err)
+        self.assertIn("Indexing interrupted: node gone", err.getvalue())
+        self.assertIn("indexed=1 block=5", out.getvalue())
+        self.assertEqual([c.args for c in health.call_args_list], [(False,), (True,)])
+
+    def test_added_rows_are_counted_without_counting_the_table(self):
+        self.add_event("RecordAdded", 1, patientId=7, hashValue="aa" * 32, timestamp=1000)
+        indexer.index_range(self.contract, 0, 1)
+        self.add_event("RecordAdded", 2, patientId=8, hashValue="dd" * 32, timestamp=1001)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(indexer.index_range(self.contract, 0, 2), 1)
+        self.assertFalse([q["sql"] for q in queries if "COUNT(" in q["sql"]])
+        self.assertEqual(ChainRecord.objects.count(), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_EXECUTOR="sync")
+class BulkImportTests(TestCase):
+    """Bulk import builds the same chain, jobs and counters as one-by-one registration."""
+
+    CSV = (
+        "full_name,age,gender,email,phone,address,disease,doctor_assigned\n"
+        "Ann,30,Female,ann@example.com,1,Street 1,Flu,Dr. E\n"
+        "Bob,41,Male,BOB@example.com,2,Street 2,,Dr. E\n"
+        "Bad,old,Male,bad@example.com,3,Street 3,,\n"
+        "Ann again,30,Female,ann@example.com,4,Street 4,,\n"
+        "Cid,52,Other,cid@example.com,5,Street 5,,\n"
+    )
+
+    def setUp(self):
+        cache.clear()
+        stats.reconcile()
+
+    def test_csv_import_in_chunks(self):
+        seen = []
+        rows = bulk_import.read_rows(io.BytesIO(self.CSV.encode()), "csv")
+        with self.captureOnCommitCallbacks(execute=True):
+            report = bulk_import.import_patients(rows, chunk_size=2, progress=lambda r: seen.append(r.imported))
+
+        self.assertEqual((report.imported, report.skipped), (3, 2))
+        self.assertEqual([row for row, _ in report.errors], [3, 4])
+        self.assertEqual(seen, [2, 2, 3])
+
+        bob = Patient.objects.get(email="bob@example.com")
+        self.assertTrue(ledger.verify_chain(bob).ok)
+        self.assertTrue(bob.qr_code.name.startswith("qrcodes/"))
+        self.assertEqual(identity.lookup("bob@example.com").user_id, bob.id)
+        self.assertEqual(stats.snapshot()["patients_by_doctor"], {"Dr. E": 2, "": 1})
+        self.assertEqual(AnchorJob.objects.values("batch_key").distinct().count(), 2)
+
+    def test_endpoint_requires_staff(self):
+        upload = io.BytesIO(b'[{"full_name": "Dee", "age": 9, "gender": "Female", "email": "d@x.com",'
+                            b' "phone": "1", "address": "A"}]')
+        upload.name = "patients.json"
+        url = reverse("import_patients")
+        self.assertEqual(self.client.post(url, {"file": upload}).status_code, 403)
+
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        upload.seek(0)
+        self.assertEqual(self.client.post(url, {"file": upload}).json()["imported"], 1)
+
+    def test_unreadable_uploads_are_rejected(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        url = reverse("import_patients")
+        for name, body in [("huge-field.csv", b"full_name,email\nAnn," + b"x" * 200000 + b"\n"),
+                           ("bad-utf8.csv", b"full_name,email\n\xff\xfe\xfa,a@example.com\n"),
+                           ("bad.json", b"[{not json")]:
+            upload = io.BytesIO(body)
+            upload.name = name
+            response = self.client.post(url, {"file": upload})
+            self.assertEqual(response.status_code, 400, name)
+            self.assertIn("Could not read input", response.json()["error"])
+
+    def test_input_breaking_mid_file_keeps_the_report(self):
+        lines = [json.dumps({"full_name": f"P{i}", "age": 30, "gender": "Female", "email": f"p{i}@example.com",
+                             "phone": str(i), "address": "A"}) for i in range(1, 6)]
+        body = ("\n".join(lines) + "\n{not json\n" + lines[0] + "\n").encode()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = bulk_import.import_patients(bulk_import.read_rows(io.BytesIO(body), "jsonl"), chunk_size=2)
+        self.assertEqual((report.imported, report.skipped, report.stopped_at), (5, 1, 6))
+        self.assertEqual(report.errors[0][0], 6)
+        self.assertIn("stopped reading", report.errors[0][1])
+
+        Patient.objects.all().delete()
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        upload = io.BytesIO(body)
+        upload.name = "patients.jsonl"
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("import_patients"), {"file": upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.json()["imported"], response.json()["stopped_at"]), (5, 6))
+        self.assertIn("past row 5", response.json()["error"])
+
+    @override_settings(PASSWORD_HASH_PROFILE="fast")
+    def test_emails_match_whatever_their_case(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("patient_register"), {
+                "full_name": "Fay", "age": 28, "gender": "Female", "email": " Fay@Example.COM ",
+                "phone": "1", "address": "A"})
+        patient = Patient.objects.get()
+        self.assertEqual(patient.email, "fay@example.com")
+
+        url = reverse("patient_password_create")
+        response = self.client.post(url, {"verify_email": "1", "email": "Fay@Example.COM"})
+        self.assertTrue(response.context["verified"])
+        self.client.post(url, {"set_password": "1", "email": "Fay@Example.COM",
+                               "password": "pa55-word", "confirm_password": "pa55-word"})
+        response = self.client.post(reverse("log_in"), {"email": "FAY@example.com", "password": "pa55-word"})
+        self.assertRedirects(response, reverse("patient_dashboard"), fetch_redirect_response=False)
+
+        self.client.post(reverse("edit_patient", args=[patient.pk]), {
+            "full_name": "Fay", "age": 29, "gender": "Female", "email": "Fay.New@Example.COM",
+            "phone": "1", "address": "A"})
+        self.assertEqual(Patient.objects.get().email, "fay.new@example.com")
+
+        # Accounts saved with mixed case before normalization still resolve
+        doctor = Doctor.objects.create(full_name="Dr. M", specialization="GP", email="Mixed@Example.com",
+                                       phone="1", experience=3)
+        self.assertEqual(identity.lookup("mixed@example.COM").user_id, doctor.pk)
+        self.assertEqual(identity.account("doctor", "MIXED@example.com"), doctor)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_EXECUTOR="sync")
+class ExportTests(TestCase):
+    """Exports stream the whole chain with anchoring info, as NDJSON or ZIP."""
+
+    def setUp(self):
+        rows = [(1, {"full_name": "Eve", "age": "33", "gender": "Female", "email": "eve@example.com",
+                     "phone": "1", "address": "A"})]
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_import.import_patients(rows)
+        self.patient = Patient.objects.get(email="eve@example.com")
+        doctor = Doctor.objects.create(full_name="Dr. F", specialization="GP", email="f@example.com",
+                                       phone="1", experience=3)
+        ledger.append_entry(self.patient, PatientVisit(patient=self.patient, doctor=doctor,
+                                                       visit_date=datetime.date(2025, 2, 1), diagnosis="Cold"))
+        AnchorJob.objects.filter(patient=self.patient).update(tx_hash="0xabc", block_number=9)
+
+    def test_ndjson_lists_patient_then_chain_in_order(self):
+        lines = [json.loads(line) for line in export.ndjson([self.patient.pk])]
+        self.assertEqual([line["type"] for line in lines], ["patient", "patienthistory", "patientvisit"])
+        self.assertEqual(lines[2]["prev_hash"], lines[1]["blockchain_hash"])
+        self.assertEqual(lines[1]["anchor"]["tx_hash"], "0xabc")
+        self.assertEqual(lines[0]["blockchain_hash"], lines[2]["blockchain_hash"])
+
+    def test_zip_contains_records_and_images(self):
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(export.zip_stream())))
+        names = archive.namelist()
+        self.assertIn(f"patients/{self.patient.pk}/records.ndjson", names)
+        self.assertIn(PatientHistory.objects.get(patient=self.patient).qr_code.name, names)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_endpoint_streams_own_record_only(self):
+        session = self.client.session
+        session.update({"user_id": self.patient.pk, "user_role": "patient"})
+        session.save()
+        response = self.client.get(reverse("export_records", args=[self.patient.pk]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 3)
+        self.assertEqual(self.client.get(reverse("export_all_records")).status_code, 403)
+
+
+class BenchmarkHarnessTests(TestCase):
+    """The benchmark harness seeds valid chains and every scenario runs."""
+
+    def test_seed_run_and_compare(self):
+        counts = benchmarks.seed(12)
+        self.assertEqual((counts["patients"], counts["visits"]), (12, 24))
+        self.assertTrue(ledger.verify_chain(Patient.objects.first()).ok)
+
+        results = benchmarks.run(iterations=2)
+        self.assertEqual({r.scenario for r in results}, {
+            "save_patient_record", "edit_patient", "admin_dashboard",
+            "doctor_dashboard", "patient_dashboard", "verify_hash_api"})
+
+        baseline = {"results": [{"scenario": "admin_dashboard", "p95_ms": 1e9, "queries": 1}]}
+        self.assertEqual([(s, m) for s, m, *_ in benchmarks.compare(results, baseline)],
+                         [("admin_dashboard", "queries")])
+
+
+class InstrumentationTests(TestCase):
+    """Responses carry Server-Timing and /metrics/ aggregates per view."""
+
+    def setUp(self):
+        instrumentation.reset()
+        self.doctor = Doctor.objects.create(full_name="Dr. M", specialization="GP", email="m@example.com",
+                                            phone="1", experience=3)
+        session = self.client.session
+        session.update({"user_id": self.doctor.id, "user_role": "doctor"})
+        session.save()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse("doctor_dashboard"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn("total;dur=", timing)
+
+        with instrumentation.span("web3"):
+            pass  # outside a request
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('app_request_duration_seconds_count{view="doctor_dashboard"} 1', text)
+        self.assertRegex(text, r'app_db_queries_total\{view="doctor_dashboard"\} [1-9]')
+        self.assertIn('app_span_calls_total{view="background",span="web3"} 1', text)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+
+class PatientDashboardCacheTests(TestCase):
+    """The dashboard snapshot is cached and dropped when the patient's rows change."""
+
+    def setUp(self):
+        dashboard_cache._cache().clear()
+        self.doctor = Doctor.objects.create(full_name="Dr. C", specialization="GP", email="c@example.com",
+                                            phone="1", experience=3)
+        self.patient = make_patient()
+        PatientVisit.objects.create(patient=self.patient, doctor=self.doctor, visit_date=datetime.date(2025, 1, 1))
+        session = self.client.session
+        session.update({"user_id": self.patient.id, "user_role": "patient"})
+        session.save()
+
+    def load(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("patient_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_cached_until_invalidated(self):
+        _, cold = self.load()
+        response, warm = self.load()
+        self.assertLess(warm, cold)
+        self.assertEqual(response.context["latest_visit"].doctor.full_name, "Dr. C")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PatientNotification.objects.create(patient=self.patient, title="Update")
+        response, _ = self.load()
+        self.assertEqual([n.title for n in response.context["notifications"]], ["Update"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Doctor.objects.filter(pk=self.doctor.pk).update(full_name="Dr. D")
+            self.doctor.refresh_from_db()
+            self.doctor.save()
+        response, _ = self.load()
+        self.assertEqual(response.context["latest_visit"].doctor.full_name, "Dr. D")
+
+    def test_update_paths_invalidate(self):
+        self.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            qr_images._point("qr_codes/new.png", [Patient.objects.filter(pk=self.patient.pk)])
+        response, _ = self.load()
+        self.assertEqual(response.context["patient"].qr_code.name, "qr_codes/new.png")
+
+    def test_snapshot_built_before_a_write_is_not_served_after_it(self):
+        build = dashboard_cache.build
+
+        def build_then_write(patient_id):
+            data = build(patient_id)  # rows read before the write below commits
+            with self.captureOnCommitCallbacks(execute=True):
+                PatientNotification.objects.create(patient=self.patient, title="Late")
+            return data
+
+        with mock.patch("app.dashboard_cache.build", side_effect=build_then_write):
+            self.assertEqual(dashboard_cache.snapshot(self.patient.pk)["notifications"], [])
+        titles = [n.title for n in dashboard_cache.snapshot(self.patient.pk)["notifications"]]
+        self.assertEqual(titles, ["Late"])
+
+
+class PushTests(TestCase):
+    """New notifications reach an open patient_events stream without polling."""
+
+    def setUp(self):
+        self.patient = make_patient()
+        session = self.client.session
+        session.update({"user_id": self.patient.id, "user_role": "patient"})
+        session.save()
+
+    def test_signal_publishes_on_commit(self):
+        with mock.patch.object(push.LocalBroker, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                note = PatientNotification.objects.create(patient=self.patient, title="Update")
+        channel, message = publish.call_args.args
+        self.assertEqual((channel, message["event"], message["id"]), (f"patient:{self.patient.id}", "notification", note.id))
+
+    async def test_stream_receives_events_and_replays_missed(self):
+        note = await PatientNotification.objects.acreate(patient=self.patient, title="Missed")
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse("patient_events"), headers={"Last-Event-ID": str(note.id - 1)})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        frames = aiter(response.streaming_content)
+        self.assertEqual(await anext(frames), b"retry: 3000\n\n")
+        self.assertIn(b'"title": "Missed"', await anext(frames))
+
+        channel = push.channel_for(self.patient.id)
+        self.assertEqual(push.get_broker().subscriber_count(channel), 1)
+        push.get_broker().publish(channel, {"event": "record", "data": {"kind": "patientvisit"}, "id": None})
+        self.assertEqual(await anext(frames), b'event: record\ndata: {"kind": "patientvisit"}\n\n')
+
+    async def test_closed_stream_unsubscribes(self):
+        channel = push.channel_for(self.patient.id)
+        frames = push.stream(self.patient.id)
+        await anext(frames)
+        self.assertEqual(push.get_broker().subscriber_count(channel), 1)
+        await frames.aclose()
+        self.assertEqual(push.get_broker().subscriber_count(channel), 0)
+
+    def test_wsgi_stream_is_bounded(self):
+        note = PatientNotification.objects.create(patient=self.patient, title="Missed")
+        response = self.client.get(reverse("patient_events"), headers={"Last-Event-ID": str(note.id - 1)})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        channel = push.channel_for(self.patient.id)
+        with mock.patch("app.push.KEEPALIVE", 0.01), mock.patch("app.push.WSGI_STREAM_SECONDS", 0.2):
+            frames = iter(response.streaming_content)  # WSGI: a plain iterator
+            self.assertEqual(next(frames), b"retry: 3000\n\n")
+            self.assertIn(b'"title": "Missed"', next(frames))
+            push.get_broker().publish(channel, {"event": "record", "data": {"kind": "patientvisit"}, "id": None})
+            rest = list(frames)  # ends on its own
+        self.assertEqual(rest[0], b'event: record\ndata: {"kind": "patientvisit"}\n\n')
+        self.assertIn(b": keepalive\n\n", rest)
+        self.assertEqual(push.get_broker().subscriber_count(channel), 0)
+
+    def test_broker_is_abstract(self):
+        with self.assertRaises(TypeError):
+            push.Broker()
+
+    def test_patients_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("patient_events")).status_code, 403)
+
+
+class NotificationReadTests(TestCase):
+    """Read/ack endpoints, the maintained unread counter and retention."""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.notes = [PatientNotification.objects.create(patient=self.patient, title=f"N{i}") for i in range(4)]
+        session = self.client.session
+        session.update({"user_id": self.patient.id, "user_role": "patient"})
+        session.save()
+
+    def read(self, url=None, **data):
+        return self.client.post(url or reverse("mark_notifications_read"), data).json()
+
+    def test_counter_follows_writes(self):
+        self.assertEqual(notifications.unread_count(self.patient.id), 4)  # built from the table once
+        PatientNotification.objects.create(patient=self.patient, title="N4")
+        self.notes[0].read = True
+        self.notes[0].save()
+        self.assertEqual(UnreadCounter.objects.get(patient=self.patient).unread, 4)
+        with self.assertNumQueries(1):
+            self.assertEqual(notifications.unread_count(self.patient.id), 4)
+
+    def test_mark_read_by_id_list_and_timestamp(self):
+        self.assertEqual(self.read(reverse("mark_notification_read", args=[self.notes[0].id])),
+                         {"updated": 1, "unread": 3})
+        self.assertEqual(self.read(ids=f"{self.notes[0].id},{self.notes[1].id}"), {"updated": 1, "unread": 2})
+
+        PatientNotification.objects.filter(pk=self.notes[3].pk).update(
+            created_at=timezone.now() + datetime.timedelta(hours=1))
+        with CaptureQueriesContext(connection) as queries:
+            data = self.read(before=timezone.now().isoformat())
+        self.assertEqual(data, {"updated": 1, "unread": 1})
+        self.assertEqual(sum(q["sql"].startswith("UPDATE") for q in queries), 2)  # rows + counter
+        self.assertEqual(self.read(all="1"), {"updated": 1, "unread": 0})
+        self.assertEqual(self.client.get(reverse("unread_notifications")).json(), {"unread": 0})
+
+    def test_other_patients_notifications_are_untouched(self):
+        other = make_patient(email="o@example.com")
+        note = PatientNotification.objects.create(patient=other, title="Theirs")
+        self.assertEqual(self.read(ids=str(note.id))["updated"], 0)
+        self.assertEqual(self.read()["error"], "Give ids, before or all=1.")
+
+    def test_purge_archives_and_deletes_old_read_rows(self):
+        notifications.mark_read(self.patient.id, ids=[n.id for n in self.notes[:3]])
+        later = timezone.now() + datetime.timedelta(days=notifications.RETENTION_DAYS + 1)
+        archive = io.StringIO()
+        self.assertEqual(notifications.purge_read(batch_size=2, archive=archive, now=later), 3)
+        self.assertEqual(len(archive.getvalue().splitlines()), 3)
+        self.assertEqual(list(PatientNotification.objects.filter(patient=self.patient)), [self.notes[3]])
+        self.assertEqual(notifications.unread_count(self.patient.id), 1)
+
+
+class SqliteTuningTests(TestCase):
+    """New connections are tuned and concurrent saves stop hitting "database is locked"."""
+
+    def test_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], sqlite.pragmas()["busy_timeout"])
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_wal_is_only_switched_on_once(self):
+        import sqlite3
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        path = os.path.join(folder, "db.sqlite3")
+        for expected in (["PRAGMA journal_mode = WAL"], []):
+            conn = sqlite3.connect(path)
+            statements = []
+            conn.set_trace_callback(statements.append)
+            sqlite.apply_pragmas(conn.cursor())
+            conn.close()
+            self.assertEqual([s for s in statements if s.startswith("PRAGMA journal_mode =")], expected)
+
+    def test_concurrent_saves_all_commit(self):
+        result = sqlite.stress(tuned=True, workers=4, operations=25)
+        self.assertEqual((result.committed, result.locked), (100, 0))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_EXECUTOR="sync")
+class LedgerTests(TestCase):
+    """Hash chain verification, tamper detection, checkpoints and the patient head."""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.doctor = Doctor.objects.create(full_name="Dr. L", specialization="GP", email="l@example.com",
+                                            phone="1", experience=3)
+
+    def history(self, disease="Flu"):
+        return PatientHistory(patient=self.patient, full_name="Test Patient", age=40, gender="Male",
+                              email="p@example.com", phone="123", address="Somewhere", disease=disease)
+
+    def build_chain(self):
+        return [
+            ledger.append_entry(self.patient, self.history()),
+            ledger.append_entry(self.patient, PatientVisit(patient=self.patient, doctor=self.doctor,
+                                                           visit_date=datetime.date(2025, 1, 1))),
+            ledger.append_entry(self.patient, self.history("Cold")),
+        ]
+
+    def verify(self, **kwargs):
+        return ledger.verify_chain(Patient.objects.get(pk=self.patient.pk), **kwargs)
+
+    def test_untampered_chain_verifies(self):
+        hashes = self.build_chain()
+        result = self.verify()
+        self.assertEqual((result.ok, result.checked, result.head), (True, 3, hashes[-1]))
+        self.assertEqual(ledger.find_entry(hashes[1]).pk, PatientVisit.objects.get().pk)
+        self.assertIsNone(ledger.find_entry("ff" * 32))
+
+    def test_mutated_payload_is_detected(self):
+        hashes = self.build_chain()
+        PatientHistory.objects.filter(blockchain_hash=hashes[0]).update(disease="changed")
+        result = self.verify()
+        self.assertFalse(result.ok)
+        self.assertEqual(result.broken_at, hashes[0])
+        self.assertFalse(ledger.entry_intact(ledger.find_entry(hashes[0])))
+
+    def test_mutated_prev_hash_is_detected(self):
+        hashes = self.build_chain()
+        PatientVisit.objects.filter(blockchain_hash=hashes[1]).update(prev_hash="ab" * 32)
+        result = self.verify()
+        self.assertFalse(result.ok)
+        self.assertEqual(result.reason, "chain does not reach the patient head")
+
+    def test_anchor_job_commits_with_the_entry(self):
+        ledger.append_entry(self.patient, self.history(), anchor=True)
+        self.assertEqual(AnchorJob.objects.get().hash_value, self.patient.blockchain_hash)
+
+        with mock.patch("app.anchoring.enqueue", side_effect=RuntimeError("queue down")):
+            with self.assertRaises(RuntimeError):
+                ledger.append_entry(self.patient, self.history("Cold"), anchor=True)
+        self.assertEqual(PatientHistory.objects.count(), 1)
+        self.assertTrue(self.verify().ok)
+
+    def test_checkpoint_resumes_mid_chain(self):
+        hashes = self.build_chain()
+        PatientHistory.objects.filter(blockchain_hash=hashes[0]).update(disease="changed")
+        result = self.verify(checkpoint=hashes[1])  # tampering before the checkpoint is out of scope
+        self.assertEqual((result.ok, result.checked), (True, 1))
+
+    def test_worker_writes_between_append_and_view_save_survive(self):
+        def anchor_sent(patient, hash_value):
+            job = AnchorJob.objects.create(patient=patient, hash_value=hash_value)
+            # anchor_worker sends the job before the view gets to its own save
+            anchoring._point_head([job], "0xsent")
+            return job
+
+        with mock.patch("app.anchoring.enqueue", side_effect=anchor_sent), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("edit_patient", args=[self.patient.pk]), {
+                "full_name": "Renamed", "age": 41, "gender": "Male", "email": "p@example.com",
+                "phone": "123", "address": "Somewhere"})
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual((patient.full_name, patient.tx_hash), ("Renamed", "0xsent"))
+        self.assertTrue(patient.qr_code.name.startswith("qrcodes/"))
+
+    def test_concurrent_append_does_not_rewind_the_head(self):
+        ledger.append_entry(self.patient, self.history())
+        other = Patient.objects.get(pk=self.patient.pk)
+
+        def concurrent_append(patient, hash_value):
+            # Another writer extends the chain while the view is mid-request
+            ledger.append_entry(other, PatientHistory(
+                patient=other, full_name="Test Patient", age=40, gender="Male", email="p@example.com",
+                phone="123", address="Somewhere", disease="Concurrent"))
+
+        with mock.patch("app.anchoring.enqueue", side_effect=concurrent_append):
+            self.client.post(reverse("save_patient_record"), {
+                "patient_id": self.patient.pk, "doctor_id": self.doctor.pk, "visit_date": "2025-02-01"})
+            self.client.post(reverse("edit_patient", args=[self.patient.pk]), {
+                "full_name": "Renamed", "age": 41, "gender": "Male", "email": "p@example.com",
+                "phone": "123", "address": "Somewhere"})
+
+        result = self.verify()
+        self.assertTrue(result.ok, result.reason)
+        # genesis, history + visit from the save, the edit snapshot, two concurrent entries
+        self.assertEqual(result.checked, 6)
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).full_name, "Renamed")
+
+
+class BlockchainClientTests(TestCase):
+    """The Web3 client is built lazily, once, and health checks are cached."""
+
+    def setUp(self):
+        blockchain.configure()
+        self.addCleanup(blockchain.configure)
+
+    @mock.patch("app.blockchain.CONTRACT_ADDRESS", "0x" + "11" * 20)
+    def test_client_and_contract_are_built_once(self):
+        real = blockchain.Web3.HTTPProvider
+        with mock.patch("app.blockchain.Web3.HTTPProvider", wraps=real) as provider:
+            self.assertIs(blockchain.get_web3(), blockchain.get_web3())
+            contract = blockchain.get_contract()
+            self.assertIs(blockchain.get_contract(), contract)
+        provider.assert_called_once()
+        self.assertEqual(provider.call_args.kwargs["request_kwargs"], {"timeout": blockchain.RPC_TIMEOUT})
+
+    def test_health_is_cached_until_it_expires(self):
+        statuses = [{"ok": True, "n": 1}, {"ok": False, "n": 2}, {"ok": True, "n": 3}]
+        with mock.patch("app.blockchain._check", side_effect=statuses) as check, \
+                mock.patch("app.blockchain.time.monotonic", return_value=1000.0) as clock:
+            self.assertEqual(blockchain.health()["n"], 1)
+            clock.return_value += blockchain.HEALTH_TTL
+            self.assertEqual(blockchain.health()["n"], 1)  # still fresh at exactly the TTL
+            clock.return_value += 1
+            self.assertEqual(blockchain.health()["n"], 2)
+            self.assertEqual(blockchain.health(refresh=True)["n"], 3)
+        self.assertEqual(check.call_count, 3)
+
+
+class MediaStorageTests(TestCase):
+    """Content-addressed blobs: stored once, shared by name, collected when unreferenced."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media, QR_EXECUTOR="sync")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.store = storage.content_store
+
+    def files(self, folder):
+        return self.store.listdir(folder)[1] if self.store.exists(folder) else []
+
+    def test_same_bytes_are_stored_once(self):
+        first = self.store.save("prescriptions/scan.PNG", ContentFile(b"same bytes"))
+        second = self.store.save("prescriptions/other-name.png", ContentFile(b"same bytes"))
+        third = self.store.save("prescriptions/scan.png", ContentFile(b"other bytes"))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertRegex(first, r"^prescriptions/[0-9a-f]{64}\.png$")
+        self.assertEqual(len(self.files("prescriptions")), 2)
+
+    def test_gc_media_deletes_only_unreferenced_blobs(self):
+        patient = make_patient()
+        doctor = Doctor.objects.create(full_name="Dr. G", specialization="GP", email="g@example.com",
+                                       phone="1", experience=3)
+        kept = self.store.save("prescriptions/a.png", ContentFile(b"referenced"))
+        orphan = self.store.save("prescriptions/b.png", ContentFile(b"orphan"))
+        qr = self.store.save("qrcodes/q.png", ContentFile(b"qr"))
+        PatientVisit.objects.create(patient=patient, doctor=doctor, visit_date=datetime.date(2025, 1, 1),
+                                    prescription_image=kept)
+        Patient.objects.filter(pk=patient.pk).update(qr_code=qr)
+        self.assertEqual(storage.refcounts(), Counter({kept: 1, qr: 1}))
+
+        call_command("gc_media", stdout=io.StringIO())  # orphan is inside the grace period
+        self.assertTrue(self.store.exists(orphan))
+
+        for name in (kept, orphan, qr):
+            os.utime(self.store.path(name), (0, 0))
+        call_command("gc_media", "--dry-run", stdout=io.StringIO())
+        self.assertTrue(self.store.exists(orphan))
+
+        call_command("gc_media", stdout=io.StringIO())
+        self.assertFalse(self.store.exists(orphan))
+        self.assertTrue(self.store.exists(kept))
+        self.assertTrue(self.store.exists(qr))
+
+    def test_qr_regeneration_is_idempotent(self):
+        patient = make_patient()
+        targets = [Patient.objects.filter(pk=patient.pk)]
+        payload = qr_envelope.encode(patient.pk, "ab" * 32)
+
+        with mock.patch("app.qr_images.render_png", wraps=qr_images.render_png) as render:
+            first = qr_images.schedule(payload, targets)
+            second = qr_images.schedule(payload, targets)
+
+        self.assertEqual(first, second)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(self.files("qrcodes"), [os.path.basename(first)])
+        self.assertEqual(Patient.objects.get(pk=patient.pk).qr_code.name, first)
+        # Different rendering options are a different image
+        self.assertNotEqual(qr_images.schedule(payload, targets, box_size=4), first)
+
+
+class AdminPaginationTests(TestCase):
+    """Admin tables page through filtered results with keyset cursors."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+
+    def walk(self, prefix, params):
+        """Follow ``next_url`` from the first page; returns the pks seen and the page count."""
+        seen, pages = [], 0
+        url = reverse("admin_dashboard") + "?" + "&".join(f"{k}={v}" for k, v in params.items())
+        while url:
+            page = self.client.get(url).context[f"{prefix}_page"]
+            seen.extend(item.pk for item in page.items)
+            pages += 1
+            url = page.next_url and reverse("admin_dashboard") + page.next_url
+        return seen, pages
+
+    def test_filtered_pages_have_no_duplicates_or_gaps(self):
+        # Few distinct ages, so most of the sort keys tie and the pk decides
+        for i in range(70):
+            make_patient(full_name=f"{'Match' if i % 3 else 'Other'} {i}", email=f"p{i}@example.com", age=30 + i % 4)
+        expected = set(Patient.objects.filter(full_name__icontains="match").values_list("pk", flat=True))
+
+        for sort in ("age", "-age", "-created_at"):
+            seen, pages = self.walk("patients", {"section": "patients", "p_q": "match", "p_sort": sort})
+            self.assertGreater(pages, 1)
+            self.assertEqual(len(seen), len(set(seen)), sort)
+            self.assertEqual(set(seen), expected, sort)
+
+    def test_cursor_of_the_wrong_type_falls_back_to_the_first_page(self):
+        make_patient()
+        bad = pagination.encode_cursor("garbage", 1)
+        for sort in ("-created_at", "age"):
+            response = self.client.get(reverse("admin_dashboard"), {"p_sort": sort, "p_after": bad})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context["patients_page"].is_first)
+        self.assertEqual(len(pagination.keyset_page(Patient.objects.all(), "-created_at",
+                                                    pagination.encode_cursor(["x"], 1)).items), 1)
+
+    def test_appointment_status_filter_is_kept_across_pages(self):
+        doctor = Doctor.objects.create(full_name="Dr. A", specialization="GP", email="a@example.com",
+                                       phone="1", experience=3)
+        patient = make_patient()
+        for i in range(60):
+            Appointment.objects.create(patient=patient, doctor=doctor, date=datetime.date(2025, 1, 1 + i % 3),
+                                       time=datetime.time(9), status="Cancelled" if i % 2 else "Scheduled")
+        expected = set(Appointment.objects.filter(status="Cancelled").values_list("pk", flat=True))
+
+        seen, pages = self.walk("appointments", {"section": "appointments", "a_status": "Cancelled"})
+        self.assertGreater(pages, 1)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), expected)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path
-from app import views
+from app import instrumentation, views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -16,10 +16,16 @@ urlpatterns = [
     # ✅ Dashboards
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('patient_dashboard/', views.patient_dashboard, name='patient_dashboard'),
+    path('patient_dashboard/events/', views.patient_events, name='patient_events'),
+    path('notifications/read/', views.mark_notifications_read, name='mark_notifications_read'),
+    path('notifications/<int:notification_id>/read/', views.mark_notifications_read, name='mark_notification_read'),
+    path('notifications/unread/', views.unread_notifications, name='unread_notifications'),
     path('doctor_dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
+    path('doctor_dashboard/visits/', views.doctor_visits_json, name='doctor_visits_json'),
 
     # ✅ Registration
     path('patient_register/', views.patient_register, name='patient_register'),
+    path('patients/import/', views.import_patients, name='import_patients'),
     path('doctor_register/', views.doctor_register, name='doctor_register'),
 
     # ✅ Password Setup
@@ -30,6 +36,8 @@ urlpatterns = [
     path('edit_patient/<int:patient_id>/', views.edit_patient, name='edit_patient'),
     path('delete_patient/<int:patient_id>/', views.delete_patient, name='delete_patient'),
     path('patient_history/<int:patient_id>/', views.patient_history, name='patient_history'),
+    path('export/', views.export_records, name='export_all_records'),
+    path('export/<int:patient_id>/', views.export_records, name='export_records'),
 
     # ✅ Doctor CRUD
     path('edit_doctor/<int:doctor_id>/', views.edit_doctor, name='edit_doctor'),
@@ -54,8 +62,12 @@ urlpatterns = [
     # ✅ Blockchain QR / Hash verify
     path('scan-qr/', views.scan_qr_page, name='scan_qr_page'),
     path('verify-hash/', views.verify_hash_page, name='verify_hash_page'),
+    path('verify-hash/api/', views.verify_hash_api, name='verify_hash_api'),
 
     path("save-patient-record/", views.save_patient_record, name="save_patient_record"),
+
+    # 📈 Prometheus scrape endpoint
+    path('metrics/', instrumentation.metrics_view, name='metrics'),
     
 
 ]
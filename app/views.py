@@ -3,108 +3,27 @@ from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth import logout
-from .models import Patient, Doctor, Appointment, DoctorRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Patient, Doctor, Appointment, DoctorRequest, PatientHistory
+from . import (
+    bulk_import, chain_reader, dashboard_cache, export, identity, ledger, merkle,
+    notifications, pagination, push, qr_envelope, qr_images, ratelimit, stats,
+)
 
-# 🧩 Added imports for Blockchain + QR logic
-import qrcode
 import json
-import uuid
-import os
-from django.conf import settings
-import hashlib
-
-# 🧩 Web3 imports
-from web3 import Web3
-
-# ✅ Connect to Ganache
-ganache_url = "http://127.0.0.1:7545"
-web3 = Web3(Web3.HTTPProvider(ganache_url))
-
-# --------------------------------------
-# 🔍 CHECK GANACHE CONNECTION
-# --------------------------------------
-if web3.is_connected():
-    print("✔ Connected to Ganache RPC")
-else:
-    print("❌ ERROR: Ganache is NOT running!")
-
-
-# ✅ Your Account (from Ganache first address)
-account_address = "0x4A42ee9cC198a4aeCbc4bcF22c30dF430Af1F493"
-private_key = "0xe541b0428279425265c8dcfb3e41cda7f3145b2eacaba33a975bae8a6932534b"  # ⚠️ Replace this safely!
-
-# --------------------------------------
-# 🔍 CHECK ACCOUNT BALANCE
-# --------------------------------------
-try:
-    balance = web3.eth.get_balance(account_address)
-    print("✔ Account found. Balance:", web3.from_wei(balance, "ether"), "ETH")
-except:
-    print("❌ ERROR: Account not found in Ganache! Use first Ganache account.")
-
-
-# ✅ Contract details
-contract_address = web3.to_checksum_address("0x8b00c6e241B44C99Eb3b074E7121aBfB19B85AB8")
-
-# --------------------------------------
-# 🔍 CHECK CONTRACT IS DEPLOYED
-# --------------------------------------
-try:
-    web3.eth.get_code(contract_address)
-    print("✔ Smart contract loaded successfully!")
-except Exception as e:
-    print("❌ ERROR: Contract not found on Ganache:", str(e))
-
-
-# ✅ ABI (copied from Remix output)
-contract_abi = [
-  {
-    "inputs": [
-      {"internalType": "uint256", "name": "patientId", "type": "uint256"},
-      {"internalType": "string", "name": "hashValue", "type": "string"}
-    ],
-    "name": "addRecord",
-    "outputs": [],
-    "stateMutability": "nonpayable",
-    "type": "function"
-  },
-  {
-    "inputs": [
-      {"internalType": "uint256", "name": "patientId", "type": "uint256"}
-    ],
-    "name": "getRecords",
-    "outputs": [
-      {
-        "components": [
-          {"internalType": "uint256", "name": "patientId", "type": "uint256"},
-          {"internalType": "string", "name": "hashValue", "type": "string"},
-          {"internalType": "uint256", "name": "timestamp", "type": "uint256"}
-        ],
-        "internalType": "struct PatientRecords.Record[]",
-        "name": "",
-        "type": "tuple[]"
-      }
-    ],
-    "stateMutability": "view",
-    "type": "function"
-  }
-]
-
-# 🧩 Load the contract
-contract = web3.eth.contract(address=contract_address, abi=contract_abi)
 
 def index(request):
     return render(request, 'index.html')
 
 def patient_register(request):
     if request.method == "POST":
-        import qrcode, json, os, hashlib, uuid
-        from django.conf import settings
-
         full_name = request.POST.get('full_name')
         age = request.POST.get('age')
         gender = request.POST.get('gender')
-        email = request.POST.get('email')
+        email = identity.normalize_email(request.POST.get('email')) or None  # lowercase, as bulk import stores it
         phone = request.POST.get('phone')
         address = request.POST.get('address')
         disease = request.POST.get('disease')
@@ -123,60 +42,29 @@ def patient_register(request):
                 doctor_assigned=doctor_assigned
             )
 
-            # 2️⃣ Build blockchain chain (initial record)
-            initial_record = [{
-                "patient_id": patient.id,
-                "full_name": full_name,
-                "age": age,
-                "gender": gender,
-                "email": email,
-                "phone": phone,
-                "address": address,
-                "disease": disease,
-                "doctor_assigned": doctor_assigned,
-            }]
-
-            # 3️⃣ Generate blockchain hash
-            chain_json = json.dumps(initial_record, sort_keys=True)
-            blockchain_hash = hashlib.sha256(chain_json.encode()).hexdigest()
-
-            # 4️⃣ Prepare QR data (with final hash + history)
-            qr_data = {
-                "final_blockchain_hash": blockchain_hash,
-                "full_history": initial_record
-            }
-
-            # 5️⃣ Generate and save QR Code
-            qr = qrcode.make(json.dumps(qr_data, indent=2))
-            qr_filename = f"patient_{patient.id}_qr.png"
-            qr_folder = os.path.join(settings.MEDIA_ROOT, 'qrcodes')
-            os.makedirs(qr_folder, exist_ok=True)
-            qr_path = os.path.join(qr_folder, qr_filename)
-            qr.save(qr_path)
-
-            # 6️⃣ Save blockchain hash & QR path
-            patient.blockchain_hash = blockchain_hash
-            patient.qr_code = f"qrcodes/{qr_filename}"
-            patient.save()
-
-            # ✅ 7️⃣ (Optional) Future — store hash on blockchain (Ganache + MetaMask)
-            """
-            from web3 import Web3
-
-            # Connect to Ganache (make sure Ganache is running)
-            web3 = Web3(Web3.HTTPProvider("http://127.0.0.1:7545"))
-
-            contract_address = "0xd8b934580fcE35a11B58C6D73aDeE468a2833fa8"
-            abi = [ ... ABI JSON FROM REMIX ... ]
-
-            contract = web3.eth.contract(address=contract_address, abi=abi)
-            account = web3.eth.accounts[0]
-
-            tx = contract.functions.addRecord(patient.id, blockchain_hash).transact({
-                'from': account
-            })
-            web3.eth.wait_for_transaction_receipt(tx)
-            """
+            # 2️⃣ Genesis entry of the patient's hash chain
+            genesis = PatientHistory(
+                patient=patient,
+                full_name=full_name,
+                age=age,
+                gender=gender,
+                email=email,
+                phone=phone,
+                address=address,
+                disease=disease,
+                doctor_assigned=doctor_assigned,
+            )
+            # ✅ Its hash is queued for the blockchain (anchor_worker) in the same transaction
+            blockchain_hash = ledger.append_entry(patient, genesis, anchor=True)
+
+            # 3️⃣ QR carries a signed pointer (id + head hash), not the record itself
+            qr_payload = qr_envelope.encode(patient.id, blockchain_hash)
+
+            # 4️⃣ Render the QR in the background (content-addressed PNG)
+            qr_images.schedule(qr_payload, [
+                Patient.objects.filter(pk=patient.pk, blockchain_hash=blockchain_hash),
+                PatientHistory.objects.filter(pk=genesis.pk),
+            ])
 
             messages.success(request, f"✅ Patient '{full_name}' registered successfully with blockchain QR!")
             return redirect('admin_dashboard')
@@ -188,11 +76,27 @@ def patient_register(request):
     # 👇 No need to render new page — the form is inside admin_dashboard.html
     return redirect('admin_dashboard')
 
+def import_patients(request):
+    """Bulk import (CSV / JSON / JSON Lines upload in ``file``); answers a JSON report."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+    if request.method != "POST" or "file" not in request.FILES:
+        return JsonResponse({"error": "POST a CSV or JSON file as 'file'."}, status=400)
+
+    upload = request.FILES["file"]
+    fmt = request.POST.get("format") or bulk_import.format_for(upload.name)
+    report = bulk_import.import_patients(bulk_import.read_rows(upload, fmt))
+    if report.stopped_at:
+        # Rows before the break are imported; the report says how far it got
+        return JsonResponse({"error": f"Could not read input past row {report.stopped_at - 1}.",
+                             **report.as_dict()}, status=400)
+    return JsonResponse(report.as_dict())
+
 def doctor_register(request):
     if request.method == "POST":
         full_name = request.POST.get('full_name')
         specialization = request.POST.get('specialization')
-        email = request.POST.get('email')
+        email = identity.normalize_email(request.POST.get('email')) or None
         phone = request.POST.get('phone')
         experience = request.POST.get('experience')
         photo = request.FILES.get('photo')
@@ -220,48 +124,39 @@ from .models import Patient, Doctor
 
 def log_in(request):
     if request.method == "POST":
-        email = request.POST.get("email")
+        email = identity.normalize_email(request.POST.get("email"))
         password = request.POST.get("password")
+        throttle_keys = [("login-email", email), ("login-ip", request.META.get("REMOTE_ADDR"))]
 
-        # 🩺 Check if email exists in Patient table
-        try:
-            patient = Patient.objects.get(email=email)
-            if not patient.is_password_set:
-                messages.error(request, "Please create your password before logging in.")
-                return redirect("patient_password_create")
-
-            if patient.check_password(password):
-                request.session["user_role"] = "patient"
-                request.session["user_id"] = patient.id
-                messages.success(request, f"Welcome {patient.full_name}!")
-                return redirect("patient_dashboard")
-            else:
-                messages.error(request, "Incorrect password.")
-                return redirect("log_in")
-        except Patient.DoesNotExist:
-            pass  # If not found, move on to check Doctor
+        # 🚦 Refuse before hashing once this email / address keeps failing
+        if ratelimit.blocked(throttle_keys):
+            messages.error(request, "Too many failed login attempts. Please try again in a few minutes.")
+            return redirect("log_in")
 
-        # 👨‍⚕️ Check if email exists in Doctor table
-        try:
-            doctor = Doctor.objects.get(email=email)
-            if not doctor.is_password_set:
-                messages.error(request, "Please create your password before logging in.")
-                return redirect("doctor_password_create")
-
-            if doctor.check_password(password):
-                request.session["user_role"] = "doctor"
-                request.session["user_id"] = doctor.id
-                messages.success(request, f"Welcome Dr. {doctor.full_name}!")
-                return redirect("doctor_dashboard")
-            else:
-                messages.error(request, "Incorrect password.")
-                return redirect("log_in")
-        except Doctor.DoesNotExist:
-            pass
+        # 🔎 One indexed lookup across patients and doctors
+        account = identity.lookup(email)
+        if account is None:
+            ratelimit.hit(throttle_keys)
+            messages.error(request, "No account found with this email.")
+            return redirect("log_in")
 
-        # ❌ If no record found
-        messages.error(request, "No account found with this email.")
-        return redirect("log_in")
+        if not account.is_password_set:
+            messages.error(request, "Please create your password before logging in.")
+            return redirect(f"{account.role}_password_create")
+
+        if not identity.verify(account, password):
+            ratelimit.hit(throttle_keys)
+            messages.error(request, "Incorrect password.")
+            return redirect("log_in")
+
+        ratelimit.reset(throttle_keys[:1])
+        request.session["user_role"] = account.role
+        request.session["user_id"] = account.user_id
+        if account.role == "doctor":
+            messages.success(request, f"Welcome Dr. {account.full_name}!")
+        else:
+            messages.success(request, f"Welcome {account.full_name}!")
+        return redirect(f"{account.role}_dashboard")
 
     return render(request, "login.html")
 
@@ -293,26 +188,75 @@ def admin_login(request):
 
 
 def admin_dashboard(request):
+    # 🧾 Each table is keyset-paginated, searchable and sortable on its own
+    patients_page = pagination.table_page(
+        request, 'p_',
+        Patient.objects.only(
+            'id', 'full_name', 'email', 'age', 'gender', 'phone', 'disease',
+            'doctor_assigned', 'qr_code', 'blockchain_hash', 'tx_hash', 'created_at',
+        ),
+        sorts=['-created_at', 'created_at', 'full_name', '-full_name', 'age', '-age'],
+        search_fields=['full_name', 'email', 'phone'],
+        section='patients',
+    )
+    doctors_page = pagination.table_page(
+        request, 'd_',
+        Doctor.objects.only(
+            'id', 'full_name', 'email', 'specialization', 'experience', 'phone', 'photo', 'created_at',
+        ),
+        sorts=['-created_at', 'created_at', 'full_name', '-full_name', '-experience', 'experience'],
+        search_fields=['full_name', 'email', 'specialization'],
+        section='doctors',
+    )
+
+    appointments = Appointment.objects.select_related('patient', 'doctor').only(
+        'id', 'date', 'time', 'status', 'created_at', 'patient__full_name', 'doctor__full_name',
+    )
+    appointment_status = request.GET.get('a_status', '')
+    if appointment_status:
+        appointments = appointments.filter(status=appointment_status)
+    appointments_page = pagination.table_page(
+        request, 'a_', appointments,
+        sorts=['-date', 'date', '-created_at', 'status'],
+        search_fields=['patient__full_name', 'doctor__full_name'],
+        section='appointments',
+    )
+
     context = {
-        'all_patients': Patient.objects.all().order_by('-created_at'),
-        'all_doctors': Doctor.objects.all().order_by('-created_at'),
-        'all_appointments': Appointment.objects.all().order_by('-date'),
-        'total_patients': Patient.objects.count(),
-        'total_doctors': Doctor.objects.count(),
-        'total_appointments': Appointment.objects.count(),
+        'all_patients': patients_page.items,
+        'all_doctors': doctors_page.items,
+        'all_appointments': appointments_page.items,
+        'patients_page': patients_page,
+        'doctors_page': doctors_page,
+        'appointments_page': appointments_page,
+        'appointment_status': appointment_status,
+        'recent_patients': Patient.objects.only('id', 'full_name', 'age', 'disease').order_by('-created_at')[:5],
+        'recent_doctors': Doctor.objects.only(
+            'id', 'full_name', 'specialization', 'experience', 'photo'
+        ).order_by('-created_at')[:5],
+        'section': request.GET.get('section', 'home'),
     }
+    # 📊 Totals and breakdowns come from the maintained counters, not COUNT(*)
+    context.update(stats.snapshot())
     return render(request, 'admin_dashboard.html', context)
 
+# Demographics edit_patient takes from the form (and writes back)
+PATIENT_EDIT_FIELDS = [
+    'full_name', 'age', 'gender', 'email', 'phone', 'address', 'disease', 'doctor_assigned',
+]
+
+
 def edit_patient(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id)
 
     if request.method == "POST":
-        from .models import PatientHistory
-        import qrcode, json, os, hashlib
-        from django.conf import settings
+        # 1️⃣ Update patient data from form
+        for field in PATIENT_EDIT_FIELDS:
+            setattr(patient, field, request.POST.get(field))
+        patient.email = identity.normalize_email(patient.email) or None
 
-        # 1️⃣ Save the old data to history before updating
-        PatientHistory.objects.create(
+        # 2️⃣ Record the new version as the next link of the chain
+        snapshot = PatientHistory(
             patient=patient,
             full_name=patient.full_name,
             age=patient.age,
@@ -322,80 +266,22 @@ def edit_patient(request, patient_id):
             address=patient.address,
             disease=patient.disease,
             doctor_assigned=patient.doctor_assigned,
-            blockchain_hash=patient.blockchain_hash,
-            qr_code=patient.qr_code
         )
 
-        # 2️⃣ Update patient data from form
-        patient.full_name = request.POST.get('full_name')
-        patient.age = request.POST.get('age')
-        patient.gender = request.POST.get('gender')
-        patient.email = request.POST.get('email')
-        patient.phone = request.POST.get('phone')
-        patient.address = request.POST.get('address')
-        patient.disease = request.POST.get('disease')
-        patient.doctor_assigned = request.POST.get('doctor_assigned')
-
-        # 3️⃣ Combine all history + current data
-        history_records = list(patient.history_records.values(
-            "patient_id", "full_name", "age", "gender", "email",
-            "phone", "address", "disease", "doctor_assigned", "blockchain_hash"
-        ))
-        current_data = {
-            "patient_id": patient.id,
-            "full_name": patient.full_name,
-            "age": patient.age,
-            "gender": patient.gender,
-            "email": patient.email,
-            "phone": patient.phone,
-            "address": patient.address,
-            "disease": patient.disease,
-            "doctor_assigned": patient.doctor_assigned
-        }
-        history_records.append(current_data)
-
-        # 4️⃣ Create a new blockchain hash of full chain
-        chain_json = json.dumps(history_records, sort_keys=True)
-        new_hash = hashlib.sha256(chain_json.encode()).hexdigest()
-        patient.blockchain_hash = new_hash
-
-        # 5️⃣ Send transaction to blockchain via Ganache
-        try:
-            nonce = web3.eth.get_transaction_count(account_address)
-            txn = contract.functions.addRecord(patient.id, new_hash).build_transaction({
-                'from': account_address,
-                'nonce': nonce,
-                'gas': 2000000,
-                'gasPrice': web3.to_wei('50', 'gwei')
-            })
-
-            signed_txn = web3.eth.account.sign_transaction(txn, private_key=private_key)
-            tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+        # 3️⃣ Only the new link is hashed — O(1) per edit
+        # 4️⃣ ...and queued for the anchor worker in the same transaction (no RPC in the request)
+        # (append_entry also clears tx_hash and qr_code: ⏳ until anchor_worker / the QR pool fill them in)
+        new_hash = ledger.append_entry(patient, snapshot, anchor=True)
 
-            blockchain_tx_hash = tx_hash.hex()
-            patient.tx_hash = blockchain_tx_hash  # ✅ store TX hash in database
+        # Only the form fields: append_entry owns the chain head, tx hash and
+        # QR, and a stale copy would overwrite what the workers wrote meanwhile
+        patient.save(update_fields=PATIENT_EDIT_FIELDS)
 
-        except Exception as e:
-            blockchain_tx_hash = f"Error: {str(e)}"
-            patient.tx_hash = None
-
-        # 6️⃣ Generate updated QR Code
-        qr_data = {
-            "final_blockchain_hash": new_hash,
-            "blockchain_tx_hash": blockchain_tx_hash,
-            "full_history": history_records
-        }
-        qr = qrcode.make(json.dumps(qr_data, indent=2))
-
-        qr_filename = f"patient_{patient.id}_chain_qr.png"
-        qr_folder = os.path.join(settings.MEDIA_ROOT, 'qrcodes')
-        os.makedirs(qr_folder, exist_ok=True)
-        qr_path = os.path.join(qr_folder, qr_filename)
-        qr.save(qr_path)
-
-        patient.qr_code = f"qrcodes/{qr_filename}"
-        patient.save()
+        # 5️⃣ Updated QR Code: constant-size pointer, rendered in the background
+        qr_images.schedule(qr_envelope.encode(patient.id, new_hash), [
+            Patient.objects.filter(pk=patient.pk, blockchain_hash=new_hash),
+            PatientHistory.objects.filter(pk=snapshot.pk),
+        ])
 
         messages.success(request, "✅ Patient updated and blockchain record stored successfully!")
         return redirect('admin_dashboard')
@@ -416,6 +302,31 @@ def patient_history(request, patient_id):
     }
     return render(request, "patient_history.html", context)
 
+def export_records(request, patient_id=None):
+    """
+    Stream one patient's chain (``/export/<id>/``) or everyone's
+    (``/export/``, staff only) as NDJSON, or as a ZIP with images
+    (``?format=zip``).
+    """
+    own_record = request.session.get("user_role") == "patient" and request.session.get("user_id") == patient_id
+    if not (request.user.is_staff or (patient_id is not None and own_record)):
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    patient_ids = None
+    if patient_id is not None:
+        get_object_or_404(Patient.objects.only("id"), id=patient_id)
+        patient_ids = [patient_id]
+
+    name = f"patient-{patient_id}" if patient_id is not None else "patients"
+    if request.GET.get("format") == "zip":
+        response = StreamingHttpResponse(export.zip_stream(patient_ids), content_type="application/zip")
+        name += ".zip"
+    else:
+        response = StreamingHttpResponse(export.ndjson(patient_ids), content_type="application/x-ndjson")
+        name += ".ndjson"
+    response["Content-Disposition"] = f'attachment; filename="{name}"'
+    return response
+
 def delete_patient(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id)
     patient.delete()
@@ -467,27 +378,25 @@ def patient_password_create(request):
     Step 1: Verify patient's email.
     Step 2: If valid, allow password + confirm password creation.
     """
-    from .models import Patient
-
     verified = False
     email = None
 
     # Step 1 — Verify email
     if request.method == "POST" and "verify_email" in request.POST:
-        email = request.POST.get("email")
-        try:
-            patient = Patient.objects.get(email=email)
-            if patient.is_password_set:
-                messages.warning(request, "You already created a password. Please login instead.")
-                return redirect("log_in")
+        email = identity.normalize_email(request.POST.get("email"))
+        patient = identity.account("patient", email)
+        if patient is None:
+            messages.error(request, "No patient found with that email. Please contact the admin.")
+        elif patient.is_password_set:
+            messages.warning(request, "You already created a password. Please login instead.")
+            return redirect("log_in")
+        else:
             verified = True
             return render(request, "patient_password_create.html", {"verified": verified, "email": email})
-        except Patient.DoesNotExist:
-            messages.error(request, "No patient found with that email. Please contact the admin.")
 
     # Step 2 — Set password
     elif request.method == "POST" and "set_password" in request.POST:
-        email = request.POST.get("email")
+        email = identity.normalize_email(request.POST.get("email"))
         password = request.POST.get("password")
         confirm_password = request.POST.get("confirm_password")
 
@@ -495,15 +404,14 @@ def patient_password_create(request):
             messages.error(request, "Passwords do not match.")
             return render(request, "patient_password_create.html", {"verified": True, "email": email})
 
-        try:
-            patient = Patient.objects.get(email=email)
-            patient.set_password(password)
-            patient.save()
-            messages.success(request, "Password created successfully! You can now login.")
-            return redirect("log_in")
-        except Patient.DoesNotExist:
+        patient = identity.account("patient", email)
+        if patient is None:
             messages.error(request, "Error: patient not found.")
             return redirect("patient_password_create")
+        patient.set_password(password)
+        patient.save(update_fields=["password", "is_password_set"])
+        messages.success(request, "Password created successfully! You can now login.")
+        return redirect("log_in")
 
     return render(request, "patient_password_create.html", {"verified": verified})
 
@@ -512,27 +420,25 @@ def doctor_password_create(request):
     Step 1: Verify doctor's email.
     Step 2: If valid, allow password + confirm password creation.
     """
-    from .models import Doctor
-
     verified = False
     email = None
 
     # Step 1 — Verify email
     if request.method == "POST" and "verify_email" in request.POST:
-        email = request.POST.get("email")
-        try:
-            doctor = Doctor.objects.get(email=email)
-            if doctor.is_password_set:
-                messages.warning(request, "You already created a password. Please login instead.")
-                return redirect("log_in")
+        email = identity.normalize_email(request.POST.get("email"))
+        doctor = identity.account("doctor", email)
+        if doctor is None:
+            messages.error(request, "No doctor found with that email. Please contact the admin.")
+        elif doctor.is_password_set:
+            messages.warning(request, "You already created a password. Please login instead.")
+            return redirect("log_in")
+        else:
             verified = True
             return render(request, "doctor_password_create.html", {"verified": verified, "email": email})
-        except Doctor.DoesNotExist:
-            messages.error(request, "No doctor found with that email. Please contact the admin.")
 
     # Step 2 — Set password
     elif request.method == "POST" and "set_password" in request.POST:
-        email = request.POST.get("email")
+        email = identity.normalize_email(request.POST.get("email"))
         password = request.POST.get("password")
         confirm_password = request.POST.get("confirm_password")
 
@@ -540,15 +446,14 @@ def doctor_password_create(request):
             messages.error(request, "Passwords do not match.")
             return render(request, "doctor_password_create.html", {"verified": True, "email": email})
 
-        try:
-            doctor = Doctor.objects.get(email=email)
-            doctor.set_password(password)
-            doctor.save()
-            messages.success(request, "Password created successfully! You can now login.")
-            return redirect("log_in")
-        except Doctor.DoesNotExist:
+        doctor = identity.account("doctor", email)
+        if doctor is None:
             messages.error(request, "Error: doctor not found.")
             return redirect("doctor_password_create")
+        doctor.set_password(password)
+        doctor.save()
+        messages.success(request, "Password created successfully! You can now login.")
+        return redirect("log_in")
 
     return render(request, "doctor_password_create.html", {"verified": verified})
 
@@ -559,36 +464,92 @@ def patient_dashboard(request):
         messages.error(request, "Unauthorized access.")
         return redirect("log_in")
 
-    # Fetch patient
-    patient = get_object_or_404(Patient, id=user_id)
+    # Patient, doctors, latest visits/history and unread notifications:
+    # one cached snapshot, dropped whenever any of it changes
+    context = dashboard_cache.snapshot(user_id)
 
-    # All doctors (for request section)
-    doctors = Doctor.objects.all()
+    return render(request, "patient_dashboard.html", context)
 
-    # Last visit doctor saved
-    latest_visit = patient.visits.order_by('-created_at').first()
 
-    # Top 3 recent visits
-    visits = patient.visits.order_by('-created_at')[:3]
+async def patient_events(request):
+    """Server-Sent Events: the patient's new notifications and record updates, pushed live"""
+    user_id = await request.session.aget("user_id")
+    if await request.session.aget("user_role") != "patient" or not user_id:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
 
-    # Last 3 patient history entries
-    history_records = patient.history_records.order_by('-updated_at')[:3]
+    last_event_id = request.headers.get("Last-Event-ID")
+    if isinstance(request, ASGIRequest):
+        events = push.stream(user_id, last_event_id)
+    else:
+        # WSGI iterates the body in a worker thread: bounded stream, then the browser reconnects
+        events = push.stream_sync(user_id, last_event_id)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx hold events back
+    return response
 
-    # Unread notifications (top 10)
-    notifications = patient.notifications.filter(read=False).order_by('-created_at')[:10]
 
-    context = {
-        "patient": patient,
-        "doctors": doctors,
-        "latest_visit": latest_visit,
-        "visits": visits,
-        "history_records": history_records,
-        "notifications": notifications,
-    }
+def _patient_id(request):
+    if request.session.get("user_role") == "patient":
+        return request.session.get("user_id")
+    return None
+
+
+def mark_notifications_read(request, notification_id=None):
+    """
+    Mark notifications read in one UPDATE: the one in the URL, ``ids``
+    (repeated or comma-separated), everything up to ``before`` (ISO
+    timestamp) or ``all=1``. Answers ``{"updated", "unread"}``.
+    """
+    patient_id = _patient_id(request)
+    if not patient_id:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required."}, status=405)
+
+    ids = before = None
+    if notification_id is not None:
+        ids = [notification_id]
+    elif request.POST.getlist("ids"):
+        try:
+            ids = [int(i) for value in request.POST.getlist("ids") for i in value.split(",") if i.strip()]
+        except ValueError:
+            return JsonResponse({"error": "ids must be integers."}, status=400)
+    elif request.POST.get("before"):
+        before = parse_datetime(request.POST["before"])
+        if before is None:
+            return JsonResponse({"error": "before must be an ISO 8601 timestamp."}, status=400)
+        if timezone.is_naive(before):
+            before = timezone.make_aware(before)
+    elif request.POST.get("all") not in ("1", "true"):
+        return JsonResponse({"error": "Give ids, before or all=1."}, status=400)
+
+    updated, unread = notifications.mark_read(patient_id, ids=ids, before=before)
+    return JsonResponse({"updated": updated, "unread": unread})
+
+
+def unread_notifications(request):
+    """The logged-in patient's unread notification count (maintained counter)."""
+    patient_id = _patient_id(request)
+    if not patient_id:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+    return JsonResponse({"unread": notifications.unread_count(patient_id)})
 
-    return render(request, "patient_dashboard.html", context)
 
 from django.db.models import Max
+from django.urls import reverse
+from .models import PatientVisit
+
+VISIT_FIELDS = (
+    'id', 'visit_date', 'diagnosis', 'qr_code', 'blockchain_hash', 'sent_to_patient',
+    'created_at', 'patient__id', 'patient__full_name',
+)
+
+
+def doctor_visits(doctor):
+    """The doctor's visits with patient names joined in, newest first."""
+    return PatientVisit.objects.filter(doctor=doctor).select_related('patient').only(*VISIT_FIELDS)
+
 
 def doctor_dashboard(request):
     """Doctor dashboard with requests + updated records"""
@@ -600,11 +561,11 @@ def doctor_dashboard(request):
 
     doctor = get_object_or_404(Doctor, id=user_id)
 
-    # Pending patient requests
+    # Pending patient requests (patient joined in, no query per row)
     pending_requests = DoctorRequest.objects.filter(
         doctor=doctor,
         status="Pending"
-    )
+    ).select_related("patient")
 
     # Only latest Accepted request for each patient
     latest_ids = DoctorRequest.objects.filter(
@@ -614,20 +575,45 @@ def doctor_dashboard(request):
         max_id=Max("id")
     ).values_list("max_id", flat=True)
 
-    accepted_requests = DoctorRequest.objects.filter(id__in=latest_ids)
+    accepted_requests = list(
+        DoctorRequest.objects.filter(id__in=latest_ids).select_related("patient")
+    )
 
-    # IMPORTANT: get ALL VISITS by this doctor
-    visits = PatientVisit.objects.filter(doctor=doctor).order_by('-created_at')
+    # First page of visits; the rest is fetched from doctor_visits_json
+    visits_page = pagination.keyset_page(doctor_visits(doctor), '-created_at')
 
     return render(request, "doctor_dashboard.html", {
         "doctor": doctor,
         "pending_requests": pending_requests,
         "accepted_requests": accepted_requests,
-        "visits": visits  # → Used in Updated Records table
+        "visits": visits_page.items,  # → Used in Updated Records table
+        "visits_page": visits_page,
+    })
+
+
+def doctor_visits_json(request):
+    """Next page of the Updated Records table (``?after=<cursor>``) as JSON."""
+    user_id = request.session.get("user_id")
+    if request.session.get("user_role") != "doctor" or not user_id:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    page = pagination.keyset_page(
+        doctor_visits(user_id), '-created_at', request.GET.get('after')
+    )
+    return JsonResponse({
+        "results": [{
+            "id": v.id,
+            "patient": v.patient.full_name,
+            "visit_date": v.visit_date.strftime("%b %d, %Y"),
+            "diagnosis": v.diagnosis or "N/A",
+            "qr_code": v.qr_code.url if v.qr_code else None,
+            "blockchain_hash": v.blockchain_hash or "-",
+            "sent_to_patient": v.sent_to_patient,
+            "send_url": reverse("send_update_to_patient", args=[v.id]),
+        } for v in page.items],
+        "next": page.next_cursor,
     })
 
-from qrcode.constants import ERROR_CORRECT_L
-from django.core.files import File
 from .models import PatientVisit, PatientHistory
 
 def save_patient_record(request):
@@ -650,25 +636,9 @@ def save_patient_record(request):
     prescription_image = request.FILES.get("prescription_image")
 
     # --------------------------------------------------
-    # 1️⃣ CREATE CURRENT VISIT
+    # 1️⃣ SAVE SNAPSHOT TO PATIENT HISTORY (CHAIN LINK)
     # --------------------------------------------------
-    visit = PatientVisit.objects.create(
-        patient=patient,
-        doctor=doctor,
-        visit_date=visit_date,
-        follow_up_date=follow_up_date,
-        symptoms=symptoms,
-        diagnosis=diagnosis,
-        tests=tests,
-        prescription=prescription,
-        notes=notes,
-        prescription_image=prescription_image
-    )
-
-    # --------------------------------------------------
-    # 2️⃣ SAVE SNAPSHOT TO PATIENT HISTORY
-    # --------------------------------------------------
-    PatientHistory.objects.create(
+    ledger.append_entry(patient, PatientHistory(
         patient=patient,
         full_name=patient.full_name,
         age=patient.age,
@@ -678,172 +648,37 @@ def save_patient_record(request):
         address=patient.address,
         disease=patient.disease,
         doctor_assigned=doctor.full_name,
-        blockchain_hash=patient.blockchain_hash,
         qr_code=patient.qr_code
-    )
+    ))
 
     # --------------------------------------------------
-    # 3️⃣ FETCH PREVIOUS VISITS (EXCLUDING CURRENT)
+    # 2️⃣ CREATE CURRENT VISIT (NEXT CHAIN LINK)
     # --------------------------------------------------
-    previous_visits = list(
-        patient.visits.exclude(id=visit.id).order_by("-created_at")
+    visit = PatientVisit(
+        patient=patient,
+        doctor=doctor,
+        visit_date=visit_date,
+        follow_up_date=follow_up_date,
+        symptoms=symptoms,
+        diagnosis=diagnosis,
+        tests=tests,
+        prescription=prescription,
+        notes=notes,
+        prescription_image=prescription_image
     )
-
-    # --------------------------------------------------
-    # 4️⃣ BUILD last_two_history (ONLY PREVIOUS DATA)
-    # --------------------------------------------------
-    last_two_history = []
-
-    for v in previous_visits[:2]:  # max 2 previous records
-        last_two_history.append({
-            "type": "doctor_update",
-            "visit_date": str(v.visit_date),
-            "follow_up_date": str(v.follow_up_date),
-            "symptoms": v.symptoms,
-            "diagnosis": v.diagnosis,
-            "tests": v.tests,
-            "prescription": v.prescription,
-            "notes": v.notes,
-            "doctor": v.doctor.full_name,
-            "created_at": str(v.created_at)
-        })
-
-    # --------------------------------------------------
-    # 5️⃣ LATEST RECORD (CURRENT VISIT ONLY)
-    # --------------------------------------------------
-    latest_record = {
-        "visit_date": str(visit.visit_date),
-        "follow_up_date": str(visit.follow_up_date),
-        "symptoms": visit.symptoms,
-        "diagnosis": visit.diagnosis,
-        "tests": visit.tests,
-        "prescription": visit.prescription,
-        "notes": visit.notes,
-        "doctor": doctor.full_name,
-        "created_at": str(visit.created_at)
-    }
-
     # --------------------------------------------------
-    # 6️⃣ BUILD FULL HISTORY FOR BLOCKCHAIN HASH
+    # 3️⃣ QUEUE HASH FOR BLOCKCHAIN (anchor_worker sends it),
+    #    in the transaction that appends the visit
     # --------------------------------------------------
-    full_history = []
-
-    # Patient history snapshots
-    for h in patient.history_records.all().order_by("updated_at"):
-        full_history.append({
-            "full_name": h.full_name,
-            "age": h.age,
-            "gender": h.gender,
-            "email": h.email,
-            "phone": h.phone,
-            "address": h.address,
-            "disease": h.disease,
-            "doctor_assigned": h.doctor_assigned,
-            "updated_at": str(h.updated_at)
-        })
-
-    # All visits including current
-    for v in patient.visits.all().order_by("created_at"):
-        full_history.append({
-            "visit_date": str(v.visit_date),
-            "follow_up_date": str(v.follow_up_date),
-            "symptoms": v.symptoms,
-            "diagnosis": v.diagnosis,
-            "tests": v.tests,
-            "prescription": v.prescription,
-            "notes": v.notes,
-            "doctor": v.doctor.full_name,
-            "created_at": str(v.created_at)
-        })
-
-    # Final patient snapshot
-    full_history.append({
-        "patient_id": patient.id,
-        "full_name": patient.full_name,
-        "age": patient.age,
-        "gender": patient.gender,
-        "email": patient.email,
-        "phone": patient.phone,
-        "address": patient.address,
-        "disease": patient.disease,
-        "doctor_assigned": patient.doctor_assigned
-    })
-
-    chain_json = json.dumps(full_history, sort_keys=True)
-    new_hash = hashlib.sha256(chain_json.encode()).hexdigest()
-
-    patient.blockchain_hash = new_hash
+    new_hash = ledger.append_entry(patient, visit, anchor=True)  # also clears tx_hash and qr_code
 
     # --------------------------------------------------
-    # 7️⃣ WRITE HASH TO BLOCKCHAIN
+    # 4️⃣ RENDER QR IN THE BACKGROUND (signed pointer to the new head)
     # --------------------------------------------------
-    try:
-        nonce = web3.eth.get_transaction_count(account_address)
-        txn = contract.functions.addRecord(patient.id, new_hash).build_transaction({
-            "from": account_address,
-            "nonce": nonce,
-            "gas": 2000000,
-            "gasPrice": web3.to_wei("50", "gwei")
-        })
-
-        signed = web3.eth.account.sign_transaction(txn, private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed.raw_transaction).hex()
-    except Exception as e:
-        tx_hash = f"Error: {str(e)}"
-
-    patient.tx_hash = tx_hash
-
-    # --------------------------------------------------
-    # 8️⃣ BUILD QR DATA (NO DUPLICATION GUARANTEED)
-    # --------------------------------------------------
-    qr_data = {
-        "full_name": patient.full_name,
-        "age": patient.age,
-        "gender": patient.gender,
-        "email": patient.email,
-        "phone": patient.phone,
-        "address": patient.address,
-        "disease": patient.disease,
-        "doctor_assigned": doctor.full_name,
-
-        "blockchain_hash": new_hash,
-        "blockchain_tx_hash": tx_hash,
-
-        "latest_record": latest_record,
-        "last_two_history": last_two_history
-    }
-
-    qr_json = json.dumps(qr_data, indent=2)
-
-    # --------------------------------------------------
-    # 9️⃣ GENERATE QR CODE
-    # --------------------------------------------------
-    qr = qrcode.QRCode(
-        version=None,
-        error_correction=ERROR_CORRECT_L,
-        box_size=8,
-        border=1,
-    )
-    qr.add_data(qr_json)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    qr_filename = f"patient_{patient.id}_updated.png"
-    qr_folder = os.path.join(settings.MEDIA_ROOT, "qrcodes")
-    os.makedirs(qr_folder, exist_ok=True)
-    qr_path = os.path.join(qr_folder, qr_filename)
-    img.save(qr_path)
-
-    # Save QR to visit
-    with open(qr_path, "rb") as f:
-        visit.qr_code.save(qr_filename, File(f), save=True)
-    visit.blockchain_hash = new_hash
-    visit.save()
-
-    # Save QR to patient
-    with open(qr_path, "rb") as f:
-        patient.qr_code.save(qr_filename, File(f), save=True)
-    patient.save()
+    qr_images.schedule(qr_envelope.encode(patient.id, new_hash), [
+        PatientVisit.objects.filter(pk=visit.pk),
+        Patient.objects.filter(pk=patient.pk, blockchain_hash=new_hash),
+    ])
 
     messages.success(request, "✔ Patient record saved and QR updated!")
     return redirect("doctor_dashboard")
@@ -852,9 +687,6 @@ def save_patient_record(request):
 
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
-from django.conf import settings
-from django.core.files import File
-import os
 
 from .models import Patient, Doctor, PatientVisit, PatientNotification
 
@@ -878,37 +710,27 @@ def send_update_to_patient(request, visit_id):
     patient = visit.patient
 
     try:
-        # Copy QR Code to patient's QR field
+        # Point the patient at the visit's QR blob (shared, not copied)
+        changed = []
         if visit.qr_code:
-            ext = os.path.splitext(visit.qr_code.name)[1]
-            qr_filename = f"patient_{patient.id}_latest_qr{ext}"
+            patient.qr_code = visit.qr_code.name
+            changed.append("qr_code")
 
-            qr_folder = os.path.join(settings.MEDIA_ROOT, "qrcodes")
-            os.makedirs(qr_folder, exist_ok=True)
-
-            dest_path = os.path.join(qr_folder, qr_filename)
-
-            # Copy QR image to new location
-            with visit.qr_code.open("rb") as src, open(dest_path, "wb") as dst:
-                dst.write(src.read())
-
-            # Save to patient's QR field
-            with open(dest_path, "rb") as f:
-                patient.qr_code.save(qr_filename, File(f), save=False)
-
-        # Copy blockchain hash + tx hash
-        if visit.blockchain_hash:
-            patient.blockchain_hash = visit.blockchain_hash
+        # The chain head already moved when the visit was saved; copying
+        # visit.blockchain_hash back would rewind it past newer entries,
+        # so only the fields set here are written.
 
         # If you store tx_hash in visit, copy it
         if hasattr(visit, "tx_hash") and visit.tx_hash:
             patient.tx_hash = visit.tx_hash
+            changed.append("tx_hash")
 
-        patient.save()
+        if changed:
+            patient.save(update_fields=changed)
 
         # Mark visit as sent
         visit.sent_to_patient = True
-        visit.save()
+        visit.save(update_fields=["sent_to_patient"])
 
         # Create notification for patient
         PatientNotification.objects.create(
@@ -948,6 +770,126 @@ def verify_hash_page(request):
 
     return render(request, "verify_hash.html")
 
+
+def _hash_from_payload(payload):
+    """Record hash carried by scanned QR text (signed envelope or legacy JSON) or a bare hash."""
+    payload = (payload or "").strip()
+    if qr_envelope.is_envelope(payload):
+        return qr_envelope.decode(payload).head_hash
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return payload.lower().removeprefix("0x")
+    if isinstance(data, dict):
+        value = data.get("blockchain_hash") or data.get("final_blockchain_hash") or ""
+        return value.lower().removeprefix("0x")
+    return ""
+
+
+async def _record_summary(patient_id):
+    """Patient details + latest visits for a scanned QR (the QR itself holds none)."""
+    patient = await Patient.objects.aget(pk=patient_id)
+    visits = [v async for v in patient.visits.select_related("doctor").order_by("-created_at")[:3]]
+    return {
+        "id": patient.id,
+        "full_name": patient.full_name,
+        "age": patient.age,
+        "gender": patient.gender,
+        "email": patient.email,
+        "phone": patient.phone,
+        "address": patient.address,
+        "disease": patient.disease,
+        "doctor_assigned": patient.doctor_assigned,
+        "blockchain_hash": patient.blockchain_hash,
+        "tx_hash": patient.tx_hash,
+        "visits": [{
+            "visit_date": v.visit_date,
+            "follow_up_date": v.follow_up_date,
+            "symptoms": v.symptoms,
+            "diagnosis": v.diagnosis,
+            "tests": v.tests,
+            "prescription": v.prescription,
+            "notes": v.notes,
+            "doctor": v.doctor.full_name,
+            "blockchain_hash": v.blockchain_hash,
+        } for v in visits],
+    }
+
+
+async def _anchor_timestamp(entry):
+    """``(via, block timestamp or None)`` for one chain entry: Merkle batch root, else addRecord."""
+    if entry.merkle_root and entry.merkle_proof:
+        if not merkle.verify(entry.blockchain_hash, entry.merkle_proof, entry.merkle_root):
+            return "merkle_root", None
+        return "merkle_root", await chain_reader.aroot_timestamp(entry.merkle_root)
+    return "record", await chain_reader.arecord_timestamp(entry.patient_id, entry.blockchain_hash)
+
+
+async def verify_hash_api(request):
+    """
+    Check a hash (``?hash=``) or scanned QR text (``payload``) against the
+    local chain and the PatientRecords contract; answers JSON. Async: the
+    chain reads go through AsyncWeb3, so waiting on the node holds no thread.
+    """
+    if await request.session.aget("user_role") != "doctor":
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    params = request.POST if request.method == "POST" else request.GET
+    try:
+        hash_value = _hash_from_payload(params.get("hash") or params.get("payload"))
+        # A scanned QR is checked even when an explicit hash is given too
+        envelope = qr_envelope.decode(params["payload"]) if qr_envelope.is_envelope(params.get("payload")) else None
+    except qr_envelope.InvalidEnvelope as e:
+        return JsonResponse({"error": f"Invalid QR code: {e}"}, status=400)
+    if not hash_value:
+        return JsonResponse({"error": "Provide a hash or a QR payload."}, status=400)
+
+    # 1️⃣ Local chain: which entry is this, and is its content unchanged?
+    entry = await ledger.afind_entry(hash_value)
+    result = {
+        "hash": hash_value,
+        "valid": False,
+        "local": {"found": entry is not None},
+        "onchain": {"anchored": None, "timestamp": None, "via": None, "anchored_by": None, "error": None},
+    }
+    if entry is None:
+        return JsonResponse(result, status=404)
+
+    result["local"].update({
+        "patient_id": entry.patient_id,
+        "entry": entry._meta.model_name,
+        "intact": ledger.entry_intact(entry),
+        "is_head": await Patient.objects.filter(pk=entry.patient_id, blockchain_hash=hash_value).aexists(),
+    })
+
+    # 2️⃣ On-chain: Merkle batch root, else the patient's addRecord list (cached)
+    onchain = result["onchain"]
+    try:
+        onchain["via"], onchain["timestamp"] = await _anchor_timestamp(entry)
+        if onchain["timestamp"] is None and result["local"]["intact"] is not False:
+            # Not anchored itself (e.g. the history snapshot a doctor's save
+            # writes before the anchored visit): a later anchored link commits
+            # to it, provided every link in between is intact
+            for later in await ledger.asuccessors(entry.patient_id, hash_value):
+                if not ledger.entry_intact(later):
+                    break
+                via, timestamp = await _anchor_timestamp(later)
+                if timestamp is not None:
+                    onchain.update(via=via, timestamp=timestamp, anchored_by=later.blockchain_hash)
+                    break
+        onchain["anchored"] = onchain["timestamp"] is not None
+    except Exception as e:
+        onchain["error"] = str(e)
+
+    result["valid"] = bool(onchain["anchored"]) and result["local"]["intact"] is not False
+
+    # 3️⃣ Signed QR: the full record is served from here, not from the code
+    if envelope is not None:
+        if envelope.patient_id != entry.patient_id:
+            return JsonResponse({"error": "Invalid QR code: patient mismatch"}, status=400)
+        result["patient"] = await _record_summary(entry.patient_id)
+    return JsonResponse(result)
+
 from .models import DoctorRequest, Patient
 
 def accept_request(request, request_id):
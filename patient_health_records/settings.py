@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.instrumentation.InstrumentationMiddleware',  # outermost: times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +80,30 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # atomic() takes the write lock at BEGIN: a read-then-write
+            # transaction can't fail on the lock upgrade (see app/sqlite.py)
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # A connection per request, as ASGI (asgi.py, which the patient event
+        # stream needs) requires. Under WSGI set DB_CONN_MAX_AGE=60 to keep
+        # connections and their PRAGMA setup across requests.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Applied to every new SQLite connection by app/sqlite.py. journal_mode is
+# only changed when it differs; WAL persists in db.sqlite3 (see app/sqlite.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',      # readers and the writer don't block each other
+    'synchronous': 'NORMAL',    # fsync at WAL checkpoints, not every commit
+    'busy_timeout': 5000,       # ms to wait for the write lock before "database is locked"
+    'cache_size': -20000,       # 20 MiB page cache per connection
+    'mmap_size': 134217728,     # 128 MiB memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,8 +150,97 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
 
-import os
-
 # Media files
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Blockchain node + contract (see app/blockchain.py — connected lazily)
+BLOCKCHAIN_RPC_URL = "http://127.0.0.1:7545"  # Ganache
+BLOCKCHAIN_ACCOUNT_ADDRESS = "0x4A42ee9cC198a4aeCbc4bcF22c30dF430Af1F493"  # first Ganache account
+BLOCKCHAIN_PRIVATE_KEY = "0xe541b0428279425265c8dcfb3e41cda7f3145b2eacaba33a975bae8a6932534b"  # ⚠️ Replace this safely!
+BLOCKCHAIN_CONTRACT_ADDRESS = "0x8b00c6e241B44C99Eb3b074E7121aBfB19B85AB8"
+BLOCKCHAIN_RPC_TIMEOUT = 10    # seconds per RPC call
+BLOCKCHAIN_HEALTH_TTL = 30     # seconds a health() result is reused
+BLOCKCHAIN_POOL_SIZE = 10      # keep-alive HTTP connections to the node
+
+# Blockchain anchoring (see app/anchoring.py)
+# "single": one addRecord transaction per record hash
+# "batch": one addMerkleRoot transaction per window of hashes
+ANCHOR_MODE = "single"
+ANCHOR_BATCH_SIZE = 256        # anchor as soon as this many hashes are queued...
+ANCHOR_BATCH_WINDOW = 30       # ...or once the oldest one has waited this many seconds
+
+# QR code rendering (see app/qr_images.py)
+QR_EXECUTOR = "thread"   # "thread" | "process" | "sync"
+QR_WORKERS = 2
+
+# Password hashing cost (see app/hashers.py). PBKDF2-SHA256 iterations per
+# profile; existing hashes are upgraded on the next successful login.
+PASSWORD_HASH_PROFILES = {
+    "fast": 100_000,       # development / test machines
+    "default": 1_000_000,  # Django's own default
+    "strong": 2_000_000,
+}
+PASSWORD_HASH_PROFILE = "default"
+PASSWORD_HASHERS = [
+    "app.hashers.ProfiledPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# Login throttling (see app/ratelimit.py): failed attempts per email and per
+# client IP before log_in refuses to check passwords for the window
+LOGIN_RATE_LIMIT = 10
+LOGIN_RATE_WINDOW = 300  # seconds
+
+# Cached on-chain reads (see app/chain_reader.py)
+BLOCKCHAIN_RECORDS_TTL = 3600   # cached record arrays, marked stale early on RecordAdded
+BLOCKCHAIN_RECORDS_PAGE = 100   # records per getRecordsRange call
+BLOCKCHAIN_WATCH_INTERVAL = 2   # seconds between RecordAdded log scans
+
+# Chain event indexer (see app/indexer.py, manage.py index_chain)
+CHAIN_INDEXER_BATCH_BLOCKS = 1000  # blocks per eth_getLogs request
+CHAIN_INDEXER_CONFIRMATIONS = 0    # Ganache never reorgs; raise on a real network
+
+# Bulk patient import (see app/bulk_import.py, manage.py import_patients)
+BULK_IMPORT_CHUNK_SIZE = 500  # rows per transaction / per addMerkleRoot
+
+# Request instrumentation (see app/instrumentation.py): Server-Timing headers
+# on every response, Prometheus metrics at /metrics/. Set a token to require
+# "Authorization: Bearer <token>" from the scraper.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Caches. The patient dashboard snapshot (see app/dashboard_cache.py) gets its
+# own cache: process-local memory by default, or files under BASE_DIR/.cache
+# (DASHBOARD_CACHE_BACKEND=file) so several worker processes share it.
+DASHBOARD_CACHE_BACKEND = os.environ.get("DASHBOARD_CACHE_BACKEND", "locmem")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "dashboard": (
+        {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+         "LOCATION": BASE_DIR / ".cache" / "dashboard"}
+        if DASHBOARD_CACHE_BACKEND == "file" else
+        {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "patient-dashboard"}
+    ),
+}
+PATIENT_DASHBOARD_CACHE = "dashboard"
+# Admin dashboard counters (app/stats.py) share it for the same reason
+STATS_CACHE = "dashboard"
+PATIENT_DASHBOARD_TTL = 600  # seconds; a safety net behind write invalidation
+
+# Live push to patient dashboards (see app/push.py). Served by the async
+# patient_events view: run the site under ASGI (asgi.py, e.g.
+# "uvicorn patient_health_records.asgi:application") for long-lived streams.
+# Under WSGI (runserver) each stream holds a worker thread, so it ends after
+# PUSH_WSGI_STREAM_SECONDS and the browser reconnects. LocalBroker only
+# reaches clients of the same process; swap in a shared broker for several.
+PUSH_BROKER = "app.push.LocalBroker"
+PUSH_KEEPALIVE_SECONDS = 15
+PUSH_QUEUE_SIZE = 100
+PUSH_WSGI_STREAM_SECONDS = 60
+
+# Notification retention (see app/notifications.py, manage.py purge_notifications)
+NOTIFICATION_RETENTION_DAYS = 90  # read notifications older than this are purged
+NOTIFICATION_PURGE_BATCH = 1000   # rows per delete transaction